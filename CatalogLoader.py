@@ -0,0 +1,266 @@
+#!/usr/bin/env python
+# -*- coding: latin-1 -*-
+
+#
+# CatalogLoader.py
+#
+# Military Analyst incremental loader for DTED and RPF catalogs
+#
+# LoadMaCatalog walks a whole folder tree and loads every file, so a
+# reload of a theater rescans and reloads everything. This loader keeps a
+# manifest of each folder loaded into a catalog (size, modification time
+# and an md5 of the contents of every file) beside the geodatabase. On a
+# reload the folder is scanned by a pool of threads. A file seen for the
+# first time or whose size and time are unchanged is not read at all, a
+# file that was touched is hashed and is only reloaded if its contents
+# changed. ArcGIS sidecar files (statistics, pyramids) are left out of the
+# manifest, ArcGIS writes them itself. Only the directories
+# holding new, changed or removed files have their catalog rows deleted and
+# are loaded again with LoadMaCatalog, so the MA fields (DTED_TYPE,
+# PRODUCT, SERIES, ...) are filled exactly as before.
+#
+# Catalog rows are matched to files by FULL_NAME, which holds the path of
+# the file each raster was loaded from.
+#
+
+import os, sys, time
+import threading, Queue
+try:
+    import hashlib
+    NewHash = hashlib.md5
+except ImportError:
+    import md5
+    NewHash = md5.new
+
+debug = False
+
+# threads scanning the folder
+DefaultThreads = 8
+
+# bytes read at a time while hashing a file
+HashChunkBytes = 1048576
+
+# files ArcGIS writes beside the rasters it reads
+SidecarSuffixes = [".aux.xml",".aux",".rrd",".ovr"]
+
+ManifestSuffix = "_manifest.txt"
+ManifestHeader = "# MA catalog manifest: path, size, mtime, md5"
+
+# error messages
+msgNoFolder = "Input folder %s does not exist."
+msgCouldNotScan = "Could not read %s files while scanning %s, first error: \n %s"
+msgCouldNotDeleteRows = "Could not remove changed rasters from catalog %s: \n %s"
+msgCouldNotLoad = "Could not load %s into catalog %s: \n %s"
+msgScanned = "Scanned %s files in %s seconds: %s new, %s changed, %s removed."
+msgReloading = "Reloading %s folders into the catalog."
+msgUpToDate = "Catalog is up to date with the folder, nothing to load."
+
+def ManifestName(catalog,folder):
+    ## manifest of one folder loaded into a catalog, beside the geodatabase:
+    ## <gdb>_<catalog>_<md5 of the folder path>_manifest.txt
+    geodatabase = os.path.dirname(str(catalog))
+    gdb_name = os.path.splitext(os.path.basename(geodatabase))[0]
+    folder_id = NewHash(FileKey(folder)).hexdigest()[:8]
+    return os.path.join(os.path.dirname(geodatabase),gdb_name + "_" + os.path.basename(str(catalog)) + "_" + folder_id + ManifestSuffix)
+
+def FileKey(path):
+    return os.path.normcase(os.path.normpath(path))
+
+def FileHash(path):
+    ## md5 of the whole file, so an edit to the data records is seen too
+    file_hash = NewHash()
+    f = open(path,"rb")
+    chunk = f.read(HashChunkBytes)
+    while chunk:
+        file_hash.update(chunk)
+        chunk = f.read(HashChunkBytes)
+    f.close()
+    return file_hash.hexdigest()
+
+def ReadManifest(manifest_file):
+    ## dictionary of file key: [path,size,mtime,hash], empty if there is no manifest
+    entries = {}
+    if not (os.path.exists(manifest_file)):
+        return entries
+    manifest = open(manifest_file,"r")
+    for line in manifest.readlines():
+        if (line.startswith("#")):
+            continue
+        parts = line.rstrip("\r\n").split("\t")
+        if (len(parts) == 4):
+            entries[FileKey(parts[0])] = [parts[0],int(parts[1]),int(parts[2]),parts[3]]
+    manifest.close()
+    return entries
+
+def WriteManifest(manifest_file,entries):
+    keys = entries.keys()
+    keys.sort()
+    manifest = open(manifest_file,"w")
+    manifest.write(ManifestHeader + "\n")
+    for key in keys:
+        path,size,mtime,header_hash = entries[key]
+        manifest.write("%s\t%s\t%s\t%s\n" % (path,str(size),str(mtime),header_hash))
+    manifest.close()
+
+def ScanFile(path,previous):
+    ## manifest entry of a file, the file is only read when size or time changed
+    ## against its previous entry. A new file is loaded anyway, so it gets no hash.
+    stat = os.stat(path)
+    size = int(stat.st_size)
+    mtime = int(stat.st_mtime)
+    old = previous.get(FileKey(path))
+    if (old == None):
+        return [path,size,mtime,""]
+    if (old[1] == size and old[2] == mtime):
+        return old
+    return [path,size,mtime,FileHash(path)]
+
+def IsSidecar(path):
+    name = os.path.basename(path).lower()
+    for suffix in SidecarSuffixes:
+        if (name.endswith(suffix)):
+            return True
+    return False
+
+def ListFiles(folder,exclude=[]):
+    ## every file under a folder but the ArcGIS sidecar files
+    exclude = [FileKey(path) for path in exclude]
+    paths = []
+    for root,dirs,files in os.walk(folder):
+        for name in files:
+            path = os.path.join(root,name)
+            if not (FileKey(path) in exclude or IsSidecar(path)):
+                paths.append(path)
+    return paths
+
+def ScanFolder(folder,previous={},threads=DefaultThreads,exclude=[]):
+    ## scans every file under a folder with a pool of threads,
+    ## returns a dictionary of file key: [path,size,mtime,hash]
+    if not (os.path.isdir(folder)):
+        raise Exception, msgNoFolder % (str(folder))
+    work = Queue.Queue()
+    for path in ListFiles(folder,exclude):
+        work.put(path)
+    entries = {}
+    errors = []
+    def worker():
+        while True:
+            try:
+                path = work.get_nowait()
+            except Queue.Empty:
+                return
+            try:
+                entries[FileKey(path)] = ScanFile(path,previous)
+            except Exception, ErrorMessage:
+                errors.append(path + ": " + str(ErrorMessage))
+    pool = [threading.Thread(target=worker) for i in range(max(1,int(threads)))]
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    if (len(errors) > 0):
+        raise Exception, msgCouldNotScan % (str(len(errors)),str(folder),errors[0])
+    return entries
+
+def CompareManifests(previous,current):
+    ## [new,changed,removed] paths; a file is changed when its size or contents differ
+    new = []
+    changed = []
+    removed = []
+    for key in current.keys():
+        if not (previous.has_key(key)):
+            new.append(current[key][0])
+        elif (previous[key][1] != current[key][1] or previous[key][3] != current[key][3]):
+            changed.append(current[key][0])
+    for key in previous.keys():
+        if not (current.has_key(key)):
+            removed.append(previous[key][0])
+    return [new,changed,removed]
+
+def ReloadFolders(paths):
+    ## the directories of the paths, without those inside another one
+    ## (LoadMaCatalog loads a folder with its subfolders)
+    folders = {}
+    for path in paths:
+        folders[FileKey(os.path.dirname(path))] = os.path.dirname(path)
+    keys = folders.keys()
+    keys.sort()
+    reload = []
+    for key in keys:
+        inside = False
+        for outer in reload:
+            if (key.startswith(FileKey(outer) + os.sep)):
+                inside = True
+                break
+        if (inside == False):
+            reload.append(folders[key])
+    return reload
+
+def DeleteCatalogRows(gp,catalog,folders):
+    ## deletes the catalog rasters loaded from files under the folders, returns the count
+    prefixes = [FileKey(folder) + os.sep for folder in folders]
+    deleted = 0
+    try:
+        rows = gp.UpdateCursor(catalog)
+        row = rows.next()
+        while row:
+            full_name = FileKey(str(row.GetValue("FULL_NAME")))
+            for prefix in prefixes:
+                if (full_name.startswith(prefix)):
+                    rows.DeleteRow(row)
+                    deleted += 1
+                    break
+            row = rows.next()
+        del row, rows
+    except:
+        raise Exception, msgCouldNotDeleteRows % (str(catalog),gp.GetMessages())
+    return deleted
+
+def LoadCatalog(gp,catalog,folder,manifest_file=None,threads=DefaultThreads,bFullLoad=False):
+    ## loads the new and changed files of a folder into an existing MA catalog and
+    ## removes the rasters of deleted files. bFullLoad ignores the previous manifest
+    ## (a new catalog). Returns [new,changed,removed,folders reloaded].
+    if (manifest_file == None):
+        manifest_file = ManifestName(catalog,folder)
+    previous = {}
+    if (bFullLoad == False):
+        previous = ReadManifest(manifest_file)
+    # files of other folders in a shared manifest are not part of this load
+    prefix = FileKey(folder) + os.sep
+    others = {}
+    for key in previous.keys():
+        if not (key.startswith(prefix)):
+            others[key] = previous[key]
+            del previous[key]
+
+    start = time.time()
+    current = ScanFolder(folder,previous,threads,[manifest_file])
+    new,changed,removed = CompareManifests(previous,current)
+    msg = msgScanned % (str(len(current)),"%.1f" % (time.time() - start),str(len(new)),str(len(changed)),str(len(removed)))
+    gp.AddMessage(msg)
+    print msg
+
+    if (len(previous) == 0):
+        # first load of the folder, one pass of LoadMaCatalog
+        reload = [folder]
+    else:
+        reload = ReloadFolders(new + changed + removed)
+    if (len(reload) == 0):
+        gp.AddMessage(msgUpToDate)
+        print msgUpToDate
+    else:
+        gp.AddMessage(msgReloading % (str(len(reload))))
+        print msgReloading % (str(len(reload)))
+        DeleteCatalogRows(gp,catalog,reload)
+        for reload_folder in reload:
+            # a folder whose files were all removed is only cleared
+            if (os.path.isdir(reload_folder)):
+                try:
+                    gp.LoadMaCatalog_ma(catalog,reload_folder)
+                except:
+                    raise Exception, msgCouldNotLoad % (str(reload_folder),str(catalog),gp.GetMessages())
+
+    # the manifest only records a folder once it is loaded
+    current.update(others)
+    WriteManifest(manifest_file,current)
+    return [len(new),len(changed),len(removed),len(reload)]
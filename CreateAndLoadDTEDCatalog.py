@@ -7,7 +7,7 @@
 
 # Import system modules
 import sys, string, os
-import arcgisscripting, MAScriptUtils
+import arcgisscripting, MAScriptUtils, CatalogLoader
 
 gp = arcgisscripting.create(9.3)
 
@@ -18,17 +18,24 @@ Out_Catalog_Name = Input_Geodatabase + os.sep + Catalog_Name
 gp.SetParameter(3,Out_Catalog_Name)
 
 
-try:
-    gp.CreateDTEDCatalog_ma(Input_Geodatabase,Catalog_Name)
-except:
-    messages = gp.GetMessages()
-    gp.AddError("Create DTED catalog failed: \n %s" % (messages))
+# an existing catalog is reloaded with only the new and changed tiles
+bNewCatalog = (gp.Exists(Out_Catalog_Name) == False)
+if (bNewCatalog == True):
+    try:
+        gp.CreateDTEDCatalog_ma(Input_Geodatabase,Catalog_Name)
+    except:
+        messages = gp.GetMessages()
+        gp.AddError("Create DTED catalog failed: \n %s" % (messages))
 
 try:
-    gp.LoadMaCatalog(Out_Catalog_Name,Input_Folder)
-except:
-    messages = gp.GetMessages()
-    gp.AddError("Load DTED catalog failed: \n %s" % (messages))
+    CatalogLoader.LoadCatalog(gp,Out_Catalog_Name,Input_Folder,bFullLoad=bNewCatalog)
+except Exception, ErrorMessage:
+    gp.AddError("Load DTED catalog failed: \n %s" % (str(ErrorMessage)))
     
+# footprint index for extent queries (MAScriptUtils.MosaicAndClip)
+# catalogs without one fall back to a full scan
+if (MAScriptUtils.BuildCatalogIndex(gp,Out_Catalog_Name) == None):
+    gp.AddWarning("Could not index DTED catalog, extent queries will scan the whole catalog.")
+
 gp.AddMessage("Completed")
 
@@ -7,7 +7,7 @@
 
 # Import system modules
 import sys, string, os
-import arcgisscripting, MAScriptUtils
+import arcgisscripting, MAScriptUtils, CatalogLoader
 
 gp = arcgisscripting.create(9.3)
 
@@ -18,16 +18,18 @@ Out_Catalog_Name = Input_Geodatabase + os.sep + Catalog_Name
 gp.SetParameter(3,Out_Catalog_Name)
 
 
-try:
-    gp.CreateRPFCatalog_ma(Input_Geodatabase,Catalog_Name)
-except:
-    messages = gp.GetMessages()
-    gp.AddError("Create RPF catalog failed: \n %s" % (messages))
+# an existing catalog is reloaded with only the new and changed frames
+bNewCatalog = (gp.Exists(Out_Catalog_Name) == False)
+if (bNewCatalog == True):
+    try:
+        gp.CreateRPFCatalog_ma(Input_Geodatabase,Catalog_Name)
+    except:
+        messages = gp.GetMessages()
+        gp.AddError("Create RPF catalog failed: \n %s" % (messages))
 
 try:
-    gp.LoadMaCatalog(Out_Catalog_Name,Input_Folder)
-except:
-    messages = gp.GetMessages()
-    gp.AddError("Load RPF catalog failed: \n %s" % (messages))
+    CatalogLoader.LoadCatalog(gp,Out_Catalog_Name,Input_Folder,bFullLoad=bNewCatalog)
+except Exception, ErrorMessage:
+    gp.AddError("Load RPF catalog failed: \n %s" % (str(ErrorMessage)))
     
 gp.AddMessage("Completed")
\ No newline at end of file
@@ -0,0 +1,202 @@
+#!/usr/bin/env python
+# -*- coding: latin-1 -*-
+
+#
+# DTED.py
+#
+# Military Analyst reader for DTED level 0, 1 and 2 files (.dt0/.dt1/.dt2)
+#
+# A DTED file is a User Header Label (UHL), Data Set Identification (DSI)
+# and Accuracy Description (ACC) header followed by one data record per
+# line of longitude, west to east. Each record holds the posts of the line
+# south to north as big-endian signed magnitude 16 bit integers, between
+# an 8 byte record header and a 4 byte checksum.
+#
+# The records are memory-mapped with a structured dtype so the posts are a
+# zero-copy view of the file. Signed magnitude is decoded with a vectorized
+# pass over only the window that is read, so opening a tile costs the
+# header and nothing is read until a window is asked for.
+#
+# Posts sit on the corners of the post spacing; the tile is treated as
+# cells centered on the posts, so it extends half a post past its origin.
+#
+
+import os, sys
+import numpy
+import Surface
+
+debug = False
+
+# header lengths in bytes
+UHLLength = 80
+DSILength = 648
+ACCLength = 2700
+HeaderLength = UHLLength + DSILength + ACCLength
+
+# first byte of every data record
+RecordSentinel = 0xAA
+
+# posts holding this value are void
+NoDataPost = -32767
+
+# file extensions by DTED level
+DTEDExtensions = [".dt0",".dt1",".dt2"]
+
+# error messages
+msgNoDTEDFile = "DTED file %s does not exist."
+msgBadDTEDHeader = "%s is not a DTED file, the User Header Label is missing."
+msgBadDTEDRecord = "DTED file %s has %s data records with a bad sentinel or checksum."
+msgNoDTEDFiles = "No DTED files in folder %s."
+
+def ParseDMS(text):
+    ## DDDMMSSH (hemisphere last) to decimal degrees, negative south and west
+    hemisphere = text.strip()[-1].upper()
+    digits = text.strip()[:-1]
+    value = float(digits[:-4]) + (float(digits[-4:-2]) / 60.0) + (float(digits[-2:]) / 3600.0)
+    if (hemisphere in ["S","W"]):
+        value = -value
+    return value
+
+def ReadUHL(dted_file):
+    ## reads the User Header Label into a dictionary: origin (south-west post)
+    ## longitude and latitude, post spacing in seconds, and the lines and posts
+    if not (os.path.exists(dted_file)):
+        raise Exception, msgNoDTEDFile % (str(dted_file))
+    dted = open(dted_file,"rb")
+    uhl = dted.read(UHLLength)
+    dted.close()
+    if (len(uhl) < UHLLength or uhl[:3] != "UHL"):
+        raise Exception, msgBadDTEDHeader % (str(dted_file))
+    header = {}
+    header["longitude"] = ParseDMS(uhl[4:12])
+    header["latitude"] = ParseDMS(uhl[12:20])
+    # spacing is in tenths of seconds
+    header["longitude_interval"] = float(uhl[20:24]) / 10.0
+    header["latitude_interval"] = float(uhl[24:28]) / 10.0
+    header["lines"] = int(uhl[47:51])
+    header["posts"] = int(uhl[51:55])
+    return header
+
+def DecodePosts(raw):
+    ## signed magnitude posts (any shape) to float64 elevations, NaN for voids
+    raw = numpy.asarray(raw).astype(numpy.int32)
+    values = numpy.where((raw & 0x8000) != 0,-(raw & 0x7FFF),raw).astype(numpy.float64)
+    values[values == NoDataPost] = numpy.nan
+    return values
+
+def DTEDLevel(dted_file):
+    ## DTED level of a file from its extension, None if it is not a DTED file
+    extension = os.path.splitext(dted_file)[1].lower()
+    if (extension in DTEDExtensions):
+        return DTEDExtensions.index(extension)
+    return None
+
+class DTEDFile:
+    #dted_file
+    def __init__(self,dted_file):
+        header = ReadUHL(dted_file)
+        self.FileName = dted_file
+        # the file stands in for a catalog object id in tile cache keys
+        self.ObjectID = dted_file
+        self.Level = DTEDLevel(dted_file)
+        # rows are posts along a line of longitude, columns are the lines
+        self.Rows = header["posts"]
+        self.Cols = header["lines"]
+        self.CellWidth = header["longitude_interval"] / 3600.0
+        self.CellHeight = header["latitude_interval"] / 3600.0
+        self.XMin = header["longitude"] - (self.CellWidth / 2.0)
+        self.YMax = header["latitude"] + ((self.Rows - 1) * self.CellHeight) + (self.CellHeight / 2.0)
+        self.Envelope = [self.XMin,self.YMax - (self.Rows * self.CellHeight),
+                         self.XMin + (self.Cols * self.CellWidth),self.YMax]
+        self.RecordType = numpy.dtype([("sentinel","u1"),("block","S3"),("longitude_count",">u2"),("latitude_count",">u2"),
+                                       ("posts",">u2",(self.Rows,)),("checksum",">i4")])
+        self.Records = numpy.memmap(dted_file,self.RecordType,"r",offset=HeaderLength,shape=(self.Cols,))
+        # zero-copy view of the raw posts as map rows, row 0 is the northern edge
+        self.Posts = self.Records["posts"].T[::-1]
+
+    def GetExtent (self):
+        ## Left, Bottom, Right, Top
+        return list(self.Envelope)
+
+    def IsOpen (self):
+        return (self.Records is not None)
+
+    def ReadBlock (self,row_min,row_max,col_min,col_max):
+        ## decodes rows row_min:row_max and columns col_min:col_max to float64, NaN for voids
+        return DecodePosts(self.Posts[row_min:row_max,col_min:col_max])
+
+    def GetSurface (self):
+        ## decodes the whole tile into an in-memory Surface
+        surface = Surface.Surface(self.ReadBlock(0,self.Rows,0,self.Cols).astype(numpy.float32),
+                                  self.XMin,self.YMax,self.CellWidth,self.CellHeight)
+        surface.Geographic = True
+        return surface
+
+    def VerifyRecords (self):
+        ## True for each data record with a good sentinel and checksum (the sum of
+        ## the bytes of the record before the checksum)
+        raw = numpy.memmap(self.FileName,numpy.uint8,"r",offset=HeaderLength,shape=(self.Cols,self.RecordType.itemsize))
+        sums = raw[:,:-4].sum(axis=1,dtype=numpy.int64)
+        good = (self.Records["sentinel"] == RecordSentinel) & (sums == self.Records["checksum"].astype(numpy.int64))
+        del raw
+        return numpy.asarray(good)
+
+    def Release (self):
+        self.Posts = None
+        self.Records = None
+
+
+def FindDTEDFiles(folder):
+    ## all DTED files under a folder (the usual layout is <folder>\e010\n40.dt1)
+    dted_files = []
+    for root,dirs,files in os.walk(folder):
+        for name in files:
+            if (DTEDLevel(name) != None):
+                dted_files.append(os.path.join(root,name))
+    dted_files.sort()
+    return dted_files
+
+def IsDTEDFolder(gp,path):
+    ## True for a plain folder read as DTED files. An ArcInfo GRID is a folder
+    ## on disk too, so only what the geoprocessor describes as a Folder counts
+    try:
+        data_type = str(gp.Describe(path).DataType)
+    except:
+        # not something the geoprocessor knows, a folder of DTED files all the same
+        return (len(FindDTEDFiles(str(path))) > 0)
+    return (data_type == "Folder")
+
+def DTEDFolderTiles(folder,extent,level=None):
+    ## DTED files under a folder that overlap an extent [left,bottom,right,top],
+    ## of one level (the lowest level found when level is None)
+    dted_files = FindDTEDFiles(folder)
+    if (len(dted_files) == 0):
+        raise Exception, msgNoDTEDFiles % (str(folder))
+    if (level == None):
+        level = min([DTEDLevel(dted_file) for dted_file in dted_files])
+    tiles = []
+    for dted_file in dted_files:
+        if (DTEDLevel(dted_file) != level):
+            continue
+        header = ReadUHL(dted_file)
+        # posts and half a post around them
+        half_x = header["longitude_interval"] / 7200.0
+        half_y = header["latitude_interval"] / 7200.0
+        left = header["longitude"] - half_x
+        bottom = header["latitude"] - half_y
+        right = header["longitude"] + ((header["lines"] - 1) * header["longitude_interval"] / 3600.0) + half_x
+        top = header["latitude"] + ((header["posts"] - 1) * header["latitude_interval"] / 3600.0) + half_y
+        if (right > float(extent[0]) and left < float(extent[2]) and top > float(extent[1]) and bottom < float(extent[3])):
+            tiles.append(DTEDFile(dted_file))
+    return tiles
+
+def SurfaceFromDTED(dted_file,bVerify=False):
+    ## reads one DTED file into a Surface
+    dted = DTEDFile(dted_file)
+    if (bVerify == True):
+        bad = numpy.sum(~dted.VerifyRecords())
+        if (bad > 0):
+            raise Exception, msgBadDTEDRecord % (str(dted_file),str(bad))
+    surface = dted.GetSurface()
+    dted.Release()
+    return surface
@@ -0,0 +1,184 @@
+#!/usr/bin/env python
+# -*- coding: latin-1 -*-
+
+#
+# Horizon.py
+#
+# Military Analyst horizon index for fixed observation posts
+#
+# The surface is sampled along N azimuth rays from the observer out to
+# RADIUS2 and the running maximum of the sight line slope is kept for every
+# ray and sample distance. Once built (and saved), the visibility of any
+# target within RADIUS2 at any OFFSETB is a table lookup: the target is
+# seen if its sight line slope clears the horizon slope of its ray up to
+# its distance.
+#
+# The index holds one eye height: changing the observer position, SPOT or
+# OFFSETA needs a new index.
+#
+
+import os, sys, math
+import numpy
+import Surface, Visibility
+
+debug = False
+
+DefaultRays = 720
+
+# error messages
+msgRadiusNeeded = "A horizon index needs a finite RADIUS2 for the observer."
+msgNotHorizonIndex = "%s is not a horizon index file."
+
+class HorizonIndex:
+    #x,y,eye,step,horizon,ground
+    def __init__(self,x,y,eye,step,horizon,ground):
+        self.X = float(x)
+        self.Y = float(y)
+        # elevation of the observer's eye (surface or SPOT plus OFFSETA)
+        self.Eye = float(eye)
+        # ground distance between samples along a ray
+        self.Step = float(step)
+        # horizon[ray,m] is the highest sight line slope over samples 1..m
+        self.Horizon = horizon
+        # ground[ray,m] is the (curvature corrected) surface at sample m
+        self.Ground = ground
+        self.Rays = horizon.shape[0]
+        self.Samples = horizon.shape[1] - 1
+        # visibility modifiers of the observer
+        self.Radius1 = 0.0
+        self.Radius2 = self.Samples * self.Step
+        self.Azimuth1 = 0.0
+        self.Span = 360.0
+        self.Lower = -numpy.inf
+        self.Upper = numpy.inf
+        # meters per map unit east and north (not 1.0 on a geographic surface)
+        self.ScaleX = 1.0
+        self.ScaleY = 1.0
+        self.UseCurvature = False
+        self.RefractionFactor = Visibility.DefaultRefraction
+
+    def GroundOffsets (self,xs,ys):
+        ## returns (east,north) ground distances from the observer
+        east = (numpy.asarray(xs,numpy.float64) - self.X) * self.ScaleX
+        north = (numpy.asarray(ys,numpy.float64) - self.Y) * self.ScaleY
+        return east,north
+
+    def Lookup (self,xs,ys):
+        ## returns (dist,horizon slope,ground) for targets at xs,ys
+        east,north = self.GroundOffsets(xs,ys)
+        dist = numpy.sqrt((east * east) + (north * north))
+        ray = (Visibility.GroundAzimuths(east,north) / 360.0) * self.Rays
+        ray0 = numpy.floor(ray).astype(numpy.int32) % self.Rays
+        ray1 = (ray0 + 1) % self.Rays
+        w = ray - numpy.floor(ray)
+        # horizon from the samples strictly closer than the target
+        before = numpy.clip(numpy.ceil(dist / self.Step).astype(numpy.int32) - 1,0,self.Samples)
+        nearest = numpy.clip(numpy.round(dist / self.Step).astype(numpy.int32),0,self.Samples)
+        horizon = (self.Horizon[ray0,before] * (1.0 - w)) + (self.Horizon[ray1,before] * w)
+        ground = (self.Ground[ray0,nearest] * (1.0 - w)) + (self.Ground[ray1,nearest] * w)
+        return dist,horizon,ground
+
+    def TargetSlopes (self,xs,ys,offsetb=0.0,zs=None):
+        ## sight line slopes to targets offsetb above the ground (or at zs)
+        dist,horizon,ground = self.Lookup(xs,ys)
+        if (zs is None):
+            z = ground + offsetb
+        else:
+            z = numpy.asarray(zs,numpy.float64) + offsetb
+            if (self.UseCurvature == True):
+                z = z - Visibility.CurvatureCorrection(dist,self.RefractionFactor)
+        safe = numpy.maximum(dist,1.0e-9)
+        return dist,horizon,(z - self.Eye) / safe
+
+    def IsVisible (self,xs,ys,offsetb=0.0,zs=None):
+        ## True where a target offsetb above the ground at xs,ys (or above zs,
+        ## the target's surface elevation) can be seen from the observer
+        dist,horizon,slope = self.TargetSlopes(xs,ys,offsetb,zs)
+        east,north = self.GroundOffsets(xs,ys)
+        visible = (slope >= horizon) & (dist >= self.Radius1) & (dist <= self.Radius2)
+        visible = visible & (slope >= self.Lower) & (slope <= self.Upper)
+        if (self.Span < 360.0):
+            visible = visible & Visibility.InSector(Visibility.GroundAzimuths(east,north),self.Azimuth1,self.Span,0.0)
+        return visible & ~numpy.isnan(slope)
+
+    def MinimumVisibleHeight (self,xs,ys):
+        ## height above the ground a target at xs,ys needs to be seen
+        ## (0 if the ground itself is visible), ignoring the sector and VERT limits
+        dist,horizon,ground = self.Lookup(xs,ys)
+        needed = (self.Eye + (horizon * dist)) - ground
+        return numpy.maximum(needed,0.0)
+
+    def Save (self,index_file):
+        ## saves the index to a NumPy .npz file
+        settings = numpy.array([self.X,self.Y,self.Eye,self.Step,self.Radius1,self.Radius2,
+                                self.Azimuth1,self.Span,self.Lower,self.Upper,
+                                self.ScaleX,self.ScaleY,float(self.UseCurvature),self.RefractionFactor],numpy.float64)
+        numpy.savez(index_file,settings=settings,horizon=self.Horizon,ground=self.Ground)
+        return index_file
+
+
+def ReadHorizonIndex(index_file):
+    ## loads a horizon index saved with HorizonIndex.Save
+    data = numpy.load(index_file)
+    try:
+        if not ("settings" in data.files and "horizon" in data.files):
+            raise Exception, msgNotHorizonIndex % (str(index_file))
+        settings = data["settings"]
+        index = HorizonIndex(settings[0],settings[1],settings[2],settings[3],data["horizon"],data["ground"])
+        index.Radius1,index.Radius2 = settings[4],settings[5]
+        index.Azimuth1,index.Span = settings[6],settings[7]
+        index.Lower,index.Upper = settings[8],settings[9]
+        index.ScaleX,index.ScaleY = settings[10],settings[11]
+        index.UseCurvature = (settings[12] != 0.0)
+        index.RefractionFactor = settings[13]
+    finally:
+        data.close()
+    return index
+
+def BuildHorizonIndex(surface,observer,rays=DefaultRays,step=None,bUseCurvature=False,refraction_factor=Visibility.DefaultRefraction):
+    ## samples the surface along rays from an observer (dictionary with X, Y
+    ## and the observer fields, see Visibility.ReadObservers) out to RADIUS2
+    ## and returns its HorizonIndex. step defaults to the cell size.
+    radius2 = Visibility.ObserverValue(observer,"RADIUS2")
+    if (radius2 == numpy.inf):
+        raise Exception, msgRadiusNeeded
+    row,col = surface.MapToCell(observer["X"],observer["Y"])
+    if not (surface.ContainsCell(row,col)):
+        raise Exception, Visibility.msgObserverOutsideSurface % (str(observer["X"]),str(observer["Y"]))
+    cellwidth,cellheight = surface.GroundCellSize(row)
+    if (step == None):
+        step = min(cellwidth,cellheight)
+    eye = Visibility.ObserverElevation(surface,observer) + Visibility.ObserverValue(observer,"OFFSETA")
+    samples = int(math.ceil(radius2 / step))
+
+    # ground offsets to map units, taken at the observer on a geographic surface
+    scale_x = cellwidth / surface.CellWidth
+    scale_y = cellheight / surface.CellHeight
+    azimuths = numpy.radians((numpy.arange(rays) * 360.0) / rays)
+    dist = numpy.arange(samples + 1) * step
+    xs = observer["X"] + ((numpy.sin(azimuths)[:,numpy.newaxis] * dist) / scale_x)
+    ys = observer["Y"] + ((numpy.cos(azimuths)[:,numpy.newaxis] * dist) / scale_y)
+    ground = surface.InterpolateArray(xs,ys)
+    # samples off the surface are NoData
+    extent = surface.GetExtent()
+    ground[(xs < extent[0]) | (xs > extent[2]) | (ys < extent[1]) | (ys > extent[3])] = numpy.nan
+    if (bUseCurvature == True):
+        ground = ground - Visibility.CurvatureCorrection(dist,refraction_factor)
+
+    slopes = numpy.zeros(ground.shape,numpy.float64) + Visibility.NoHorizon
+    valid = ~numpy.isnan(ground)
+    valid[:,0] = False
+    slopes[valid] = ((ground - eye) / numpy.maximum(dist,step))[valid]
+    horizon = numpy.maximum.accumulate(slopes,axis=1)
+
+    index = HorizonIndex(observer["X"],observer["Y"],eye,step,horizon.astype(numpy.float32),ground.astype(numpy.float32))
+    index.Radius1 = Visibility.ObserverValue(observer,"RADIUS1")
+    index.Radius2 = radius2
+    index.Azimuth1,index.Span = Visibility.ObserverSector(observer)
+    index.Lower,index.Upper = Visibility.ObserverSlopeLimits(observer)
+    index.ScaleX,index.ScaleY = scale_x,scale_y
+    index.UseCurvature = bUseCurvature
+    index.RefractionFactor = refraction_factor
+    if (debug == True):
+        print "Horizon index: %s rays, %s samples" % (str(rays),str(samples))
+    return index
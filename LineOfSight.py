@@ -0,0 +1,910 @@
+#!/usr/bin/env python
+# -*- coding: latin-1 -*-
+
+#
+# LineOfSight.py
+#
+# Military Analyst native (NumPy) line of sight engine
+#
+# Many sight lines are checked at once: the lines are sorted by length and
+# sampled in chunks as 2D arrays (line, sample) with bilinear interpolation
+# of the surface. A target is visible when no sample rises above the sight
+# line, i.e. when the running maximum of the elevation angle along the line
+# stays below the angle to the target; the first sample above the line is
+# the obstruction point. Single line profiles give the visible and hidden
+# parts of a line for output the way LineOfSight_3d writes them.
+#
+# When only TarIsVis is wanted the lines are marched over a pyramid of block
+# maxima of the surface instead: a stretch of line passing above the
+# highest cell under it is cleared without being sampled, and a line is
+# dropped at its first obstruction.
+#
+# MATCH pairs (n-th observer with n-th target) can be read from both
+# cursors in lockstep a block at a time (MatchedPoints), each block being
+# checked and written before the next is read.
+#
+# For radio links the same samples give the clearance of a Fresnel zone:
+# the height of the link above the surface (raised by the earth bulge) over
+# the zone radius at each sample, the least of which is the link's ratio.
+#
+
+import os, sys, math, struct, tempfile, shutil, zipfile
+import numpy
+import Surface, Visibility
+
+debug = False
+
+# samples taken along a line per cell crossed
+DefaultSamplesPerCell = 1.0
+
+# samples held in memory at a time
+ChunkSamples = 1000000
+
+# observer/target pairs per block
+DefaultPairBlock = 100000
+
+# average number of targets in a cell of the target grid index
+PointsPerGridCell = 4.0
+
+# segments of a marched line with this many samples or fewer are sampled
+MarchLeafSamples = 8
+
+# VisCode values of the output line segments (as LineOfSight_3d)
+VisCodeVisible = 1
+VisCodeHidden = 2
+
+# speed of light in meters per second, for radio wavelengths
+SpeedOfLight = 299792458.0
+
+# refraction of the standard radio atmosphere (4/3 earth radius)
+RadioRefraction = 0.25
+
+# Fresnel zone clearance ratio a link is usually planned to
+FresnelClearanceGoal = 0.6
+
+# error messages
+msgCreateOutputFailed = "Could not create line of sight output %s: \n %s"
+msgWriteOutputFailed = "Could not write line of sight output %s: \n %s"
+msgPointOnNoData = "Point at %s, %s is on a NoData cell of the surface."
+msgNotVisibilityMatrix = "%s is not a visibility matrix file."
+msgNoClearance = "Visibility matrix %s holds no clearance matrix."
+msgNoSuchOID = "OID %s is not in the visibility matrix."
+msgWriteMatrixFailed = "Could not write visibility matrix %s: \n %s"
+msgBadFrequency = "Link frequency must be greater than zero MHz."
+
+def SampleCounts(surface,x1,y1,x2,y2,samples_per_cell=DefaultSamplesPerCell):
+    ## number of steps along each line, at least one
+    steps = numpy.maximum(numpy.abs(x2 - x1) / surface.CellWidth,numpy.abs(y2 - y1) / surface.CellHeight)
+    return numpy.maximum(numpy.ceil(steps * samples_per_cell).astype(numpy.int32),1)
+
+def GroundDistances(surface,x1,y1,x2,y2):
+    ## ground length of each line (meters on a geographic surface)
+    row = ((surface.YMax - y1) / surface.CellHeight) - 0.5
+    east,north = surface.GroundOffsets(row,(y1 - y2) / surface.CellHeight,(x2 - x1) / surface.CellWidth)
+    return numpy.sqrt((east * east) + (north * north))
+
+def PointElevations(surface,points,offset_field=None,bUseZ=True):
+    ## returns (x,y,z) arrays for a list of points (see Visibility.ReadObservers):
+    ## z is the point Z (if bUseZ), SPOT or the surface, plus offset_field
+    ## when the point has it. z is NaN on NoData.
+    xs = numpy.array([point["X"] for point in points],numpy.float64)
+    ys = numpy.array([point["Y"] for point in points],numpy.float64)
+    zs = surface.InterpolateArray(xs,ys).astype(numpy.float64)
+    for i in range(len(points)):
+        if (bUseZ == True and points[i].has_key("Z")):
+            zs[i] = points[i]["Z"]
+        elif (points[i].has_key("SPOT")):
+            zs[i] = points[i]["SPOT"]
+        if (offset_field != None and points[i].has_key(offset_field)):
+            zs[i] = zs[i] + points[i][offset_field]
+    return xs,ys,zs
+
+def SampleChunks(surface,x1,y1,x2,y2,steps):
+    ## generator over the lines sorted by length in chunks of about
+    ## ChunkSamples samples: yields (lines,f,inner,zs) where f is the
+    ## fraction along each line of its samples (line, sample), inner masks
+    ## the samples short of the end and zs is the surface under them.
+    ## Chunks of lines too short to sample are skipped.
+    count = len(x1)
+    order = numpy.argsort(steps,kind="mergesort")
+    start = 0
+    while (start < count):
+        # lines of similar length together, about ChunkSamples samples
+        end = min(count,start + max(1,ChunkSamples / int(steps[order[start]])))
+        while (end - start > 1 and (end - start) * int(steps[order[end - 1]]) > ChunkSamples):
+            end = start + ((end - start) / 2)
+        lines = order[start:end]
+        start = end
+        nmax = int(steps[lines].max())
+        if (nmax < 2):
+            continue
+        f = numpy.arange(1,nmax,dtype=numpy.float64)[numpy.newaxis,:] / steps[lines][:,numpy.newaxis]
+        inner = f < 1.0
+        xs = x1[lines][:,numpy.newaxis] + (f * (x2 - x1)[lines][:,numpy.newaxis])
+        ys = y1[lines][:,numpy.newaxis] + (f * (y2 - y1)[lines][:,numpy.newaxis])
+        yield lines,f,inner,surface.InterpolateArray(xs,ys)
+
+def SightLines(surface,x1,y1,z1,x2,y2,z2,samples_per_cell=DefaultSamplesPerCell,bUseCurvature=False,refraction_factor=Visibility.DefaultRefraction):
+    ## checks the sight lines from x1,y1,z1 to x2,y2,z2 (arrays), returns
+    ## (visible,obstruction,clearance) where obstruction is the fraction
+    ## along the line of the first obstruction (NaN for visible lines) and
+    ## clearance the least height of the line above the surface (negative
+    ## when blocked, inf for lines too short to sample)
+    x1,y1,z1 = numpy.asarray(x1,numpy.float64),numpy.asarray(y1,numpy.float64),numpy.asarray(z1,numpy.float64)
+    x2,y2,z2 = numpy.asarray(x2,numpy.float64),numpy.asarray(y2,numpy.float64),numpy.asarray(z2,numpy.float64)
+    count = len(x1)
+    visible = numpy.ones(count,numpy.bool_)
+    obstruction = numpy.zeros(count,numpy.float64) + numpy.nan
+    clearance = numpy.zeros(count,numpy.float64) + numpy.inf
+    if (count == 0):
+        return visible,obstruction,clearance
+    steps = SampleCounts(surface,x1,y1,x2,y2,samples_per_cell)
+    if (bUseCurvature == True):
+        dist = GroundDistances(surface,x1,y1,x2,y2)
+
+    old_settings = numpy.seterr(invalid="ignore")
+    try:
+        for lines,f,inner,zs in SampleChunks(surface,x1,y1,x2,y2,steps):
+            if (bUseCurvature == True):
+                zs = zs - Visibility.CurvatureCorrection(f * dist[lines][:,numpy.newaxis],refraction_factor)
+            sight = z1[lines][:,numpy.newaxis] + (f * (z2 - z1)[lines][:,numpy.newaxis])
+            blocked = inner & (zs > sight)
+            hit = blocked.any(1)
+            first = numpy.argmax(blocked,1)
+            visible[lines] = ~hit
+            obstruction[lines] = numpy.where(hit,f[numpy.arange(len(lines)),first],numpy.nan)
+            clearance[lines] = numpy.where(inner & ~numpy.isnan(zs),sight - zs,numpy.inf).min(1)
+    finally:
+        numpy.seterr(**old_settings)
+
+    # lines from or to NoData are not visible
+    nodata = numpy.isnan(z1) | numpy.isnan(z2)
+    visible = visible & ~nodata
+    clearance[nodata] = numpy.nan
+    return visible,obstruction,clearance
+
+def SightLineProfile(surface,x1,y1,z1,x2,y2,z2,samples_per_cell=DefaultSamplesPerCell,bUseCurvature=False,refraction_factor=Visibility.DefaultRefraction):
+    ## samples one sight line, returns (f,x,y,z,visible) for the points from
+    ## the observer (f = 0) to the target (f = 1): z is the surface and
+    ## visible is True where the surface can be seen from z1
+    steps = int(SampleCounts(surface,numpy.array([x1]),numpy.array([y1]),numpy.array([x2]),numpy.array([y2]),samples_per_cell)[0])
+    f = numpy.arange(steps + 1,dtype=numpy.float64) / steps
+    xs = x1 + (f * (x2 - x1))
+    ys = y1 + (f * (y2 - y1))
+    zs = surface.InterpolateArray(xs,ys)
+    zs[-1] = z2
+    dist = f * GroundDistances(surface,numpy.array([x1]),numpy.array([y1]),numpy.array([x2]),numpy.array([y2]))[0]
+    apparent = zs
+    if (bUseCurvature == True):
+        apparent = zs - Visibility.CurvatureCorrection(dist,refraction_factor)
+    slopes = numpy.zeros(len(f),numpy.float64) + Visibility.NoHorizon
+    valid = ~numpy.isnan(apparent)
+    valid[0] = False
+    slopes[valid] = (apparent[valid] - z1) / dist[valid]
+    # running maximum of the elevation angle before each point
+    horizon = numpy.zeros(len(f),numpy.float64) + Visibility.NoHorizon
+    horizon[1:] = numpy.maximum.accumulate(slopes)[:-1]
+    visible = (slopes >= horizon) & valid
+    visible[0] = True
+    return f,xs,ys,zs,visible
+
+def ProfileSegments(visible):
+    ## runs of equal visibility along a profile: returns (first,last,visible)
+    ## point indexes, each run ends on the first point of the next run
+    segments = []
+    first = 0
+    for i in range(1,len(visible)):
+        if (visible[i] != visible[first]):
+            segments.append((first,i,bool(visible[first])))
+            first = i
+    if (first < len(visible) - 1 or len(segments) == 0):
+        segments.append((first,len(visible) - 1,bool(visible[first])))
+    return segments
+
+def AllPairs(observers,targets,block=DefaultPairBlock):
+    ## yields (observer indexes,target indexes) blocks pairing every observer
+    ## with every target, pairs at the same x,y are skipped
+    ox = numpy.array([point["X"] for point in observers])
+    oy = numpy.array([point["Y"] for point in observers])
+    tx = numpy.array([point["X"] for point in targets])
+    ty = numpy.array([point["Y"] for point in targets])
+    per_block = max(1,block / max(1,len(targets)))
+    for first in range(0,len(observers),per_block):
+        obs = numpy.arange(first,min(len(observers),first + per_block))
+        obs_index = numpy.repeat(obs,len(targets))
+        tgt_index = numpy.tile(numpy.arange(len(targets)),len(obs))
+        keep = (ox[obs_index] != tx[tgt_index]) | (oy[obs_index] != ty[tgt_index])
+        yield obs_index[keep],tgt_index[keep]
+
+class PointGrid:
+    #xs,ys,cell_size
+    def __init__(self,xs,ys,cell_size=None):
+        ## buckets points into square grid cells of cell_size map units (by
+        ## default sized to hold about PointsPerGridCell points each)
+        self.X = numpy.asarray(xs,numpy.float64)
+        self.Y = numpy.asarray(ys,numpy.float64)
+        if (len(self.X) == 0):
+            self.XMin,self.YMin,width,height = 0.0,0.0,0.0,0.0
+        else:
+            self.XMin,self.YMin = self.X.min(),self.Y.min()
+            width,height = self.X.max() - self.XMin,self.Y.max() - self.YMin
+        if (cell_size == None):
+            cell_size = math.sqrt((width * height * PointsPerGridCell) / max(1,len(self.X)))
+            if (cell_size <= 0.0):
+                cell_size = max(width,height,1.0)
+        self.CellSize = float(cell_size)
+        self.Cols = int(width / self.CellSize) + 1
+        self.Rows = int(height / self.CellSize) + 1
+        rows = ((self.Y - self.YMin) / self.CellSize).astype(numpy.int64)
+        cols = ((self.X - self.XMin) / self.CellSize).astype(numpy.int64)
+        keys = (rows * self.Cols) + cols
+        # point indexes sorted by cell, a row of cells is one run
+        self.Order = numpy.argsort(keys,kind="mergesort")
+        self.Keys = keys[self.Order]
+
+    def QueryBox (self,xmin,ymin,xmax,ymax):
+        ## indexes (ascending) of the points inside a box
+        col0 = max(0,int(math.floor((xmin - self.XMin) / self.CellSize)))
+        col1 = min(self.Cols - 1,int(math.floor((xmax - self.XMin) / self.CellSize)))
+        row0 = max(0,int(math.floor((ymin - self.YMin) / self.CellSize)))
+        row1 = min(self.Rows - 1,int(math.floor((ymax - self.YMin) / self.CellSize)))
+        if (col0 > col1 or row0 > row1 or len(self.Keys) == 0):
+            return numpy.zeros(0,numpy.int64)
+        first = numpy.arange(row0,row1 + 1) * self.Cols
+        lo = numpy.searchsorted(self.Keys,first + col0,"left")
+        hi = numpy.searchsorted(self.Keys,first + col1,"right")
+        found = numpy.concatenate([self.Order[lo[k]:hi[k]] for k in range(len(lo))])
+        inside = (self.X[found] >= xmin) & (self.X[found] <= xmax) & (self.Y[found] >= ymin) & (self.Y[found] <= ymax)
+        found = found[inside]
+        found.sort()
+        return found
+
+
+def SearchBox(surface,x,y,radius):
+    ## map box [xmin,ymin,xmax,ymax] holding the points within a ground radius of x,y
+    if (surface == None or surface.Geographic == False):
+        return [x - radius,y - radius,x + radius,y + radius]
+    lat_m,lon_m = Surface.MetersPerDegree(y)
+    dlat = radius / lat_m
+    # meters per degree of longitude are fewest on the side away from the equator
+    lat_m,lon_m = Surface.MetersPerDegree(min(89.9,max(abs(y - dlat),abs(y + dlat))))
+    dlon = min(180.0,radius / max(lon_m,1.0))
+    return [x - dlon,y - dlat,x + dlon,y + dlat]
+
+def CandidatePairs(surface,observers,targets,block=DefaultPairBlock):
+    ## yields (observer indexes,target indexes) blocks like AllPairs, leaving
+    ## out the targets beyond an observer's RADIUS2 or outside its
+    ## AZIMUTH1/AZIMUTH2 sector. Targets are found through a PointGrid so
+    ## only the targets near each observer are looked at.
+    tx = numpy.array([point["X"] for point in targets],numpy.float64)
+    ty = numpy.array([point["Y"] for point in targets],numpy.float64)
+    grid = PointGrid(tx,ty)
+    every = numpy.arange(len(targets))
+    obs_blocks = []
+    tgt_blocks = []
+    pair_count = 0
+    for o in range(len(observers)):
+        x,y = observers[o]["X"],observers[o]["Y"]
+        radius2 = Visibility.ObserverValue(observers[o],"RADIUS2")
+        azimuth1,span = Visibility.ObserverSector(observers[o])
+        if (radius2 == numpy.inf):
+            found = every
+        else:
+            box = SearchBox(surface,x,y,radius2)
+            found = grid.QueryBox(box[0],box[1],box[2],box[3])
+        found = found[(tx[found] != x) | (ty[found] != y)]
+        if (len(found) > 0 and (radius2 != numpy.inf or span < 360.0)):
+            xs = numpy.zeros(len(found),numpy.float64) + x
+            ys = numpy.zeros(len(found),numpy.float64) + y
+            if (surface == None):
+                east,north = tx[found] - xs,ty[found] - ys
+            else:
+                row = ((surface.YMax - ys) / surface.CellHeight) - 0.5
+                east,north = surface.GroundOffsets(row,(ys - ty[found]) / surface.CellHeight,(tx[found] - xs) / surface.CellWidth)
+            keep = numpy.sqrt((east * east) + (north * north)) <= radius2
+            if (span < 360.0):
+                keep = keep & Visibility.InSector(Visibility.GroundAzimuths(east,north),azimuth1,span,0.0)
+            found = found[keep]
+        if (len(found) == 0):
+            continue
+        obs_blocks.append(numpy.zeros(len(found),numpy.int64) + o)
+        tgt_blocks.append(found)
+        pair_count = pair_count + len(found)
+        if (pair_count >= block):
+            yield numpy.concatenate(obs_blocks),numpy.concatenate(tgt_blocks)
+            obs_blocks,tgt_blocks,pair_count = [],[],0
+    if (pair_count > 0):
+        yield numpy.concatenate(obs_blocks),numpy.concatenate(tgt_blocks)
+
+class MatchedPoints:
+    #gp,observers_fc,targets_fc,block
+    def __init__(self,gp,observers_fc,targets_fc,block=DefaultPairBlock):
+        self.GP = gp
+        self.ObserversFC = observers_fc
+        self.TargetsFC = targets_fc
+        self.Block = block
+        # pairs read so far
+        self.Count = 0
+        # True once one feature class is found to have more points
+        self.Unmatched = False
+
+    def Blocks (self):
+        ## generator over (observers,targets) lists of up to Block points
+        ## (see Visibility.ReadObservers), the n-th observer paired with the
+        ## n-th target. Both cursors are read in lockstep, so only one block
+        ## of points is held at a time.
+        observers = Visibility.IterObservers(self.GP,self.ObserversFC)
+        targets = Visibility.IterObservers(self.GP,self.TargetsFC)
+        obs_block = []
+        tgt_block = []
+        for observer in observers:
+            try:
+                target = targets.next()
+            except StopIteration:
+                self.Unmatched = True
+                break
+            obs_block.append(observer)
+            tgt_block.append(target)
+            self.Count = self.Count + 1
+            if (len(obs_block) == self.Block):
+                yield obs_block,tgt_block
+                obs_block = []
+                tgt_block = []
+        else:
+            # the observers ran out first, any target left is unmatched
+            for target in targets:
+                self.Unmatched = True
+                break
+        if (len(obs_block) > 0):
+            yield obs_block,tgt_block
+
+
+def MatchPairs(observers,targets,block=DefaultPairBlock):
+    ## yields (observer indexes,target indexes) blocks pairing observer i with target i
+    count = min(len(observers),len(targets))
+    for first in range(0,count,block):
+        index = numpy.arange(first,min(count,first + block))
+        yield index,index
+
+class ElevationPyramid:
+    #surface
+    def __init__(self,surface):
+        ## level 0 is the surface (NoData as -inf, it never blocks a line),
+        ## each level above holds the maximum of 2 x 2 blocks of the one below
+        level = numpy.where(numpy.isnan(surface.Elevation),-numpy.inf,surface.Elevation).astype(numpy.float32)
+        self.Levels = [level]
+        while (level.shape[0] > 1 or level.shape[1] > 1):
+            rows = (level.shape[0] + 1) / 2
+            cols = (level.shape[1] + 1) / 2
+            padded = numpy.zeros((rows * 2,cols * 2),numpy.float32) - numpy.inf
+            padded[:level.shape[0],:level.shape[1]] = level
+            level = numpy.maximum(numpy.maximum(padded[0::2,0::2],padded[0::2,1::2]),
+                                  numpy.maximum(padded[1::2,0::2],padded[1::2,1::2]))
+            self.Levels.append(level)
+        # all levels in one array so boxes on different levels are read at once
+        self.Offsets = numpy.cumsum([0] + [level.size for level in self.Levels])[:-1]
+        self.LevelCols = numpy.array([level.shape[1] for level in self.Levels])
+        self.Flat = numpy.concatenate([level.ravel() for level in self.Levels])
+
+    def BoxMaximum (self,row0,row1,col0,col1):
+        ## highest cell in the boxes of rows row0..row1 and columns col0..col1
+        ## (arrays, inclusive): read from the lowest level where a box
+        ## touches no more than 2 x 2 blocks
+        span = numpy.maximum(row1 - row0,col1 - col0) + 1
+        level = numpy.ceil(numpy.log2(span)).astype(numpy.int64)
+        level = numpy.clip(level,0,len(self.Levels) - 1)
+        r0,r1 = row0 >> level,row1 >> level
+        c0,c1 = col0 >> level,col1 >> level
+        offset = self.Offsets[level]
+        cols = self.LevelCols[level]
+        flat = self.Flat
+        return numpy.maximum(numpy.maximum(flat[offset + (r0 * cols) + c0],flat[offset + (r0 * cols) + c1]),
+                             numpy.maximum(flat[offset + (r1 * cols) + c0],flat[offset + (r1 * cols) + c1]))
+
+
+def MarchSightLines(surface,pyramid,x1,y1,z1,x2,y2,z2,samples_per_cell=DefaultSamplesPerCell,bUseCurvature=False,refraction_factor=Visibility.DefaultRefraction):
+    ## visible for each sight line, as SightLines, using an ElevationPyramid
+    ## of the surface: stretches of line above the highest cell under them
+    ## are skipped, the rest is halved until it is short enough to sample.
+    ## Curvature only lowers the surface, so the pyramid test ignores it.
+    x1,y1,z1 = numpy.asarray(x1,numpy.float64),numpy.asarray(y1,numpy.float64),numpy.asarray(z1,numpy.float64)
+    x2,y2,z2 = numpy.asarray(x2,numpy.float64),numpy.asarray(y2,numpy.float64),numpy.asarray(z2,numpy.float64)
+    count = len(x1)
+    visible = numpy.ones(count,numpy.bool_)
+    if (count == 0):
+        return visible
+    steps = SampleCounts(surface,x1,y1,x2,y2,samples_per_cell)
+    if (bUseCurvature == True):
+        dist = GroundDistances(surface,x1,y1,x2,y2)
+    # segments: line, first sample and number of samples (samples 1..steps - 1)
+    line = numpy.nonzero(steps > 1)[0]
+    first = numpy.ones(len(line),numpy.int64)
+    samples = (steps[line] - 1).astype(numpy.int64)
+
+    old_settings = numpy.seterr(invalid="ignore")
+    try:
+        while (len(line) > 0):
+            # a line is done at its first obstruction
+            keep = visible[line]
+            line,first,samples = line[keep],first[keep],samples[keep]
+            if (len(line) == 0):
+                break
+            n = steps[line].astype(numpy.float64)
+            leaf = samples <= MarchLeafSamples
+
+            # short segments are sampled
+            if (leaf.any()):
+                leaf_line = line[leaf]
+                k = first[leaf][:,numpy.newaxis] + numpy.arange(MarchLeafSamples)[numpy.newaxis,:]
+                inner = k < (first[leaf] + samples[leaf])[:,numpy.newaxis]
+                f = k / n[leaf][:,numpy.newaxis]
+                xs = x1[leaf_line][:,numpy.newaxis] + (f * (x2 - x1)[leaf_line][:,numpy.newaxis])
+                ys = y1[leaf_line][:,numpy.newaxis] + (f * (y2 - y1)[leaf_line][:,numpy.newaxis])
+                zs = surface.InterpolateArray(xs,ys)
+                if (bUseCurvature == True):
+                    zs = zs - Visibility.CurvatureCorrection(f * dist[leaf_line][:,numpy.newaxis],refraction_factor)
+                sight = z1[leaf_line][:,numpy.newaxis] + (f * (z2 - z1)[leaf_line][:,numpy.newaxis])
+                blocked = (inner & (zs > sight)).any(1)
+                visible[leaf_line[blocked]] = False
+
+            # longer segments are cleared by the pyramid or halved
+            line,first,samples,n = line[~leaf],first[~leaf],samples[~leaf],n[~leaf]
+            if (len(line) == 0):
+                break
+            fa = first / n
+            fb = (first + samples - 1) / n
+            xa = x1[line] + (fa * (x2 - x1)[line])
+            xb = x1[line] + (fb * (x2 - x1)[line])
+            ya = y1[line] + (fa * (y2 - y1)[line])
+            yb = y1[line] + (fb * (y2 - y1)[line])
+            # cells the bilinear interpolation reads along the segment
+            ca = numpy.floor(numpy.clip(((numpy.minimum(xa,xb) - surface.XMin) / surface.CellWidth) - 0.5,0.0,surface.Cols - 1.0))
+            cb = numpy.floor(numpy.clip(((numpy.maximum(xa,xb) - surface.XMin) / surface.CellWidth) - 0.5,0.0,surface.Cols - 1.0)) + 1
+            ra = numpy.floor(numpy.clip(((surface.YMax - numpy.maximum(ya,yb)) / surface.CellHeight) - 0.5,0.0,surface.Rows - 1.0))
+            rb = numpy.floor(numpy.clip(((surface.YMax - numpy.minimum(ya,yb)) / surface.CellHeight) - 0.5,0.0,surface.Rows - 1.0)) + 1
+            ra = numpy.maximum(numpy.minimum(ra,surface.Rows - 2),0).astype(numpy.int64)
+            ca = numpy.maximum(numpy.minimum(ca,surface.Cols - 2),0).astype(numpy.int64)
+            rb = numpy.minimum(rb,surface.Rows - 1).astype(numpy.int64)
+            cb = numpy.minimum(cb,surface.Cols - 1).astype(numpy.int64)
+            highest = pyramid.BoxMaximum(ra,rb,ca,cb)
+            lowest_sight = numpy.minimum(z1[line] + (fa * (z2 - z1)[line]),z1[line] + (fb * (z2 - z1)[line]))
+            # a small margin for rounding in the interpolation
+            open_segment = highest <= lowest_sight - (1.0e-6 * (1.0 + numpy.abs(lowest_sight)))
+            line,first,samples = line[~open_segment],first[~open_segment],samples[~open_segment]
+            half = samples / 2
+            # sample the middle of each segment left, most blocked lines
+            # are found here long before their segments get short
+            f = (first + half) / steps[line].astype(numpy.float64)
+            zs = surface.InterpolateArray(x1[line] + (f * (x2 - x1)[line]),y1[line] + (f * (y2 - y1)[line]))
+            if (bUseCurvature == True):
+                zs = zs - Visibility.CurvatureCorrection(f * dist[line],refraction_factor)
+            visible[line[zs > z1[line] + (f * (z2 - z1)[line])]] = False
+            line = numpy.concatenate((line,line))
+            first = numpy.concatenate((first,first + half))
+            samples = numpy.concatenate((half,samples - half))
+    finally:
+        numpy.seterr(**old_settings)
+
+    return visible & ~(numpy.isnan(z1) | numpy.isnan(z2))
+
+def BatchLineOfSight(surface,observers,targets,pair_blocks,samples_per_cell=DefaultSamplesPerCell,bUseCurvature=False,refraction_factor=Visibility.DefaultRefraction,bUseZ=True,bVisibleOnly=False):
+    ## generator over pair blocks (see AllPairs): yields (observer indexes,
+    ## target indexes,visible,obstruction,clearance) for each block, see
+    ## SightLines. Observers are raised by their OFFSETA and targets by the
+    ## observer's OFFSETB. With bVisibleOnly the lines are marched over an
+    ## ElevationPyramid and obstruction and clearance are None.
+    ox,oy,oz = PointElevations(surface,observers,"OFFSETA",bUseZ)
+    tx,ty,tz = PointElevations(surface,targets,None,bUseZ)
+    offsetb = numpy.array([point.get("OFFSETB",0.0) for point in observers],numpy.float64)
+    pyramid = None
+    if (bVisibleOnly == True):
+        pyramid = ElevationPyramid(surface)
+    for obs_index,tgt_index in pair_blocks:
+        if (pyramid is not None):
+            visible = MarchSightLines(surface,pyramid,ox[obs_index],oy[obs_index],oz[obs_index],
+                                      tx[tgt_index],ty[tgt_index],tz[tgt_index] + offsetb[obs_index],
+                                      samples_per_cell,bUseCurvature,refraction_factor)
+            yield obs_index,tgt_index,visible,None,None
+        else:
+            visible,obstruction,clearance = SightLines(surface,ox[obs_index],oy[obs_index],oz[obs_index],
+                                                       tx[tgt_index],ty[tgt_index],tz[tgt_index] + offsetb[obs_index],
+                                                       samples_per_cell,bUseCurvature,refraction_factor)
+            yield obs_index,tgt_index,visible,obstruction,clearance
+
+def Wavelength(frequency,unit_factor=1.0):
+    ## wavelength of a link frequency (MHz) in ground units, unit_factor
+    ## is the number of ground units in a meter (see Profile.ZUnitFactor)
+    if (frequency <= 0.0):
+        raise Exception, msgBadFrequency
+    return (SpeedOfLight / (float(frequency) * 1000000.0)) * float(unit_factor)
+
+def FresnelRadius(d1,d2,wavelength,zone=1):
+    ## radius of Fresnel zone `zone` at d1 from one end of a link and d2 from
+    ## the other (same units as wavelength)
+    return numpy.sqrt((zone * wavelength * d1 * d2) / numpy.maximum(d1 + d2,1.0e-12))
+
+def FresnelClearance(surface,x1,y1,z1,x2,y2,z2,wavelength,zone=1,samples_per_cell=DefaultSamplesPerCell,bUseCurvature=True,refraction_factor=RadioRefraction):
+    ## checks the Fresnel zone of the links from x1,y1,z1 to x2,y2,z2
+    ## (arrays), returns (ratio,worst) where ratio is the least height of the
+    ## link above the surface over the zone radius (1.0 or more is a clear
+    ## zone, 0.0 grazing, negative blocked) and worst the fraction along the
+    ## link where it is found. With bUseCurvature the surface is raised by
+    ## the earth bulge under the link. Links too short to sample have an
+    ## inf ratio, links from or to NoData a NaN ratio (worst is NaN for both).
+    x1,y1,z1 = numpy.asarray(x1,numpy.float64),numpy.asarray(y1,numpy.float64),numpy.asarray(z1,numpy.float64)
+    x2,y2,z2 = numpy.asarray(x2,numpy.float64),numpy.asarray(y2,numpy.float64),numpy.asarray(z2,numpy.float64)
+    count = len(x1)
+    ratio = numpy.zeros(count,numpy.float64) + numpy.inf
+    worst = numpy.zeros(count,numpy.float64) + numpy.nan
+    if (count == 0):
+        return ratio,worst
+    steps = SampleCounts(surface,x1,y1,x2,y2,samples_per_cell)
+    dist = GroundDistances(surface,x1,y1,x2,y2)
+
+    old_settings = numpy.seterr(invalid="ignore",divide="ignore")
+    try:
+        for lines,f,inner,zs in SampleChunks(surface,x1,y1,x2,y2,steps):
+            d1 = f * dist[lines][:,numpy.newaxis]
+            d2 = dist[lines][:,numpy.newaxis] - d1
+            if (bUseCurvature == True):
+                zs = zs + Visibility.EarthBulge(d1,d2,refraction_factor)
+            sight = z1[lines][:,numpy.newaxis] + (f * (z2 - z1)[lines][:,numpy.newaxis])
+            radius = FresnelRadius(d1,d2,wavelength,zone)
+            sampled = inner & ~numpy.isnan(zs) & (radius > 0.0)
+            ratios = numpy.where(sampled,(sight - zs) / numpy.where(sampled,radius,1.0),numpy.inf)
+            least = numpy.argmin(ratios,1)
+            ratio[lines] = ratios[numpy.arange(len(lines)),least]
+            worst[lines] = numpy.where(numpy.isinf(ratio[lines]),numpy.nan,f[numpy.arange(len(lines)),least])
+    finally:
+        numpy.seterr(**old_settings)
+
+    nodata = numpy.isnan(z1) | numpy.isnan(z2)
+    ratio[nodata] = numpy.nan
+    worst[nodata] = numpy.nan
+    return ratio,worst
+
+def BatchFresnelClearance(surface,observers,targets,pair_blocks,wavelength,zone=1,samples_per_cell=DefaultSamplesPerCell,bUseCurvature=True,refraction_factor=RadioRefraction,bUseZ=True):
+    ## generator over pair blocks (see AllPairs): yields (observer indexes,
+    ## target indexes,ratio,worst) for each block, see FresnelClearance.
+    ## Link ends are raised as in BatchLineOfSight.
+    ox,oy,oz = PointElevations(surface,observers,"OFFSETA",bUseZ)
+    tx,ty,tz = PointElevations(surface,targets,None,bUseZ)
+    offsetb = numpy.array([point.get("OFFSETB",0.0) for point in observers],numpy.float64)
+    for obs_index,tgt_index in pair_blocks:
+        ratio,worst = FresnelClearance(surface,ox[obs_index],oy[obs_index],oz[obs_index],
+                                       tx[tgt_index],ty[tgt_index],tz[tgt_index] + offsetb[obs_index],
+                                       wavelength,zone,samples_per_cell,bUseCurvature,refraction_factor)
+        yield obs_index,tgt_index,ratio,worst
+
+def CreateLineOfSightOutputs(gp,out_los,out_obstructions,spatial_ref):
+    ## creates the Z enabled line of sight and obstruction feature classes
+    try:
+        gp.CreateFeatureclass_management(os.path.dirname(out_los),os.path.basename(out_los),"POLYLINE","#","DISABLED","ENABLED",spatial_ref)
+        gp.AddField_management(out_los,"VisCode","LONG")
+        gp.AddField_management(out_los,"SourceOID","LONG")
+        gp.AddField_management(out_los,"TarIsVis","SHORT")
+        gp.AddField_management(out_los,"OBS_OID","LONG")
+        gp.AddField_management(out_los,"TGT_OID","LONG")
+        gp.CreateFeatureclass_management(os.path.dirname(out_obstructions),os.path.basename(out_obstructions),"POINT","#","DISABLED","ENABLED",spatial_ref)
+        gp.AddField_management(out_obstructions,"SourceOID","LONG")
+        gp.AddField_management(out_obstructions,"OBS_OID","LONG")
+        gp.AddField_management(out_obstructions,"TGT_OID","LONG")
+    except:
+        raise Exception, msgCreateOutputFailed % (str(out_los),gp.GetMessages())
+
+def WriteLineOfSight(gp,out_los,out_obstructions,spatial_ref,surface,observers,targets,results,
+                     samples_per_cell=DefaultSamplesPerCell,bUseCurvature=False,refraction_factor=Visibility.DefaultRefraction,bUseZ=True):
+    ## writes the results of BatchLineOfSight as LineOfSight_3d does: each
+    ## sight line split into visible (VisCode 1) and hidden (VisCode 2)
+    ## segments, and the first obstruction point of each blocked line
+    CreateLineOfSightOutputs(gp,out_los,out_obstructions,spatial_ref)
+    line_count = 0
+    los_rows = None
+    oxt_rows = None
+    try:
+        los_rows = gp.InsertCursor(out_los)
+        oxt_rows = gp.InsertCursor(out_obstructions)
+        line_count = InsertLineOfSight(gp,los_rows,oxt_rows,surface,observers,targets,results,
+                                       samples_per_cell,bUseCurvature,refraction_factor,bUseZ)
+        del los_rows, oxt_rows
+    except Exception, ErrorMessage:
+        if (los_rows != None): del los_rows
+        if (oxt_rows != None): del oxt_rows
+        raise Exception, msgWriteOutputFailed % (str(out_los),str(ErrorMessage) + "\n" + gp.GetMessages())
+    return line_count
+
+def WriteMatchedLineOfSight(gp,out_los,out_obstructions,spatial_ref,surface,matched,
+                            samples_per_cell=DefaultSamplesPerCell,bUseCurvature=False,refraction_factor=Visibility.DefaultRefraction,bUseZ=True):
+    ## as WriteLineOfSight for the pairs of a MatchedPoints, each block of
+    ## pairs is checked and written before the next one is read
+    CreateLineOfSightOutputs(gp,out_los,out_obstructions,spatial_ref)
+    line_count = 0
+    los_rows = None
+    oxt_rows = None
+    try:
+        los_rows = gp.InsertCursor(out_los)
+        oxt_rows = gp.InsertCursor(out_obstructions)
+        for observers,targets in matched.Blocks():
+            results = BatchLineOfSight(surface,observers,targets,MatchPairs(observers,targets,len(observers)),
+                                       samples_per_cell,bUseCurvature,refraction_factor,bUseZ)
+            line_count = InsertLineOfSight(gp,los_rows,oxt_rows,surface,observers,targets,results,
+                                           samples_per_cell,bUseCurvature,refraction_factor,bUseZ,line_count)
+            if (debug == True):
+                print "Wrote %s matched lines of sight" % (str(line_count))
+        del los_rows, oxt_rows
+    except Exception, ErrorMessage:
+        if (los_rows != None): del los_rows
+        if (oxt_rows != None): del oxt_rows
+        raise Exception, msgWriteOutputFailed % (str(out_los),str(ErrorMessage) + "\n" + gp.GetMessages())
+    return line_count
+
+def InsertLineOfSight(gp,los_rows,oxt_rows,surface,observers,targets,results,
+                      samples_per_cell=DefaultSamplesPerCell,bUseCurvature=False,refraction_factor=Visibility.DefaultRefraction,bUseZ=True,line_count=0):
+    ## inserts the line segments and obstruction points of the results of
+    ## BatchLineOfSight through open insert cursors (see WriteLineOfSight),
+    ## SourceOID counts on from line_count. Returns the last SourceOID.
+    ox,oy,oz = PointElevations(surface,observers,"OFFSETA",bUseZ)
+    tx,ty,tz = PointElevations(surface,targets,None,bUseZ)
+    for obs_index,tgt_index,visible,obstruction,clearance in results:
+        for k in range(len(obs_index)):
+            o = int(obs_index[k])
+            t = int(tgt_index[k])
+            line_count = line_count + 1
+            if (numpy.isnan(oz[o]) or numpy.isnan(tz[t])):
+                continue
+            target_z = tz[t] + observers[o].get("OFFSETB",0.0)
+            f,xs,ys,zs,profile_visible = SightLineProfile(surface,ox[o],oy[o],oz[o],tx[t],ty[t],target_z,
+                                                          samples_per_cell,bUseCurvature,refraction_factor)
+            for first,last,segment_visible in ProfileSegments(profile_visible):
+                line = gp.CreateObject("Array")
+                for i in range(first,last + 1):
+                    pnt = gp.CreateObject("Point")
+                    pnt.X = xs[i]
+                    pnt.Y = ys[i]
+                    if not (numpy.isnan(zs[i])): pnt.Z = zs[i]
+                    line.add(pnt)
+                row = los_rows.NewRow()
+                row.shape = line
+                if (segment_visible == True):
+                    row.SetValue("VisCode",VisCodeVisible)
+                else:
+                    row.SetValue("VisCode",VisCodeHidden)
+                row.SetValue("SourceOID",line_count)
+                row.SetValue("TarIsVis",int(visible[k]))
+                row.SetValue("OBS_OID",observers[o].get("OID",-1))
+                row.SetValue("TGT_OID",targets[t].get("OID",-1))
+                los_rows.InsertRow(row)
+            if (visible[k] == False and not numpy.isnan(obstruction[k])):
+                pnt = gp.CreateObject("Point")
+                pnt.X = ox[o] + (obstruction[k] * (tx[t] - ox[o]))
+                pnt.Y = oy[o] + (obstruction[k] * (ty[t] - oy[o]))
+                z = surface.Interpolate(pnt.X,pnt.Y)
+                if (z != None): pnt.Z = z
+                row = oxt_rows.NewRow()
+                row.shape = pnt
+                row.SetValue("SourceOID",line_count)
+                row.SetValue("OBS_OID",observers[o].get("OID",-1))
+                row.SetValue("TGT_OID",targets[t].get("OID",-1))
+                oxt_rows.InsertRow(row)
+    return line_count
+
+def CreateFresnelOutput(gp,out_fc,spatial_ref):
+    ## creates the Z enabled Fresnel zone clearance point feature class
+    try:
+        gp.CreateFeatureclass_management(os.path.dirname(out_fc),os.path.basename(out_fc),"POINT","#","DISABLED","ENABLED",spatial_ref)
+        gp.AddField_management(out_fc,"OBS_OID","LONG")
+        gp.AddField_management(out_fc,"TGT_OID","LONG")
+        gp.AddField_management(out_fc,"FRESNEL","DOUBLE")
+        gp.AddField_management(out_fc,"FRES_CLEAR","SHORT")
+        gp.AddField_management(out_fc,"DISTANCE","DOUBLE")
+    except:
+        raise Exception, msgCreateOutputFailed % (str(out_fc),gp.GetMessages())
+
+def WriteFresnelClearance(gp,out_fc,spatial_ref,surface,observers,targets,results,bUseZ=True):
+    ## writes the results of BatchFresnelClearance as the worst point of each
+    ## link: FRESNEL is the link's clearance ratio, FRES_CLEAR 1 when it
+    ## meets FresnelClearanceGoal and DISTANCE the ground distance of the
+    ## point from the observer. Links that could not be sampled are left
+    ## out. Returns the number of points written.
+    CreateFresnelOutput(gp,out_fc,spatial_ref)
+    point_count = 0
+    rows = None
+    try:
+        rows = gp.InsertCursor(out_fc)
+        point_count = InsertFresnelClearance(gp,rows,surface,observers,targets,results,bUseZ)
+        del rows
+    except Exception, ErrorMessage:
+        if (rows != None): del rows
+        raise Exception, msgWriteOutputFailed % (str(out_fc),str(ErrorMessage) + "\n" + gp.GetMessages())
+    return point_count
+
+def WriteMatchedFresnelClearance(gp,out_fc,spatial_ref,surface,matched,wavelength,zone=1,samples_per_cell=DefaultSamplesPerCell,
+                                 bUseCurvature=True,refraction_factor=RadioRefraction,bUseZ=True):
+    ## as WriteFresnelClearance for the pairs of a MatchedPoints, each block
+    ## of links is checked and written before the next one is read
+    CreateFresnelOutput(gp,out_fc,spatial_ref)
+    point_count = 0
+    rows = None
+    try:
+        rows = gp.InsertCursor(out_fc)
+        for observers,targets in matched.Blocks():
+            results = BatchFresnelClearance(surface,observers,targets,MatchPairs(observers,targets,len(observers)),
+                                            wavelength,zone,samples_per_cell,bUseCurvature,refraction_factor,bUseZ)
+            point_count = point_count + InsertFresnelClearance(gp,rows,surface,observers,targets,results,bUseZ)
+        del rows
+    except Exception, ErrorMessage:
+        if (rows != None): del rows
+        raise Exception, msgWriteOutputFailed % (str(out_fc),str(ErrorMessage) + "\n" + gp.GetMessages())
+    return point_count
+
+def InsertFresnelClearance(gp,rows,surface,observers,targets,results,bUseZ=True):
+    ## inserts the worst points of the results of BatchFresnelClearance
+    ## through an open insert cursor (see WriteFresnelClearance), returns
+    ## the number of points inserted
+    ox,oy,oz = PointElevations(surface,observers,"OFFSETA",bUseZ)
+    tx,ty,tz = PointElevations(surface,targets,None,bUseZ)
+    point_count = 0
+    for obs_index,tgt_index,ratio,worst in results:
+        written = ~numpy.isnan(worst)
+        obs_index,tgt_index,ratio,worst = obs_index[written],tgt_index[written],ratio[written],worst[written]
+        xs = ox[obs_index] + (worst * (tx[tgt_index] - ox[obs_index]))
+        ys = oy[obs_index] + (worst * (ty[tgt_index] - oy[obs_index]))
+        zs = surface.InterpolateArray(xs,ys)
+        dist = worst * GroundDistances(surface,ox[obs_index],oy[obs_index],tx[tgt_index],ty[tgt_index])
+        for k in range(len(obs_index)):
+            pnt = gp.CreateObject("Point")
+            pnt.X = xs[k]
+            pnt.Y = ys[k]
+            if not (numpy.isnan(zs[k])): pnt.Z = zs[k]
+            row = rows.NewRow()
+            row.shape = pnt
+            row.SetValue("OBS_OID",observers[int(obs_index[k])].get("OID",-1))
+            row.SetValue("TGT_OID",targets[int(tgt_index[k])].get("OID",-1))
+            row.SetValue("FRESNEL",float(ratio[k]))
+            row.SetValue("FRES_CLEAR",int(ratio[k] >= FresnelClearanceGoal))
+            row.SetValue("DISTANCE",float(dist[k]))
+            rows.InsertRow(row)
+            point_count = point_count + 1
+    return point_count
+
+def WriteVisibilityMatrix(matrix_file,observers,targets,results,bClearance=False):
+    ## writes the results of BatchLineOfSight to an uncompressed NumPy .npz:
+    ##   visible    uint8 (observers,(targets + 7) / 8), bit (t % 8) of byte
+    ##              t / 8 of row o is set if observer o sees target t
+    ##   clearance  float32 (observers,targets) least height of each sight
+    ##              line above the surface, NaN for pairs not checked
+    ##   obs_oids, tgt_oids  the OIDs of the rows and of the target bits
+    ## The matrices are filled on disk, see ReadVisibilityMatrix to map them.
+    temp_dir = tempfile.mkdtemp(dir=os.path.dirname(os.path.abspath(matrix_file)))
+    try:
+        try:
+            names = ["visible","obs_oids","tgt_oids"]
+            visible = numpy.lib.format.open_memmap(os.path.join(temp_dir,"visible.npy"),"w+",numpy.uint8,
+                                                   (len(observers),Visibility.MaskBytes(len(targets))))
+            visible[:] = 0
+            clearance = None
+            if (bClearance == True):
+                names.append("clearance")
+                clearance = numpy.lib.format.open_memmap(os.path.join(temp_dir,"clearance.npy"),"w+",numpy.float32,
+                                                         (len(observers),len(targets)))
+                clearance[:] = numpy.nan
+            for obs_index,tgt_index,pair_visible,obstruction,pair_clearance in results:
+                seen = pair_visible.astype(numpy.bool_)
+                # one bit position at a time, so no byte is set twice at once
+                for bit in range(8):
+                    pairs = seen & ((tgt_index % 8) == bit)
+                    visible[obs_index[pairs],tgt_index[pairs] / 8] |= numpy.uint8(1 << bit)
+                if (clearance is not None):
+                    clearance[obs_index,tgt_index] = pair_clearance
+            visible.flush()
+            del visible
+            if (clearance is not None):
+                clearance.flush()
+                del clearance
+            numpy.save(os.path.join(temp_dir,"obs_oids.npy"),numpy.array([point.get("OID",-1) for point in observers],numpy.int32))
+            numpy.save(os.path.join(temp_dir,"tgt_oids.npy"),numpy.array([point.get("OID",-1) for point in targets],numpy.int32))
+            # stored, not deflated, so the members can be memory-mapped
+            archive = zipfile.ZipFile(matrix_file,"w",zipfile.ZIP_STORED,True)
+            try:
+                for name in names:
+                    archive.write(os.path.join(temp_dir,name + ".npy"),name + ".npy")
+            finally:
+                archive.close()
+        except Exception, ErrorMessage:
+            raise Exception, msgWriteMatrixFailed % (str(matrix_file),str(ErrorMessage))
+    finally:
+        shutil.rmtree(temp_dir,True)
+    return matrix_file
+
+def MapArchiveArray(npz_file,name):
+    ## memory-maps one array of an uncompressed .npz file read-only (loads
+    ## it if the member is compressed)
+    archive = zipfile.ZipFile(npz_file,"r")
+    try:
+        info = archive.getinfo(name + ".npy")
+    finally:
+        archive.close()
+    if (info.compress_type != zipfile.ZIP_STORED):
+        data = numpy.load(npz_file)
+        try:
+            return data[name]
+        finally:
+            data.close()
+    f = open(npz_file,"rb")
+    try:
+        # the member data follows its local file header
+        f.seek(info.header_offset)
+        header = f.read(30)
+        name_length,extra_length = struct.unpack("<HH",header[26:30])
+        f.seek(info.header_offset + 30 + name_length + extra_length)
+        version = numpy.lib.format.read_magic(f)
+        if (version == (1,0)):
+            shape,fortran_order,dtype = numpy.lib.format.read_array_header_1_0(f)
+        else:
+            shape,fortran_order,dtype = numpy.lib.format.read_array_header_2_0(f)
+        offset = f.tell()
+    finally:
+        f.close()
+    if (fortran_order == True):
+        order = "F"
+    else:
+        order = "C"
+    return numpy.memmap(npz_file,dtype,"r",offset=offset,shape=shape,order=order)
+
+class VisibilityMatrix:
+    #matrix_file
+    def __init__(self,matrix_file):
+        archive = zipfile.ZipFile(matrix_file,"r")
+        try:
+            members = archive.namelist()
+        finally:
+            archive.close()
+        if not ("visible.npy" in members and "obs_oids.npy" in members and "tgt_oids.npy" in members):
+            raise Exception, msgNotVisibilityMatrix % (str(matrix_file))
+        self.MatrixFile = matrix_file
+        self.Visible = MapArchiveArray(matrix_file,"visible")
+        self.Clearance = None
+        if ("clearance.npy" in members):
+            self.Clearance = MapArchiveArray(matrix_file,"clearance")
+        self.ObserverOIDs = numpy.array(MapArchiveArray(matrix_file,"obs_oids"))
+        self.TargetOIDs = numpy.array(MapArchiveArray(matrix_file,"tgt_oids"))
+        self.ObserverIndex = {}
+        for i in range(len(self.ObserverOIDs)):
+            self.ObserverIndex[int(self.ObserverOIDs[i])] = i
+        self.TargetIndex = {}
+        for i in range(len(self.TargetOIDs)):
+            self.TargetIndex[int(self.TargetOIDs[i])] = i
+
+    def GetObserverRow (self,obs_oid):
+        if not (self.ObserverIndex.has_key(obs_oid)):
+            raise Exception, msgNoSuchOID % (str(obs_oid))
+        return self.ObserverIndex[obs_oid]
+
+    def GetTargetColumn (self,tgt_oid):
+        if not (self.TargetIndex.has_key(tgt_oid)):
+            raise Exception, msgNoSuchOID % (str(tgt_oid))
+        return self.TargetIndex[tgt_oid]
+
+    def IsVisible (self,obs_oid,tgt_oid):
+        t = self.GetTargetColumn(tgt_oid)
+        return bool(self.Visible[self.GetObserverRow(obs_oid),t / 8] & (1 << (t % 8)))
+
+    def VisibleRow (self,obs_oid):
+        ## True for the targets (in TargetOIDs order) an observer sees
+        row = numpy.asarray(self.Visible[self.GetObserverRow(obs_oid)])
+        bits = (row[:,numpy.newaxis] >> numpy.arange(8,dtype=numpy.uint8)) & 1
+        return bits.ravel()[:len(self.TargetOIDs)].astype(numpy.bool_)
+
+    def VisibleTargets (self,obs_oid):
+        ## OIDs of the targets an observer sees
+        return self.TargetOIDs[self.VisibleRow(obs_oid)]
+
+    def GetClearance (self,obs_oid,tgt_oid):
+        if (self.Clearance is None):
+            raise Exception, msgNoClearance % (str(self.MatrixFile))
+        return float(self.Clearance[self.GetObserverRow(obs_oid),self.GetTargetColumn(tgt_oid)])
+
+
+def ReadVisibilityMatrix(matrix_file):
+    ## maps a visibility matrix written by WriteVisibilityMatrix
+    return VisibilityMatrix(matrix_file)
@@ -12,7 +12,7 @@
 ##
 ##DATE: 2/27/2007 - orignial coding.
 ##
-##Usage: LinearLineOfSight(<observer x>,<observer y>,<observer offset>,<target x>,<target y>,<target z>,<input surface>,<METERS | FEET>,<output workspace>,<line of sight name>,<obstruction name>,{spatial reference},{TRUE | FALSE})
+##Usage: LinearLineOfSight(<observer x>,<observer y>,<observer offset>,<target x>,<target y>,<target z>,<input surface>,<METERS | FEET>,<output workspace>,<line of sight name>,<obstruction name>,{spatial reference},{TRUE | FALSE},{link frequency})
 ##*********************************************************************************************************************"""
 
 
@@ -33,10 +33,14 @@ msgPlotLibSources = "\n Install the NUMPY and MATPLOTLIB libraries from source o
 msgNUMPYNotAvailable = "The NUMPY library is not avaliable to LLOS." + msgPlotLibSources
 msgPYLABNotAvailable = "The PYLAB (MATPLOTLIB) library is not available to LLOS." + msgPlotLibSources
 msgPlotCloseWindowMessage = "The Linear Line of Sight tool will complete after the plot window is closed."
+msgFresnelNeedsNUMPY = "The NUMPY library is not available, Fresnel zone clearance will not be calculated." + msgPlotLibSources
 
 # status messages
 msgAddingObserver = "Creating observer point at: %s, %s, %s"
 msgAddingTarget = "Creating target point at: %s, %s, %s"
+msgFresnelClearance = "First Fresnel zone clearance at %s MHz: %s, worst at %s, %s (%s along the line)."
+msgFresnelClear = "The first Fresnel zone is clear (%s or more)."
+msgFresnelNotClear = "The first Fresnel zone is NOT clear (less than %s)."
 
 # import libraries
 import os,sys,string, time, types
@@ -69,6 +73,12 @@ output_workspace = gp.GetParameterAsText(8) #<output workspace>
 line_of_sight_name = gp.GetParameterAsText(9) #<line of sight name>
 obstruction_name = gp.GetParameterAsText(10) #<obstruction name>
 spatial_ref = gp.GetParameterAsText(11) #{spatial reference}
+if (len(sys.argv) > 16):
+    link_frequency = gp.GetParameterAsText(15) #{link frequency} (MHz)
+else:
+    link_frequency = "#"
+if (link_frequency == None or link_frequency == ""):
+    link_frequency = "#"
 
 
 try:
@@ -176,12 +186,18 @@ try:
         print "clipped surface"
         gp.AddMessage("clipped surface")
     
+    # Create observer and target points, both spots are interpolated in one call
+    observer_point = Observer.Observer(gp)
+    observer_point.X = observer_x
+    observer_point.Y = observer_y
+    target_point = Observer.Observer(gp)
+    target_point.X = target_x
+    target_point.Y = target_y
+    spots = Observer.InterpolateObserversZ(gp,[observer_point,target_point],input_surface,"BILINEAR")
+    
     # Create observer point
     try:
-        observer_point = Observer.Observer(gp)
-        observer_point.X = observer_x
-        observer_point.Y = observer_y
-        observer_spot = observer_point.InterpolateZ(gp,input_surface,"BILINEAR")
+        observer_spot = spots[0]
         if (observer_spot == None):
             raise Exception, msgCouldNotInterpolateZ
         observer_point.Z = float(observer_spot) + float(observer_offset)
@@ -197,12 +213,7 @@ try:
     
     # Create target point
     try:
-        target_point = Observer.Observer(gp)
-        target_point.X = target_x
-        target_point.Y = target_y
-        
-        target_spot = target_point.InterpolateZ(gp,input_surface,"BILINEAR")
-        
+        target_spot = spots[1]
         if (target_spot == None):
             raise Exception, msgCouldNotInterpolateZ
         target_point.Z = float(target_spot) + float(target_offset)
@@ -301,6 +312,33 @@ try:
         gp.AddMessage("Target is VISIBLE.")
     del vis_row, vis_rows
     
+    # Fresnel zone clearance of the link, from the same observer and target,
+    # reported as messages since the tool has no outputs for it
+    fresnel_ratio = None
+    if (link_frequency != "#"):
+        try:
+            import numpy, Surface, LineOfSight, Profile
+        except ImportError:
+            gp.AddWarning(msgFresnelNeedsNUMPY)
+        else:
+            x1,y1 = float(observer_point.X),float(observer_point.Y)
+            x2,y2 = float(target_point.X),float(target_point.Y)
+            # only the cells under the link are read
+            surface = Surface.SurfaceFromExtent(gp,input_surface,[min(x1,x2),min(y1,y2),max(x1,x2),max(y1,y2)],tempworkspace[1])
+            wavelength = LineOfSight.Wavelength(float(link_frequency),Profile.ZUnitFactor(gp,surface.SpatialReference,"meters"))
+            # radio links always see the earth bulge, under a radio atmosphere
+            ratio,worst = LineOfSight.FresnelClearance(surface,[x1],[y1],[observer_point.Z],[x2],[y2],[target_point.Z],wavelength,1,
+                                                       LineOfSight.DefaultSamplesPerCell,True,LineOfSight.RadioRefraction)
+            fresnel_ratio = float(ratio[0])
+            if not (numpy.isnan(worst[0])):
+                worst_x = x1 + (float(worst[0]) * (x2 - x1))
+                worst_y = y1 + (float(worst[0]) * (y2 - y1))
+                gp.AddMessage(msgFresnelClearance % (str(link_frequency),str(fresnel_ratio),str(worst_x),str(worst_y),str(float(worst[0]))))
+            if (fresnel_ratio >= LineOfSight.FresnelClearanceGoal):
+                gp.AddMessage(msgFresnelClear % (str(LineOfSight.FresnelClearanceGoal)))
+            else:
+                gp.AddMessage(msgFresnelNotClear % (str(LineOfSight.FresnelClearanceGoal)))
+    
     # mfunk 2/6/2008 - drop this guy
     #if (plot == True):
     #    # check that numpy and pylab (matplotlib) libraries have been installed.
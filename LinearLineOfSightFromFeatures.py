@@ -12,7 +12,7 @@
 ##
 ##DATE: 
 ##
-##Usage: LinearLineOfSightFromFeatures_ma(<observer_points>,<target_points>,<input_surface>,<output_workspace>,<line_of_sight_name>,<obstruction_name>,{ALL | MATCH})
+##Usage: LinearLineOfSightFromFeatures_ma(<observer_points>,<target_points>,<input_surface>,<output_workspace>,<line_of_sight_name>,<obstruction_name>,{ALL | MATCH},{LICENSED | NATIVE},{visibility_matrix_file},{NO_CLEARANCE | CLEARANCE},{link_frequency},{fresnel_points})
 ##*********************************************************************************************************************"""
 
 
@@ -33,6 +33,14 @@ msgObserversNotPoints = "Input observers are not points."
 msgTargetsNotPoints = "Input targets are not points."
 msgObserversOutsideSurface = "Observer's extent falls outside of surface extent."
 msgTargetsOutsideSurface = "Target's extent falls outside of surface extent."
+msgNUMPYNotAvailable = "The NUMPY library is not available for the NATIVE visibility engine.\n NUMPY: http://www.scipy.org/"
+msgUsingNativeEngine = "No 3D Analyst license available, using the NATIVE visibility engine."
+msgNativeLOS = "Calculating lines of sight with the NATIVE visibility engine."
+msgMatrixNeedsNative = "Visibility matrices are only written by the NATIVE visibility engine, no matrix file will be written."
+msgWritingVisibilityMatrix = "Writing visibility matrix to %s, line of sight features will not be written."
+msgFresnelNeedsBoth = "Fresnel zone clearance needs both a link frequency and an output feature class, no clearance will be written."
+msgFresnelClearance = "Calculating Fresnel zone clearance at %s MHz."
+msgFresnelLinks = "Wrote the worst Fresnel zone clearance point of %s links to %s."
 
 debug = False
 
@@ -59,14 +67,47 @@ if (len(sys.argv) > 7):
     match_method = gp.GetParameterAsText(6) # <ALL | MATCH>
 else:
     match_method = "ALL"
+if (len(sys.argv) > 10):
+    visibility_engine = gp.GetParameterAsText(9) # <LICENSED | NATIVE>
+else:
+    visibility_engine = "#"
+if (len(sys.argv) > 11):
+    visibility_matrix_file = gp.GetParameterAsText(10) # {visibility_matrix_file} (.npz)
+else:
+    visibility_matrix_file = "#"
+if (visibility_matrix_file == None or visibility_matrix_file == ""):
+    visibility_matrix_file = "#"
+if (len(sys.argv) > 12):
+    clearance_option = gp.GetParameterAsText(11) # <NO_CLEARANCE | CLEARANCE>
+else:
+    clearance_option = "NO_CLEARANCE"
+if (len(sys.argv) > 13):
+    link_frequency = gp.GetParameterAsText(12) # {link_frequency} (MHz)
+else:
+    link_frequency = "#"
+if (link_frequency == None or link_frequency == ""):
+    link_frequency = "#"
+if (len(sys.argv) > 14):
+    out_fresnel = gp.GetParameterAsText(13) # {fresnel_points}
+else:
+    out_fresnel = "#"
+if (out_fresnel == None or out_fresnel == ""):
+    out_fresnel = "#"
 
 try:
     
     # check for 3D license
-    if (MAScriptUtils.CheckFor3DAnalystLicense(gp) != True):
+    # (or NATIVE engine, which does not need it)
+    bUseNative = False
+    if (visibility_engine == "NATIVE"):
+        bUseNative = True
+    elif (MAScriptUtils.CheckFor3DAnalystLicense(gp) == True):
+        gp.CheckOutExtension("3d")
+    elif (visibility_engine == "LICENSED"):
         raise Exception, msgNo3DLicense
     else:
-        gp.CheckOutExtension("3d")
+        bUseNative = True
+        gp.AddWarning(msgUsingNativeEngine)
     
     # set temp workspace
     tempworkspace = MAScriptUtils.GetTempWorkspace(gp)
@@ -178,6 +219,10 @@ try:
     #SpatialGrid2 = params[3]
     #SpatialGrid3 = params[4]
 
+    # the licensed ALL lines need every point at once, MATCH pairs and the
+    # NATIVE engine read the points as they go
+    bReadAllPoints = (bUseNative == False and match_method != "MATCH")
+    
     # get list of observer points (x,y,z for each)
     observers = []
     z_list = []
@@ -188,27 +233,28 @@ try:
     else:
         bObsZEnabled = False
         
-    # Create search cursor
-    rows = gp.SearchCursor(observer_points)
-    row = rows.Next()
-    # Enter while loop for each feature/row
-    while row:
-        feat = row.GetValue(obs_shape_field)
-        pnt = feat.GetPart()
-        coords = []
-        coords.append(pnt.x)
-        coords.append(pnt.y)
-        if bObsZEnabled == True:
-            coords.append(pnt.z)
-            z_list.append(pnt.z)
-        observers.append(coords)
+    if (bReadAllPoints == True):
+        # Create search cursor
+        rows = gp.SearchCursor(observer_points)
         row = rows.Next()
-    del rows
-    del row
-    if debug == True:
-        msg = " " + "observers: " + str(observers)
-        #print msg
-        gp.AddMessage(msg)
+        # Enter while loop for each feature/row
+        while row:
+            feat = row.GetValue(obs_shape_field)
+            pnt = feat.GetPart()
+            coords = []
+            coords.append(pnt.x)
+            coords.append(pnt.y)
+            if bObsZEnabled == True:
+                coords.append(pnt.z)
+                z_list.append(pnt.z)
+            observers.append(coords)
+            row = rows.Next()
+        del rows
+        del row
+        if debug == True:
+            msg = " " + "observers: " + str(observers)
+            #print msg
+            gp.AddMessage(msg)
     
     # get list of target points (x,y,z for each)
     targets = []
@@ -218,27 +264,28 @@ try:
         bTgtZEnabled = True
     else:
         bTgtZEnabled = False
-    # Create search cursor
-    rows = gp.SearchCursor(target_points)
-    row = rows.Next()
-    # Enter while loop for each feature/row
-    while row:
-        feat = row.GetValue(tgt_shape_field)
-        pnt = feat.GetPart()
-        coords = []
-        coords.append(pnt.x)
-        coords.append(pnt.y)
-        if bTgtZEnabled == True:
-            coords.append(pnt.z)
-            z_list.append(pnt.z)
-        targets.append(coords)
+    if (bReadAllPoints == True):
+        # Create search cursor
+        rows = gp.SearchCursor(target_points)
         row = rows.Next()
-    del rows
-    del row
-    if debug == True:
-        msg = " " + "targets: " + str(targets)
-        #print msg
-        gp.AddMessage(msg)
+        # Enter while loop for each feature/row
+        while row:
+            feat = row.GetValue(tgt_shape_field)
+            pnt = feat.GetPart()
+            coords = []
+            coords.append(pnt.x)
+            coords.append(pnt.y)
+            if bTgtZEnabled == True:
+                coords.append(pnt.z)
+                z_list.append(pnt.z)
+            targets.append(coords)
+            row = rows.Next()
+        del rows
+        del row
+        if debug == True:
+            msg = " " + "targets: " + str(targets)
+            #print msg
+            gp.AddMessage(msg)
     
     # need to set the ZDomain for the spatial reference
     zmin = 0.0
@@ -260,157 +307,269 @@ try:
     if (DatabaseType == "LocalDatabase"):
         gp.ZDomain = str(zmin) + " " + str(zmax) # only works on File GDB
     
-    #create temp LOS
-    templos = MAScriptUtils.GenerateTempFileName(gp,tempworkspace[1],"FeatureClass")
-    try:
-        result = gp.CreateFeatureClass(tempworkspace[1],os.path.basename(templos),"POLYLINE","#","#","DISABLED",spatial_ref,"#","#","#","#") #ConfigKeyword,SpatialGrid1,SpatialGrid2,SpatialGrid3)
-        result_msg = result.GetMessages()
-        if (debug == True):
-            msg = " " + "writing to: " + str(templos)
-            #print msg  -- Raj
-            gp.AddMessage(msg)
-    except:
-        raise Exception, msgCreateTempFailed % (gp.GetMessages())
+    # perhaps read these from Registry?
+    bUseCurvature = False
+    refraction_factor = 0.13
     
-    # add make lines from the observers to the targets
-    if (match_method == "ALL"):
-        rows = gp.InsertCursor(templos)
-        lineArray = gp.CreateObject("Array")
-        obs_pnt = gp.CreateObject("Point")
-        tgt_pnt = gp.CreateObject("Point")
+    if (bUseNative == True):
+        try:
+            import Surface, Visibility, LineOfSight, VirtualMosaic
+        except ImportError:
+            raise Exception, msgNUMPYNotAvailable
+        gp.AddMessage(msgNativeLOS)
+        print msgNativeLOS
+        
+        # surface covering all observers and targets, a catalog is read
+        # through a virtual mosaic instead of a temp mosaic raster and a
+        # raster dataset is clipped to them before it is loaded
+        tempsurface = ""
+        los_extent = [min(obs_extent[0],tgt_extent[0]),min(obs_extent[1],tgt_extent[1]),
+                      max(obs_extent[2],tgt_extent[2]),max(obs_extent[3],tgt_extent[3])]
+        if (bCatalog == True):
+            surface = VirtualMosaic.SurfaceFromCatalog(gp,input_surface,los_extent,tempworkspace[1])
+        else:
+            surface = Surface.SurfaceFromExtent(gp,input_surface,los_extent,tempworkspace[1])
+        
+        # point Z and offsets are used in both ALL and MATCH mode
+        bUseZ = True
+        # a matrix without clearances only needs TarIsVis, the lines are marched
+        bVisibleOnly = (visibility_matrix_file != "#" and clearance_option != "CLEARANCE")
+        try:
+            if (match_method == "MATCH" and visibility_matrix_file == "#"):
+                # matched pairs are read from both cursors a block at a time
+                matched = LineOfSight.MatchedPoints(gp,observer_points,target_points)
+                LineOfSight.WriteMatchedLineOfSight(gp,out_los,out_obstructions,spatial_ref,surface,matched,
+                                                    LineOfSight.DefaultSamplesPerCell,bUseCurvature,refraction_factor,bUseZ)
+                if (matched.Unmatched == True):
+                    gp.AddWarning(msgDifferentInputNumbers)
+            else:
+                native_observers = Visibility.ReadObservers(gp,observer_points)
+                native_targets = Visibility.ReadObservers(gp,target_points)
+                if (match_method == "MATCH"):
+                    if (len(native_observers) != len(native_targets)):
+                        gp.AddWarning(msgDifferentInputNumbers)
+                    pairs = LineOfSight.MatchPairs(native_observers,native_targets)
+                else:
+                    # only targets within each observer's RADIUS2 and sector
+                    pairs = LineOfSight.CandidatePairs(surface,native_observers,native_targets)
+                results = LineOfSight.BatchLineOfSight(surface,native_observers,native_targets,pairs,
+                                                       LineOfSight.DefaultSamplesPerCell,bUseCurvature,refraction_factor,bUseZ,bVisibleOnly)
+                if (visibility_matrix_file != "#"):
+                    # only the answers, indexed by observer and target OIDs
+                    gp.AddMessage(msgWritingVisibilityMatrix % (visibility_matrix_file))
+                    LineOfSight.WriteVisibilityMatrix(visibility_matrix_file,native_observers,native_targets,results,
+                                                      (clearance_option == "CLEARANCE"))
+                else:
+                    LineOfSight.WriteLineOfSight(gp,out_los,out_obstructions,spatial_ref,surface,native_observers,native_targets,results,
+                                                 LineOfSight.DefaultSamplesPerCell,bUseCurvature,refraction_factor,bUseZ)
+        except Exception, ErrorMessage:
+            raise Exception, (msgLOSFailed % (str(ErrorMessage)))
         
-        linecounter = 1
-        o = 1
-        for obspt in observers:
-            t = 1
-            for tgtpt in targets:
+    else:
+        if (visibility_matrix_file != "#"): gp.AddWarning(msgMatrixNeedsNative)
+        
+        # MATCH lines carry the point Z (and offsets) when both inputs have Z
+        bMatchZ = (match_method == "MATCH" and bObsZEnabled == True and bTgtZEnabled == True)
+        los_has_z = "DISABLED"
+        if (bMatchZ == True):
+            los_has_z = "ENABLED"
+        
+        #create temp LOS
+        templos = MAScriptUtils.GenerateTempFileName(gp,tempworkspace[1],"FeatureClass")
+        try:
+            result = gp.CreateFeatureClass(tempworkspace[1],os.path.basename(templos),"POLYLINE","#","#",los_has_z,spatial_ref,"#","#","#","#") #ConfigKeyword,SpatialGrid1,SpatialGrid2,SpatialGrid3)
+            result_msg = result.GetMessages()
+            if (debug == True):
+                msg = " " + "writing to: " + str(templos)
+                #print msg  -- Raj
+                gp.AddMessage(msg)
+        except:
+            raise Exception, msgCreateTempFailed % (gp.GetMessages())
+    
+        # add make lines from the observers to the targets
+        if (match_method == "ALL"):
+            rows = gp.InsertCursor(templos)
+            lineArray = gp.CreateObject("Array")
+            obs_pnt = gp.CreateObject("Point")
+            tgt_pnt = gp.CreateObject("Point")
+        
+            linecounter = 1
+            o = 1
+            for obspt in observers:
+                t = 1
+                for tgtpt in targets:
                 
-                if (debug == True):
-                    msg = " " + "obs " + str(o) + " of " + str(len(observers)) + ", tgt " + str(t) + " of " + str(len(targets))
-                    # print msg -- Raj
+                    if (debug == True):
+                        msg = " " + "obs " + str(o) + " of " + str(len(observers)) + ", tgt " + str(t) + " of " + str(len(targets))
+                        # print msg -- Raj
 
-                # if observer and target are at same coordinates, skip the points
-                if ((obspt[0] == tgtpt[0]) and (obspt[1] == tgtpt[1])):
-                    msg = " " + str(linecounter) + " - skipping " + str(obspt) + " and " + str(tgtpt)
-                    #print msg 
-                    gp.AddMessage(msg)
-                    
-                else:
-                    if debug == True:
-                        msg = " " + str(linecounter) + " - matching " + str(obspt) + " to " + str(tgtpt)
-                        #print msg   - Raj
+                    # if observer and target are at same coordinates, skip the points
+                    if ((obspt[0] == tgtpt[0]) and (obspt[1] == tgtpt[1])):
+                        msg = " " + str(linecounter) + " - skipping " + str(obspt) + " and " + str(tgtpt)
+                        #print msg 
                         gp.AddMessage(msg)
-                    try:
+                    
+                    else:
+                        if debug == True:
+                            msg = " " + str(linecounter) + " - matching " + str(obspt) + " to " + str(tgtpt)
+                            #print msg   - Raj
+                            gp.AddMessage(msg)
+                        try:
                         
-                        obs_pnt.X = obspt[0]
-                        obs_pnt.Y = obspt[1]
-                        if (bObsZEnabled == True):
-                            obs_pnt.Z = obspt[2]
-                        lineArray.add(obs_pnt)
+                            obs_pnt.X = obspt[0]
+                            obs_pnt.Y = obspt[1]
+                            if (bObsZEnabled == True):
+                                obs_pnt.Z = obspt[2]
+                            lineArray.add(obs_pnt)
                         
-                        tgt_pnt.X = tgtpt[0]
-                        tgt_pnt.Y = tgtpt[1]
-                        if (bTgtZEnabled == True):
-                            tgt_pnt.Z = tgtpt[2]
-                        lineArray.add(tgt_pnt)
+                            tgt_pnt.X = tgtpt[0]
+                            tgt_pnt.Y = tgtpt[1]
+                            if (bTgtZEnabled == True):
+                                tgt_pnt.Z = tgtpt[2]
+                            lineArray.add(tgt_pnt)
                         
-                        row = rows.NewRow()
-                        row.shape = lineArray
-                        rows.InsertRow(row)
+                            row = rows.NewRow()
+                            row.shape = lineArray
+                            rows.InsertRow(row)
     
-                        lineArray.RemoveAll()
+                            lineArray.RemoveAll()
                         
-                    except:
-                        raise Exception, msgCreateTempFailed % (gp.GetMessages())
+                        except:
+                            raise Exception, msgCreateTempFailed % (gp.GetMessages())
                     
-                linecounter += 1
-                t += 1   
-            o += 1
-        del lineArray
-        del obs_pnt
-        del tgt_pnt
-        del row
-        del rows
+                    linecounter += 1
+                    t += 1   
+                o += 1
+            del lineArray
+            del obs_pnt
+            del tgt_pnt
+            del row
+            del rows
         
 
-    else: # match_method == "MATCH"
-        if (len(observers) != len(targets)):
-            gp.AddWarning(msgDifferentInputNumbers)
-        counter = 0
-        rows = gp.InsertCursor(templos)
-        lineArray = gp.CreateObject("Array")
-        obs_pnt = gp.CreateObject("Point")
-        tgt_pnt = gp.CreateObject("Point")
-        while counter <= (min(len(observers),len(targets)) - 1):
-            obspt = observers[counter]
-            tgtpt = targets[counter]
-            if debug == True:
-                msg = " " + "matching " + str(obspt) + " to " + str(tgtpt)
-                # print msg -- Raj
-                gp.AddMessage(msg)
-                
-            try:
-                obs_pnt.X = obspt[0]
-                obs_pnt.Y = obspt[1]
-                #if (bObsZEnabled == True):
-                #    obs_pnt.Z = obspt[2]
-                lineArray.add(obs_pnt)
+        else: # match_method == "MATCH"
+            # observers and targets are read in lockstep, one pair at a time
+            obs_fields = MAScriptUtils.GetFieldNames(gp,observer_points)
+            obs_rows = gp.SearchCursor(observer_points)
+            tgt_rows = gp.SearchCursor(target_points)
+            obs_row = obs_rows.Next()
+            tgt_row = tgt_rows.Next()
+            rows = gp.InsertCursor(templos)
+            row = None
+            lineArray = gp.CreateObject("Array")
+            obs_pnt = gp.CreateObject("Point")
+            tgt_pnt = gp.CreateObject("Point")
+            while (obs_row and tgt_row):
+                obspt = obs_row.GetValue(obs_shape_field).GetPart()
+                tgtpt = tgt_row.GetValue(tgt_shape_field).GetPart()
+                if debug == True:
+                    msg = " " + "matching " + str([obspt.x,obspt.y]) + " to " + str([tgtpt.x,tgtpt.y])
+                    # print msg -- Raj
+                    gp.AddMessage(msg)
                 
-                tgt_pnt.X = tgtpt[0]
-                tgt_pnt.Y = tgtpt[1]
-                #if (bTgtZEnabled == True):
-                #    tgt_pnt.Z = tgtpt[2]
-                lineArray.add(tgt_pnt)
+                try:
+                    obs_pnt.X = obspt.x
+                    obs_pnt.Y = obspt.y
+                    tgt_pnt.X = tgtpt.x
+                    tgt_pnt.Y = tgtpt.y
+                    if (bMatchZ == True):
+                        # observer raised by its OFFSETA, target by the observer's OFFSETB
+                        offseta = 0.0
+                        offsetb = 0.0
+                        if ("OFFSETA" in obs_fields and obs_row.GetValue("OFFSETA") != None):
+                            offseta = float(obs_row.GetValue("OFFSETA"))
+                        if ("OFFSETB" in obs_fields and obs_row.GetValue("OFFSETB") != None):
+                            offsetb = float(obs_row.GetValue("OFFSETB"))
+                        obs_pnt.Z = obspt.z + offseta
+                        tgt_pnt.Z = tgtpt.z + offsetb
+                    lineArray.add(obs_pnt)
+                    lineArray.add(tgt_pnt)
                 
-                #add the line to the temp file
-                row = rows.NewRow()
-                row.shape = lineArray
-                rows.InsertRow(row)
-                lineArray.RemoveAll()
+                    #add the line to the temp file
+                    row = rows.NewRow()
+                    row.shape = lineArray
+                    rows.InsertRow(row)
+                    lineArray.RemoveAll()
                 
-            except:
-                raise Exception, msgCreateTempFailed % (gp.GetMessages())
-            counter += 1
+                except:
+                    raise Exception, msgCreateTempFailed % (gp.GetMessages())
+                obs_row = obs_rows.Next()
+                tgt_row = tgt_rows.Next()
+            if (obs_row or tgt_row):
+                gp.AddWarning(msgDifferentInputNumbers)
             
-        del lineArray
-        del obs_pnt
-        del tgt_pnt
-        del row
-        del rows
+            del lineArray
+            del obs_pnt
+            del tgt_pnt
+            del row
+            del rows
+            del obs_row, obs_rows
+            del tgt_row, tgt_rows
   
-    # get temp surface
-    tempsurface = ""
-    if (bCatalog == True):
-        # get the LOS extent
-        los_extent = gp.describe(templos).Extent
-        los_extent = [los_extent.xmin,los_extent.ymin,los_extent.xmax,los_extent.ymax]
-        # TODO: check results of string return?
-        tempsurface = MAScriptUtils.GenerateTempFileName(gp,tempworkspace[1],"RasterDataset")
-        tempsurface = MAScriptUtils.MosaicAndClip(gp,input_surface,tempsurface,los_extent)
-        if (tempsurface == None):
-            raise Exception, "Internal Error: Could not mosaic catalog."
-        input_surface = tempsurface
+        # get temp surface
+        tempsurface = ""
+        if (bCatalog == True):
+            # get the LOS extent
+            los_extent = gp.describe(templos).Extent
+            los_extent = [los_extent.xmin,los_extent.ymin,los_extent.xmax,los_extent.ymax]
+            # TODO: check results of string return?
+            tempsurface = MAScriptUtils.GenerateTempFileName(gp,tempworkspace[1],"RasterDataset")
+            tempsurface = MAScriptUtils.MosaicAndClip(gp,input_surface,tempsurface,los_extent)
+            if (tempsurface == None):
+                raise Exception, "Internal Error: Could not mosaic catalog."
+            input_surface = tempsurface
   
-    # perhaps read these from Registry?
-    bUseCurvature = False
-    refraction_factor = 0.13
+        # 3D - LOS
+        try:
+            gp.LineOfSight_3d(input_surface,templos,out_los,out_obstructions,bUseCurvature,bUseCurvature,refraction_factor)
+        except:
+            gpmessages = gp.GetMessages()
+            raise Exception, (msgLOSFailed % (gpmessages))
   
-    # 3D - LOS
-    try:
-        gp.LineOfSight_3d(input_surface,templos,out_los,out_obstructions,bUseCurvature,bUseCurvature,refraction_factor)
-    except:
-        gpmessages = gp.GetMessages()
-        raise Exception, (msgLOSFailed % (gpmessages))
-  
-    # return the 3D license.
-    gp.CheckInExtension("3d")
+        # return the 3D license.
+        gp.CheckInExtension("3d")
+    
+    # Fresnel zone clearance of each link, on the same surface and pairs
+    if (link_frequency != "#" and out_fresnel != "#"):
+        try:
+            import Surface, Visibility, LineOfSight, Profile
+        except ImportError:
+            raise Exception, msgNUMPYNotAvailable
+        gp.AddMessage(msgFresnelClearance % (str(link_frequency)))
+        print msgFresnelClearance % (str(link_frequency))
+        if (bUseNative == False):
+            # only the cells under the links are read
+            link_extent = [min(obs_extent[0],tgt_extent[0]),min(obs_extent[1],tgt_extent[1]),
+                           max(obs_extent[2],tgt_extent[2]),max(obs_extent[3],tgt_extent[3])]
+            surface = Surface.SurfaceFromExtent(gp,input_surface,link_extent,tempworkspace[1])
+        wavelength = LineOfSight.Wavelength(float(link_frequency),Profile.ZUnitFactor(gp,surface.SpatialReference,"meters"))
+        # radio links always see the earth bulge, under a radio atmosphere
+        try:
+            if (match_method == "MATCH"):
+                matched = LineOfSight.MatchedPoints(gp,observer_points,target_points)
+                link_count = LineOfSight.WriteMatchedFresnelClearance(gp,out_fresnel,spatial_ref,surface,matched,wavelength,1,
+                                                                      LineOfSight.DefaultSamplesPerCell,True,LineOfSight.RadioRefraction,True)
+            else:
+                if not ("native_observers" in globals()):
+                    native_observers = Visibility.ReadObservers(gp,observer_points)
+                    native_targets = Visibility.ReadObservers(gp,target_points)
+                pairs = LineOfSight.CandidatePairs(surface,native_observers,native_targets)
+                results = LineOfSight.BatchFresnelClearance(surface,native_observers,native_targets,pairs,wavelength,1,
+                                                            LineOfSight.DefaultSamplesPerCell,True,LineOfSight.RadioRefraction,True)
+                link_count = LineOfSight.WriteFresnelClearance(gp,out_fresnel,spatial_ref,surface,native_observers,native_targets,results,True)
+        except Exception, ErrorMessage:
+            raise Exception, (msgLOSFailed % (str(ErrorMessage)))
+        gp.AddMessage(msgFresnelLinks % (str(link_count),str(out_fresnel)))
+    elif (link_frequency != "#" or out_fresnel != "#"):
+        gp.AddWarning(msgFresnelNeedsBoth)
     
     # set the output
-    gp.SetParameter(7,out_los)
-    gp.SetParameter(8,out_obstructions)
+    if (bUseNative == False or visibility_matrix_file == "#"):
+        gp.SetParameter(7,out_los)
+        gp.SetParameter(8,out_obstructions)
     
     # remove temp datasets
-    if (gp.Exists(templos) == True):
+    if ("templos" in globals() and gp.Exists(templos) == True):
         gp.Delete(templos)
     if (gp.Exists(tempsurface) == True):
         gp.Delete(tempsurface)
@@ -419,7 +578,8 @@ try:
     
 except Exception, ErrorMessage:
     # return the 3D license.
-    gp.CheckInExtension("3d")
+    if ("bUseNative" in globals() and bUseNative == False):
+        gp.CheckInExtension("3d")
     # remove temp datasets
     if ("tempsurface" in globals()):
         gp.Delete(tempsurface)
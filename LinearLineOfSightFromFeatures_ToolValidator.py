@@ -45,6 +45,32 @@ class ToolValidator:
     self.params[8].Schema.FieldsRule = "All"
     self.params[8].Schema.AdditionalFields = [SourceOID_field]
     
+    # 9 - 13 are optional, a toolbox that does not declare them still opens
+    # 9 - Visibility engine (LICENSED | NATIVE)
+    if (len(self.params) > 9):
+        self.params[9].Filter.Type = "ValueList"
+        self.params[9].Filter.List = ["LICENSED","NATIVE"]
+    # 10 - Visibility matrix file (.npz)
+    # 11 - Clearance (NO_CLEARANCE | CLEARANCE)
+    if (len(self.params) > 11):
+        self.params[11].Filter.Type = "ValueList"
+        self.params[11].Filter.List = ["NO_CLEARANCE","CLEARANCE"]
+        self.params[11].Value = "NO_CLEARANCE"
+    # 12 - Link frequency (MHz)
+    # 13 - Output Fresnel zone clearance points FC
+    if (len(self.params) > 13):
+        OBS_OID_field = self.makeField("OBS_OID", "LONG", "8", "8", "12")
+        TGT_OID_field = self.makeField("TGT_OID", "LONG", "8", "8", "12")
+        FRESNEL_field = self.makeField("FRESNEL", "DOUBLE", "12", "6", "16")
+        FRES_CLEAR_field = self.makeField("FRES_CLEAR", "SHORT", "4", "4", "8")
+        DISTANCE_field = self.makeField("DISTANCE", "DOUBLE", "12", "3", "16")
+        self.params[13].Schema.FeatureTypeRule = "AsSpecified"
+        self.params[13].Schema.FeatureType = "Simple"
+        self.params[13].Schema.GeometryTypeRule = "AsSpecified"
+        self.params[13].Schema.GeometryType = "Point"
+        self.params[13].Schema.FieldsRule = "All"
+        self.params[13].Schema.AdditionalFields = [OBS_OID_field,TGT_OID_field,FRESNEL_field,FRES_CLEAR_field,DISTANCE_field]
+    
     return
 
   def updateParameters(self):
@@ -118,6 +144,11 @@ class ToolValidator:
         if (surftype != "RasterDataset" and surftype != "RasterCatalog"):
             self.params[2].SetErrorMessage("Input surface must be a raster dataset or raster catalog")
     
+    # link frequency must be positive
+    if (len(self.params) > 12 and self.params[12].Altered == True and self.params[12].Value != None and str(self.params[12].Value) != ""):
+        if (float(self.params[12].Value) <= 0.0):
+            self.params[12].SetErrorMessage("Link frequency must be greater than zero MHz.")
+    
     # check that output line of sight does not exist
     if self.params[3].Altered == True or self.params[4].Altered == True: 
         workspace = str(self.params[3].Value)
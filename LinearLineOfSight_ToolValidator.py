@@ -47,6 +47,9 @@ class ToolValidator:
     self.params[13].Schema.FieldsRule = "All"
     self.params[13].Schema.AdditionalFields = [SourceOID_field]
     # 14 - Output Target is visible (boolean)
+    # 15 - Link frequency (MHz)
+    # 16 - Output Fresnel zone clearance ratio (double)
+    # 17 - Output worst Fresnel zone clearance point (x y)
     
     return
 
@@ -17,6 +17,17 @@ import MAScriptUtils
 # locals
 debug = False
 
+# footprint index of a catalog (see BuildCatalogIndex): a table beside the
+# catalog with one row per raster keyed by the quad holding its footprint
+CatalogIndexSuffix = "_MAIDX"
+CatalogIndexLevels = 24
+CatalogIndexHeader = "#"
+
+# GP pixel type names for CreateRasterDataset by Describe PixelType
+PixelTypeNames = {"U1":"1_BIT","U2":"2_BIT","U4":"4_BIT","U8":"8_BIT_UNSIGNED","S8":"8_BIT_SIGNED",
+                  "U16":"16_BIT_UNSIGNED","S16":"16_BIT_SIGNED","U32":"32_BIT_UNSIGNED","S32":"32_BIT_SIGNED",
+                  "F32":"32_BIT_FLOAT"}
+
 #def __main__(patternDictionary,patternKeys):
 #    patternDictionary = MAScriptUtils.RegExPatterns()
 #    patternKeys = patternDictionary.keys()
@@ -288,6 +299,24 @@ def GetMAOptions(gp):
     if (debug == True): print "Leaving GetMAOptions"
     return options
 
+def GetTerrainCurvatureOptions(gp):
+    ## returns [bUseCurvature,refraction_factor] from the MA Terrain options
+    ## defaults to a flat earth with the standard refraction coefficient
+    bUseCurvature = False
+    refraction_factor = 0.13
+    options = GetMAOptions(gp)
+    if (options.has_key("Terrain") == True):
+        terrain_options = options["Terrain"]
+        use_curve = str(terrain_options.get("TerrainUseCurveRefraction","False"))
+        if (use_curve == "True" or use_curve == "1"):
+            bUseCurvature = True
+        try:
+            refraction_factor = float(terrain_options["TerrainRefraction"])
+        except:
+            # TerrainRefraction missing or not stored as a double
+            refraction_factor = 0.13
+    return [bUseCurvature,refraction_factor]
+
 def ZFactor(gp,in_dataset):
     ## returns the Z-Factor of the input GCS dataset
     zfactor = None
@@ -521,23 +550,9 @@ def MosaicAndClip(gp,inMACatalog,outRaster,clip_extent):
         else:
             bDoNotClip = True
         
-        # get highest and lowest DTED level available - GP error messages are handled internally - filters for MA catalog
-        dtedTypes = MAScriptUtils.ReturnDTEDTypes(gp,inMACatalog)
-        if (dtedTypes == None or len(dtedTypes) < 1):  return None
-        
-        # determine the minimum and maximum DTED level
-        maxLevel = -1
-        minLevel = 100
-        for level in dtedTypes:
-            #trim characters from string, return number only
-            ilevel = int(level[11:])
-            if (ilevel > maxLevel):
-                maxLevel = ilevel
-            pass
-            if (ilevel < minLevel):
-                minLevel = ilevel
-            pass
-        DTEDLevel = "DTED Level " + str(minLevel)
+        # get lowest DTED level available - GP error messages are handled internally - filters for MA catalog
+        DTEDLevel = MAScriptUtils.LowestDTEDLevel(gp,inMACatalog)
+        if (DTEDLevel == None):  return None
         gp.AddMessage("Using %s for processing." % (DTEDLevel)) 
         
         # make where clause string for search cursor
@@ -552,77 +567,109 @@ def MosaicAndClip(gp,inMACatalog,outRaster,clip_extent):
         
         
         startlist = []
-        # Get an search cursor for the input catalog
-        rows = gp.SearchCursor(inMACatalog,whereclausestring)
-        row = rows.next()
         recordCount = 0
         listCount = 0
-        while row :
-            recordCount += 1
-            # Get row attributes
-            objectId = row.GetValue(objectIdField)
-            geometry = row.GetValue(geometryField)
-            name = row.GetValue(nameField)
-
-            # get envelope of the row
-            featureEnvelope = geometry.Extent
-            featureEnvelope = str(featureEnvelope).split(" ")
-            featureEnvelope = [featureEnvelope[0],featureEnvelope[1],featureEnvelope[2],featureEnvelope[3]]
-
-            # does this raster fall within the desired extents?
-            #@@envelopeInExtent = envelopeContainsEnvelope(featureEnvelope, clip_extent)
-            if (bDoNotClip == False and len(clip_extent) != 0):
-                envelopeInExtent = EnvelopeRelation(gp,featureEnvelope,clip_extent)
-            else:
-                envelopeInExtent = 256
-            
-            # if it does, add it to the list
-            #@@if envelopeInExtent :
-            if (envelopeInExtent != -1):
+        # candidate rasters from the catalog's footprint index, if it has an up-to-date one
+        tiles = None
+        if (bDoNotClip == False and len(clip_extent) != 0):
+            tiles = MAScriptUtils.CatalogIndexTiles(gp,inMACatalog,DTEDLevel,clip_extent)
+        if (tiles != None):
+            for objectId,featureEnvelope,cellwidth,cellheight,tile_pixel_type in tiles:
+                recordCount += 1
                 copySource = str(inMACatalog) + "\RASTER.ObjectID=" + str(objectId)
                 startlist.append(copySource)
-
-                # FATAL ERROR Segment Violation if raster missing in from cat
-                ras_desc = gp.Describe(copySource)
                 
                 # ensure that the clipping extent is not too small WRT to the resolution of the raster
-                if (len(clip_extent) > 3):
-                    minWidth = float(ras_desc.MeanCellWidth) * 4.0
-                    if minWidth > (float(clip_extent[2]) - float(clip_extent[0])):
-                         clip_extent[0] = float(clip_extent[0]) - 0.5 * minWidth
-                         clip_extent[2] = float(clip_extent[2]) + 0.5 * minWidth
-                    minHeight = float(ras_desc.MeanCellHeight) * 4.0
-                    if minHeight > (float(clip_extent[3]) - float(clip_extent[1])):
-                         clip_extent[1] = float(clip_extent[1]) - 0.5 * minHeight
-                         clip_extent[3] = float(clip_extent[3]) + 0.5 * minHeight
-                
-                #print copySource
+                minWidth = cellwidth * 4.0
+                if minWidth > (float(clip_extent[2]) - float(clip_extent[0])):
+                     clip_extent[0] = float(clip_extent[0]) - 0.5 * minWidth
+                     clip_extent[2] = float(clip_extent[2]) + 0.5 * minWidth
+                minHeight = cellheight * 4.0
+                if minHeight > (float(clip_extent[3]) - float(clip_extent[1])):
+                     clip_extent[1] = float(clip_extent[1]) - 0.5 * minHeight
+                     clip_extent[3] = float(clip_extent[3]) + 0.5 * minHeight
                 
                 if (listCount == 0):
                     try:
-                        # need cell size to create the output raster later on
-                        cellsize = ras_desc.MeanCellWidth
-                        # convert pixel type
-                        if (ras_desc.PixelType == "U1"): pixel_type = "1_BIT"
-                        if (ras_desc.PixelType == "U2"): pixel_type = "2_BIT"
-                        if (ras_desc.PixelType == "U4"): pixel_type = "4_BIT"
-                        if (ras_desc.PixelType == "U8"): pixel_type = "8_BIT_UNSIGNED"
-                        if (ras_desc.PixelType == "S8"): pixel_type = "8_BIT_SIGNED"
-                        if (ras_desc.PixelType == "U16"): pixel_type = "16_BIT_UNSIGNED"
-                        if (ras_desc.PixelType == "S16"): pixel_type = "16_BIT_SIGNED"
-                        if (ras_desc.PixelType == "U32"): pixel_type = "32_BIT_UNSIGNED"
-                        if (ras_desc.PixelType == "S32"): pixel_type = "32_BIT_SIGNED"
-                        if (ras_desc.PixelType == "F32"): pixel_type = "32_BIT_FLOAT"
-                        # raster spatial reference
-                        ras_sr = ras_desc.SpatialReference
+                        # cell size and pixel type were read when the index was built
+                        cellsize = cellwidth
+                        pixel_type = PixelTypeNames[tile_pixel_type]
+                        ras_sr = gp.Describe(copySource).SpatialReference
                         listCount += 1
                     except:
                         gp.AddWarning(msgBadRasterInCatalog % (copySource))
-                  
+        else:
+            # Get an search cursor for the input catalog
+            rows = gp.SearchCursor(inMACatalog,whereclausestring)
             row = rows.next()
+            recordCount = 0
+            listCount = 0
+            while row :
+                recordCount += 1
+                # Get row attributes
+                objectId = row.GetValue(objectIdField)
+                geometry = row.GetValue(geometryField)
+                name = row.GetValue(nameField)
+
+                # get envelope of the row
+                featureEnvelope = geometry.Extent
+                featureEnvelope = str(featureEnvelope).split(" ")
+                featureEnvelope = [featureEnvelope[0],featureEnvelope[1],featureEnvelope[2],featureEnvelope[3]]
+
+                # does this raster fall within the desired extents?
+                #@@envelopeInExtent = envelopeContainsEnvelope(featureEnvelope, clip_extent)
+                if (bDoNotClip == False and len(clip_extent) != 0):
+                    envelopeInExtent = EnvelopeRelation(gp,featureEnvelope,clip_extent)
+                else:
+                    envelopeInExtent = 256
+            
+                # if it does, add it to the list
+                #@@if envelopeInExtent :
+                if (envelopeInExtent != -1):
+                    copySource = str(inMACatalog) + "\RASTER.ObjectID=" + str(objectId)
+                    startlist.append(copySource)
+
+                    # FATAL ERROR Segment Violation if raster missing in from cat
+                    ras_desc = gp.Describe(copySource)
+                
+                    # ensure that the clipping extent is not too small WRT to the resolution of the raster
+                    if (len(clip_extent) > 3):
+                        minWidth = float(ras_desc.MeanCellWidth) * 4.0
+                        if minWidth > (float(clip_extent[2]) - float(clip_extent[0])):
+                             clip_extent[0] = float(clip_extent[0]) - 0.5 * minWidth
+                             clip_extent[2] = float(clip_extent[2]) + 0.5 * minWidth
+                        minHeight = float(ras_desc.MeanCellHeight) * 4.0
+                        if minHeight > (float(clip_extent[3]) - float(clip_extent[1])):
+                             clip_extent[1] = float(clip_extent[1]) - 0.5 * minHeight
+                             clip_extent[3] = float(clip_extent[3]) + 0.5 * minHeight
+                
+                    #print copySource
+                
+                    if (listCount == 0):
+                        try:
+                            # need cell size to create the output raster later on
+                            cellsize = ras_desc.MeanCellWidth
+                            # convert pixel type
+                            if (ras_desc.PixelType == "U1"): pixel_type = "1_BIT"
+                            if (ras_desc.PixelType == "U2"): pixel_type = "2_BIT"
+                            if (ras_desc.PixelType == "U4"): pixel_type = "4_BIT"
+                            if (ras_desc.PixelType == "U8"): pixel_type = "8_BIT_UNSIGNED"
+                            if (ras_desc.PixelType == "S8"): pixel_type = "8_BIT_SIGNED"
+                            if (ras_desc.PixelType == "U16"): pixel_type = "16_BIT_UNSIGNED"
+                            if (ras_desc.PixelType == "S16"): pixel_type = "16_BIT_SIGNED"
+                            if (ras_desc.PixelType == "U32"): pixel_type = "32_BIT_UNSIGNED"
+                            if (ras_desc.PixelType == "S32"): pixel_type = "32_BIT_SIGNED"
+                            if (ras_desc.PixelType == "F32"): pixel_type = "32_BIT_FLOAT"
+                            # raster spatial reference
+                            ras_sr = ras_desc.SpatialReference
+                            listCount += 1
+                        except:
+                            gp.AddWarning(msgBadRasterInCatalog % (copySource))
+                  
+                row = rows.next()
 
-        # cleanup
-        del row, rows
+            # cleanup
+            del row, rows
         
         # format the list for mosaic
         idx = 0
@@ -1039,6 +1086,338 @@ def EnvelopeRelation(gp,A,B):
 
     return -1
 
+def CatalogIndexName(inCatalog):
+    ## Path of the footprint index table kept beside a catalog
+    ##
+    ## inCatalog (string) - path to a MA catalog
+    return str(inCatalog) + CatalogIndexSuffix
+
+def CatalogIndexWildcard(inCatalog):
+    ## Wildcard of LIKE queries on the index table: * in a personal geodatabase (.mdb),
+    ## % in file and SDE geodatabases
+    ##
+    ## inCatalog (string) - path to a MA catalog
+    workspace = os.path.dirname(str(inCatalog))
+    while (workspace != "" and workspace != os.path.dirname(workspace)):
+        if (string.upper(workspace[-4:]) == string.upper(".mdb")): return "*"
+        workspace = os.path.dirname(workspace)
+    return "%"
+
+def CatalogIndexBounds(envelopes):
+    ## Square root quad for the index: origin snapped down to whole units and a
+    ## power-of-two side, so the quad lines of whole-degree DTED tiles never cut a tile
+    ##
+    ## envelopes (list) - [left,bottom,right,top] of every raster in the catalog
+    left = math.floor(min([e[0] for e in envelopes]))
+    bottom = math.floor(min([e[1] for e in envelopes]))
+    right = math.ceil(max([e[2] for e in envelopes]))
+    top = math.ceil(max([e[3] for e in envelopes]))
+    side = 1.0
+    while (side < (right - left) or side < (top - bottom)):
+        side = side * 2.0
+    return [left,bottom,left + side,bottom + side]
+
+def CatalogQuadKey(bounds,envelope,levels=CatalogIndexLevels):
+    ## Key of the smallest quad of the root (bounds) that holds an envelope.
+    ## "R" is the root, each following digit picks a child: row * 2 + column,
+    ## column 0 on the left and row 0 at the bottom.
+    ##
+    ## bounds (list) - root quad from CatalogIndexBounds
+    ## envelope (list) - [left,bottom,right,top] of the raster
+    L,B,R,T = float(envelope[0]),float(envelope[1]),float(envelope[2]),float(envelope[3])
+    x0,y0 = float(bounds[0]),float(bounds[1])
+    size = float(bounds[2]) - x0
+    key = "R"
+    for level in range(levels):
+        size = size / 2.0
+        xm = x0 + size
+        ym = y0 + size
+        if (R <= xm): col = 0
+        elif (L >= xm): col = 1
+        else: break
+        if (T <= ym): row = 0
+        elif (B >= ym): row = 1
+        else: break
+        key = key + str(row * 2 + col)
+        x0 = x0 + col * size
+        y0 = y0 + row * size
+    return key
+
+def CatalogQuadKeys(bounds,extent,levels=CatalogIndexLevels):
+    ## Keys to look up for an extent: the quads (at most 2x2) at the level whose size
+    ## matches the extent, and every ancestor of them. Rasters keyed below one of the
+    ## quads match it as a prefix, rasters keyed above match an ancestor exactly.
+    ## Returns [prefixes,ancestors], or None when the extent is outside the bounds.
+    ##
+    ## bounds (list) - root quad from CatalogIndexBounds
+    ## extent (list) - [left,bottom,right,top] to look up
+    L,B,R,T = float(extent[0]),float(extent[1]),float(extent[2]),float(extent[3])
+    x0,y0 = float(bounds[0]),float(bounds[1])
+    side = float(bounds[2]) - x0
+    if (R < x0 or L > x0 + side or T < y0 or B > y0 + side): return None
+    
+    # deepest level with quads no smaller than the extent
+    level = 0
+    size = side
+    while (level < levels and size / 2.0 >= max(R - L,T - B)):
+        size = size / 2.0
+        level += 1
+    n = 2 ** level
+    cols = range(max(0,int((L - x0) / size)),min(n - 1,int((R - x0) / size)) + 1)
+    rows = range(max(0,int((B - y0) / size)),min(n - 1,int((T - y0) / size)) + 1)
+    
+    prefixes = []
+    ancestors = []
+    for row in rows:
+        for col in cols:
+            key = "R"
+            for bit in range(level - 1,-1,-1):
+                key = key + str(((row >> bit) & 1) * 2 + ((col >> bit) & 1))
+            prefixes.append(key)
+            for k in range(1,len(key)):
+                if not (key[:k] in ancestors):
+                    ancestors.append(key[:k])
+    return [prefixes,ancestors]
+
+def BuildCatalogIndex(gp,inCatalog):
+    ## Builds (or rebuilds) the footprint index of a MA DTED catalog.
+    ## Each raster is described once here, so extent queries in MosaicAndClip
+    ## read the index table instead of scanning and describing the whole catalog.
+    ## On a rebuild the cell sizes of rasters already in the index are reused
+    ## (object ids are not reused), so only newly loaded rasters are described.
+    ##
+    ## gp - (object) existing gp processor
+    ## inCatalog (string) - path to an existing MA DTED catalog
+    
+    msgNoCatalog = "Catalog %s does not exist."
+    msgEmptyCatalog = "Catalog %s does not contain DTED_TYPE information.  (Is it a Military Analyst catalog?)"
+    msgCouldNotCreateIndex = "Could not create catalog index %s:\n %s"
+    msgBadRasterInCatalog = "Skipping bad raster in catalog: %s"
+    msgIndexBuilt = "Indexed %s rasters in %s"
+    
+    try:
+        if (gp.exists(inCatalog) == False):
+            raise Exception, msgNoCatalog % str(inCatalog)
+        if not ("DTED_TYPE" in GetFieldNames(gp,inCatalog)):
+            raise Exception, msgEmptyCatalog % str(inCatalog)
+        objectIdField = GetOIDField(inCatalog, gp)
+        geometryField = GetGeometryField(inCatalog, gp)
+        
+        # cell sizes and pixel types from the previous index
+        index_table = CatalogIndexName(inCatalog)
+        known = {}
+        if (gp.exists(index_table) == True):
+            rows = gp.SearchCursor(index_table,"QUADKEY <> '" + CatalogIndexHeader + "' AND QUADKEY <> ''")
+            row = rows.next()
+            while row:
+                known[row.GetValue("RASTER_OID")] = [float(row.GetValue("CELLWIDTH")),float(row.GetValue("CELLHEIGHT")),
+                                                    str(row.GetValue("PIXELTYPE"))]
+                row = rows.next()
+            del row, rows
+        
+        # read footprints and describe each new raster once
+        records = []
+        rows = gp.SearchCursor(inCatalog)
+        row = rows.next()
+        while row:
+            objectId = row.GetValue(objectIdField)
+            envelope = str(row.GetValue(geometryField).Extent).split(" ")
+            envelope = [float(envelope[0]),float(envelope[1]),float(envelope[2]),float(envelope[3])]
+            copySource = str(inCatalog) + "\RASTER.ObjectID=" + str(objectId)
+            if (known.has_key(objectId)):
+                records.append([objectId,row.GetValue("DTED_TYPE"),envelope] + known[objectId])
+                row = rows.next()
+                continue
+            try:
+                ras_desc = gp.Describe(copySource)
+                records.append([objectId,row.GetValue("DTED_TYPE"),envelope,
+                                float(ras_desc.MeanCellWidth),float(ras_desc.MeanCellHeight),str(ras_desc.PixelType)])
+            except:
+                # kept with an empty key so the index still counts every catalog row
+                gp.AddWarning(msgBadRasterInCatalog % (copySource))
+                records.append([objectId,row.GetValue("DTED_TYPE"),envelope,None,None,None])
+            row = rows.next()
+        del row, rows
+        if (len(records) == 0):
+            raise Exception, msgEmptyCatalog % str(inCatalog)
+        bounds = CatalogIndexBounds([r[2] for r in records])
+        
+        # (re)create the index table
+        try:
+            if (gp.exists(index_table) == True):
+                gp.Delete_management(index_table)
+            gp.CreateTable_management(os.path.dirname(index_table),os.path.basename(index_table))
+            gp.AddField_management(index_table, "RASTER_OID", "LONG", "", "", "", "", "NULLABLE", "NON_REQUIRED", "")
+            gp.AddField_management(index_table, "DTED_TYPE", "TEXT", "", "", "15", "", "NULLABLE", "NON_REQUIRED", "")
+            gp.AddField_management(index_table, "QUADKEY", "TEXT", "", "", str(CatalogIndexLevels + 1), "", "NULLABLE", "NON_REQUIRED", "")
+            for field in ["XMIN","YMIN","XMAX","YMAX","CELLWIDTH","CELLHEIGHT"]:
+                gp.AddField_management(index_table, field, "DOUBLE", "", "", "", "", "NULLABLE", "NON_REQUIRED", "")
+            gp.AddField_management(index_table, "PIXELTYPE", "TEXT", "", "", "8", "", "NULLABLE", "NON_REQUIRED", "")
+        except:
+            raise Exception, msgCouldNotCreateIndex % (index_table,gp.GetMessages())
+        
+        # one header row per DTED type holds the root quad, then one row per raster
+        dtedTypes = []
+        for r in records:
+            if not (r[1] in dtedTypes):
+                dtedTypes.append(r[1])
+        rows = gp.InsertCursor(index_table)
+        for dtedtype in dtedTypes:
+            row = rows.NewRow()
+            row.SetValue("DTED_TYPE",dtedtype)
+            row.SetValue("QUADKEY",CatalogIndexHeader)
+            row.SetValue("XMIN",bounds[0])
+            row.SetValue("YMIN",bounds[1])
+            row.SetValue("XMAX",bounds[2])
+            row.SetValue("YMAX",bounds[3])
+            rows.InsertRow(row)
+        for objectId,dtedtype,envelope,cellwidth,cellheight,pixeltype in records:
+            row = rows.NewRow()
+            row.SetValue("RASTER_OID",objectId)
+            row.SetValue("DTED_TYPE",dtedtype)
+            row.SetValue("XMIN",envelope[0])
+            row.SetValue("YMIN",envelope[1])
+            row.SetValue("XMAX",envelope[2])
+            row.SetValue("YMAX",envelope[3])
+            if (pixeltype == None):
+                row.SetValue("QUADKEY","")
+            else:
+                row.SetValue("QUADKEY",CatalogQuadKey(bounds,envelope))
+                row.SetValue("CELLWIDTH",cellwidth)
+                row.SetValue("CELLHEIGHT",cellheight)
+                row.SetValue("PIXELTYPE",pixeltype)
+            rows.InsertRow(row)
+        del row, rows
+        
+        # attribute index on the key makes the prefix lookups logarithmic
+        try:
+            gp.AddIndex_management(index_table,"QUADKEY","IDX_QUADKEY","NON_UNIQUE","ASCENDING")
+        except:
+            raise Exception, msgCouldNotCreateIndex % (index_table,gp.GetMessages())
+        
+        gp.AddMessage(msgIndexBuilt % (str(len(records)),index_table))
+        return index_table
+    
+    except Exception, ErrorMessage:
+        # the index is optional, callers fall back to scanning the catalog
+        print str(ErrorMessage)
+        gp.AddWarning(str(ErrorMessage))
+        return None
+
+def CatalogIndexTypes(gp,inCatalog):
+    ## DTED types present in a catalog, read from the header rows of its footprint index.
+    ## Returns None when the catalog has no index, or the index is out of date
+    ## (rasters loaded or removed since it was built).
+    index_table = CatalogIndexName(inCatalog)
+    if (gp.exists(index_table) == False): return None
+    try:
+        catalogCount = int(gp.GetCount_management(inCatalog).GetOutput(0))
+        indexCount = int(gp.GetCount_management(index_table).GetOutput(0))
+    except:
+        return None
+    dtedTypes = []
+    rows = gp.SearchCursor(index_table,"QUADKEY = '" + CatalogIndexHeader + "'")
+    row = rows.next()
+    while row:
+        dtedtype = row.GetValue("DTED_TYPE")
+        if not (dtedtype in dtedTypes):
+            dtedTypes.append(dtedtype)
+        row = rows.next()
+    del row, rows
+    if (len(dtedTypes) == 0 or indexCount - len(dtedTypes) != catalogCount): return None
+    return dtedTypes
+
+def CatalogIndexTiles(gp,inCatalog,DTEDLevel,clip_extent):
+    ## Rasters of one DTED type that overlap an extent, from the catalog's footprint index.
+    ## Returns a list of [objectId,envelope,cellwidth,cellheight,pixeltype],
+    ## or None when the catalog has no index or it is out of date.
+    ##
+    ## gp - (object) existing gp processor
+    ## inCatalog (string) - path to an existing MA DTED catalog
+    ## DTEDLevel (string) - DTED_TYPE value, e.g. "DTED Level 1"
+    ## clip_extent (list) - X-Minimum (left), Y-Minimum (bottom), X-Maximum (right), Y-Maximum (top)
+    index_table = CatalogIndexName(inCatalog)
+    if (CatalogIndexTypes(gp,inCatalog) == None): return None
+    typeclause = "DTED_TYPE = '" + DTEDLevel + "'"
+    
+    # root quad from the header row
+    bounds = None
+    rows = gp.SearchCursor(index_table,typeclause + " AND QUADKEY = '" + CatalogIndexHeader + "'")
+    row = rows.next()
+    if row:
+        bounds = [row.GetValue("XMIN"),row.GetValue("YMIN"),row.GetValue("XMAX"),row.GetValue("YMAX")]
+    del row, rows
+    if (bounds == None): return None
+    
+    tiles = []
+    keys = CatalogQuadKeys(bounds,clip_extent)
+    if (keys == None): return tiles
+    prefixes,ancestors = keys
+    wildcard = CatalogIndexWildcard(inCatalog)
+    keyclauses = ["QUADKEY LIKE '" + key + wildcard + "'" for key in prefixes]
+    if (len(ancestors) > 0):
+        keyclauses.append("QUADKEY IN ('" + "','".join(ancestors) + "')")
+    whereclausestring = typeclause + " AND (" + " OR ".join(keyclauses) + ")"
+    
+    rows = gp.SearchCursor(index_table,whereclausestring)
+    row = rows.next()
+    while row:
+        envelope = [row.GetValue("XMIN"),row.GetValue("YMIN"),row.GetValue("XMAX"),row.GetValue("YMAX")]
+        # same overlap test as the full catalog scan
+        if (EnvelopeRelation(gp,envelope,clip_extent) != -1):
+            tiles.append([row.GetValue("RASTER_OID"),envelope,float(row.GetValue("CELLWIDTH")),
+                          float(row.GetValue("CELLHEIGHT")),str(row.GetValue("PIXELTYPE"))])
+        row = rows.next()
+    del row, rows
+    
+    # keep catalog order so the mosaic matches the full scan
+    tiles.sort()
+    return tiles
+
+def CatalogTiles(gp,inCatalog,DTEDLevel,clip_extent):
+    ## Rasters of one DTED type that overlap an extent, from the footprint index
+    ## when the catalog has an up-to-date one, otherwise from a scan of the catalog.
+    ## Returns a list of [objectId,envelope,cellwidth,cellheight,pixeltype] in catalog order.
+    msgBadRasterInCatalog = "Skipping bad raster in catalog: %s"
+    tiles = CatalogIndexTiles(gp,inCatalog,DTEDLevel,clip_extent)
+    if (tiles != None): return tiles
+    
+    objectIdField = GetOIDField(inCatalog, gp)
+    geometryField = GetGeometryField(inCatalog, gp)
+    tiles = []
+    rows = gp.SearchCursor(inCatalog,"DTED_TYPE = '" + DTEDLevel + "'")
+    row = rows.next()
+    while row:
+        objectId = row.GetValue(objectIdField)
+        envelope = str(row.GetValue(geometryField).Extent).split(" ")
+        envelope = [float(envelope[0]),float(envelope[1]),float(envelope[2]),float(envelope[3])]
+        if (EnvelopeRelation(gp,envelope,clip_extent) != -1):
+            copySource = str(inCatalog) + "\RASTER.ObjectID=" + str(objectId)
+            try:
+                ras_desc = gp.Describe(copySource)
+                tiles.append([objectId,envelope,float(ras_desc.MeanCellWidth),float(ras_desc.MeanCellHeight),str(ras_desc.PixelType)])
+            except:
+                gp.AddWarning(msgBadRasterInCatalog % (copySource))
+        row = rows.next()
+    del row, rows
+    tiles.sort()
+    return tiles
+
+def LowestDTEDLevel(gp,inCatalog):
+    ## "DTED Level n" for the lowest level in a MA DTED catalog (None if there is none),
+    ## read from the footprint index when the catalog has one
+    dtedTypes = CatalogIndexTypes(gp,inCatalog)
+    if (dtedTypes == None):
+        dtedTypes = ReturnDTEDTypes(gp,inCatalog)
+    if (dtedTypes == None or len(dtedTypes) < 1): return None
+    minLevel = 100
+    for level in dtedTypes:
+        #trim characters from string, return number only
+        ilevel = int(level[11:])
+        if (ilevel < minLevel):
+            minLevel = ilevel
+    return "DTED Level " + str(minLevel)
+
 def ReturnDTEDTypes(gp,inCatalog):
     # given an input MA DTED Catalog we want to figure out what DTED types
     # are present in the catalog. This tool returns a list of DTED types.
@@ -1337,6 +1716,8 @@ def GenerateTempFileName(gp,workspace,inType):
             outFile = workspace + os.sep + tempname + ".prj"
         if (inType == "ASCIIFile"):
             outFile = workspace + os.sep + tempname + ".txt"
+        if (inType == "FloatFile"):
+            outFile = workspace + os.sep + tempname + ".flt"
     
     # For File or Personal Geodatabases
     if (workspace_type == "LocalDatabase"):
@@ -1357,6 +1738,8 @@ def GenerateTempFileName(gp,workspace,inType):
             outFile = os.path.dirname(workspace) + os.sep +  tempname + ".prj"
         if (inType == "ASCIIFile"):
             outFile = os.path.dirname(workspace) + os.sep + tempname + ".txt"
+        if (inType == "FloatFile"):
+            outFile = os.path.dirname(workspace) + os.sep + tempname + ".flt"
         
     # For ArcSDE Geodatabases
     if (workspace_type == "RemoteDatabase"):
@@ -1366,6 +1749,8 @@ def GenerateTempFileName(gp,workspace,inType):
             outFile = workspace + os.sep + tempname
         if (inType == "ProjectionFile"):
             outFile = os.environ['TEMP'] + os.sep + tempname + ".prj"
+        if (inType == "FloatFile"):
+            outFile = os.environ['TEMP'] + os.sep + tempname + ".flt"
             
     return outFile
 
@@ -1421,8 +1806,10 @@ def GetTempWorkspace(gp):
         
     return out_workspace
 
-def GenerateProfileLine(gp,input_polyline,inUnits):
+def GenerateProfileLine(gp,input_polyline,inUnits,out_file=None):
     
+    #
+    #out_file: write the plot to this PNG, SVG or PDF file instead of showing it
     #
     #input_polyline:
     #
@@ -1449,6 +1836,22 @@ def GenerateProfileLine(gp,input_polyline,inUnits):
         shapefieldname = desc.ShapeFieldName
         startX,startY,startZ = 0.0,0.0,0.0
         
+        # convert the z units to xy units: the same for every point, so the
+        # spatial reference is checked and the factor found once
+        zconversion = 1.0
+        if (MAScriptUtils.IsGeographicSR(gp,input_polyline) == True):
+            meters = MAScriptUtils.ConvertLinearUnits(gp,1.0,inUnits,"meter") # convert input units to meters
+            if (meters == None):
+                raise Exception, msgCouldNotConvertunits
+            zconversion = meters * float(zfactor)
+        elif (MAScriptUtils.IsProjectedSR(gp,input_polyline) == True):
+            xyunits = desc.SpatialReference.LinearUnitName # get xy (linear) units
+            zconversion = MAScriptUtils.ConvertLinearUnits(gp,1.0,inUnits,xyunits) # convert from z units to xy units
+            if (zconversion == None):
+                raise Exception, msgCouldNotConvertunits
+        else: # if its Unknown?
+            pass
+        
         rows = gp.SearchCursor(input_polyline)
         row = rows.next()
         
@@ -1471,16 +1874,7 @@ def GenerateProfileLine(gp,input_polyline,inUnits):
                         startX,startY,startZ = pnt.x,pnt.y,pnt.z
                         
                     # convert the z units to xy units.
-                    if (MAScriptUtils.IsGeographicSR(gp,input_polyline) == True):
-                        meters = MAScriptUtils.ConvertLinearUnits(gp,shpZ,inUnits,"meter") # convert input units to meters
-                        if (meters == None):
-                            raise Exception, msgCouldNotConvertunits
-                        shpZ = meters * float(zfactor) # do the conversion
-                    elif (MAScriptUtils.IsProjectedSR(gp,input_polyline) == True):
-                        xyunits = gp.Describe(input_polyline).SpatialReference.LinearUnitName # get xy (linear) units
-                        shpZ = MAScriptUtils.ConvertLinearUnits(gp,shpZ,inUnits,xyunits) # convert from z units to xy units
-                    else: # if its Unknown?
-                        pass
+                    shpZ = shpZ * zconversion
                     
                     # find distance between point and previous point
                     if (linenumber == 0 and partnum == 0 and pntcount == 0 and len(profileLine) == 0):
@@ -1512,7 +1906,7 @@ def GenerateProfileLine(gp,input_polyline,inUnits):
         
         #target_visible
         # plot line
-        MAScriptUtils.PlotProfile(target_visible,profileLine)
+        MAScriptUtils.PlotProfile(target_visible,profileLine,out_file)
         
     except Exception, ErrorMessage:
         profileLine = []
@@ -1521,17 +1915,23 @@ def GenerateProfileLine(gp,input_polyline,inUnits):
         
     return profileLine
 
-def PlotProfile(target_visible,lstProfileList):
+def PlotProfile(target_visible,lstProfileList,out_file=None):
     #
     # THIS TOOL REQUIRES 3RD PARTY PYTHON LIBs:
     # numpy: www.scipy.org
     # pylab (matplotlib): http://matplotlib.sourceforge.net/
+    #
+    # out_file: save the plot (PNG, SVG or PDF by extension) with the
+    # non-interactive Agg backend instead of showing a window.
+    # Many profiles are better rendered with ProfilePlot.RenderProfiles.
     
     msgIsVisible = "Line of Sight Surface Profile Plot. \n The target is visible."
     msgIsNotVisible = "Line of Sight Surface Profile Plot. \n The target is not visible."
     
     import numpy
     import pylab
+    if (out_file != None):
+        pylab.switch_backend("Agg")
     
     if debug == True:
         print "Number of parts: = " + str(len(lstProfileList))
@@ -1616,8 +2016,12 @@ def PlotProfile(target_visible,lstProfileList):
     # graph lines
     pylab.grid(True)
     
-    # display plot
-    pylab.show()
+    # display plot (or save it when running headless)
+    if (out_file != None):
+        pylab.savefig(out_file)
+        pylab.close()
+    else:
+        pylab.show()
     
     return
 
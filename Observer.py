@@ -26,6 +26,7 @@ class Observer:
         self.Vert1 = 90.0
         self.Vert2 = -90.0
         self.SpatialReference = MAScriptUtils.SetGeographicWGS84(gp)
+        self.HorizonIndex = None
     
     # set and return individual properties
     def SetX (self,X):
@@ -76,6 +77,10 @@ class Observer:
         self.SpatialReference = sr
     def GetSpatialRef (self):
         return self.SpatialReference
+    def SetHorizonIndex (self,HorizonIndex):
+        self.HorizonIndex = HorizonIndex
+    def GetHorizonIndex (self):
+        return self.HorizonIndex
     
     
     def SetObserver (self,iX,iY,iZ,iOffsetA,iOffsetB,iRadius1,iRadius2,iAzimuth1,iAzimuth2,iVert1,iVert2,sr):
@@ -303,4 +308,78 @@ class Observer:
             print ErrorMessage
             gp.AddError(str(ErrorMessage))
             
-        return spot
\ No newline at end of file
+        return spot
+    
+    def AsDictionary (self):
+        # observer as used by the NATIVE visibility engine (Visibility.py)
+        observer = {"X":float(self.X),"Y":float(self.Y),
+                    "OFFSETA":float(self.OffsetA),"OFFSETB":float(self.OffsetB),
+                    "RADIUS1":float(self.Radius1),"RADIUS2":float(self.Radius2),
+                    "AZIMUTH1":float(self.Azimuth1),"AZIMUTH2":float(self.Azimuth2),
+                    "VERT1":float(self.Vert1),"VERT2":float(self.Vert2)}
+        if (self.Z != None):
+            observer["SPOT"] = float(self.Z)
+        return observer
+    
+    def BuildHorizonIndex (self,surface,rays=720,step=None,bUseCurvature=False,refraction_factor=0.13):
+        # precompute and attach the horizon index of this observer
+        # surface is a Surface.Surface in the observer's spatial reference
+        import Horizon
+        self.HorizonIndex = Horizon.BuildHorizonIndex(surface,self.AsDictionary(),rays,step,bUseCurvature,refraction_factor)
+        return self.HorizonIndex
+    
+    def SaveHorizonIndex (self,index_file):
+        msgNoHorizonIndex = "Observer has no horizon index."
+        if (self.HorizonIndex == None):
+            raise Exception, msgNoHorizonIndex
+        return self.HorizonIndex.Save(index_file)
+    
+    def LoadHorizonIndex (self,index_file):
+        # attach a saved horizon index, it must have been built for this position
+        msgIndexPosition = "Horizon index %s was built for %s, %s not for observer at %s, %s."
+        import Horizon
+        index = Horizon.ReadHorizonIndex(index_file)
+        if (abs(index.X - float(self.X)) > 1.0e-6 or abs(index.Y - float(self.Y)) > 1.0e-6):
+            raise Exception, msgIndexPosition % (str(index_file),str(index.X),str(index.Y),str(self.X),str(self.Y))
+        self.HorizonIndex = index
+        return index
+    
+    def CanSee (self,x,y,offsetB=None,z=None):
+        # visibility of a target from the attached horizon index, offsetB
+        # defaults to the observer's OffsetB and z to the indexed surface
+        msgNoHorizonIndex = "Observer has no horizon index, use BuildHorizonIndex or LoadHorizonIndex."
+        if (self.HorizonIndex == None):
+            raise Exception, msgNoHorizonIndex
+        if (offsetB == None):
+            offsetB = self.OffsetB
+        visible = self.HorizonIndex.IsVisible(x,y,float(offsetB),z)
+        if (visible.shape == ()):
+            return bool(visible)
+        return visible
+
+
+def InterpolateObserversZ(gp,observers,inSurface,method="BILINEAR"):
+    # interpolate the surface under a list of observers in one call (no
+    # temporary point features), returns a list of spots with None for
+    # observers off the surface or on NoData. Observers in another spatial
+    # reference than the surface, or runs without NUMPY, use InterpolateZ.
+    try:
+        import numpy, Surface
+    except ImportError:
+        return [observer.InterpolateZ(gp,inSurface,method) for observer in observers]
+    surf_sr_name = str(gp.Describe(inSurface).SpatialReference.Name)
+    spots = [None] * len(observers)
+    batch = []
+    for i in range(len(observers)):
+        if (str(observers[i].SpatialReference.Name).replace("'","") == surf_sr_name):
+            batch.append(i)
+        else:
+            spots[i] = observers[i].InterpolateZ(gp,inSurface,method)
+    if (len(batch) > 0):
+        xs = numpy.array([float(observers[i].X) for i in batch])
+        ys = numpy.array([float(observers[i].Y) for i in batch])
+        zs = Surface.SurfaceSpots(gp,inSurface,xs,ys,gp.workspace,method)
+        for k in range(len(batch)):
+            if not (numpy.isnan(zs[k])):
+                spots[batch[k]] = float(zs[k])
+    return spots
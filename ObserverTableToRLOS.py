@@ -7,7 +7,7 @@
 
 # Import system modules
 import sys, string, os
-import arcgisscripting, MAScriptUtils
+import arcgisscripting, MAScriptUtils, CatalogLoader
 
 #Create geoprocessor
 gp = arcgisscripting.create()
@@ -35,24 +35,29 @@ try:
         gp.AddError(errormsg)
         raise Exception, errormsg
     
-    #Create DTED catalog
-    try:
-        gp.CreateDTEDCatalog_ma(Input_Geodatabase,Surface_Catalog_Name)
-    except:
-        gpmessages = gp.GetMessages()
-        errormsg = "Could not create surface catalog: \n %s" % (gpmessages)
-        gp.AddError(errormsg)
-        raise Exception, errormsg
+    #Create DTED catalog, a catalog from an earlier run is reused
+    bNewCatalog = (gp.Exists(Surface_Catalog_Path) == False)
+    if (bNewCatalog == True):
+        try:
+            gp.CreateDTEDCatalog_ma(Input_Geodatabase,Surface_Catalog_Name)
+        except:
+            gpmessages = gp.GetMessages()
+            errormsg = "Could not create surface catalog: \n %s" % (gpmessages)
+            gp.AddError(errormsg)
+            raise Exception, errormsg
     
-    #Load DTED catalog
+    #Load DTED catalog, only new and changed tiles on a rerun
     try:
-        gp.LoadMaCatalog_ma(Surface_Catalog_Path,DTED_Folder)
-    except:
-        gpmessages = gp.GetMessages()
-        errormsg = "Could not load surface catalog: \n %s" % (gpmessages)
+        CatalogLoader.LoadCatalog(gp,Surface_Catalog_Path,DTED_Folder,bFullLoad=bNewCatalog)
+    except Exception, ErrorMessage:
+        errormsg = "Could not load surface catalog: \n %s" % (str(ErrorMessage))
         gp.AddError(errormsg)
         raise Exception, errormsg
     
+    #Index the catalog footprints for the extent queries of RLOS
+    if (MAScriptUtils.BuildCatalogIndex(gp,Surface_Catalog_Path) == None):
+        gp.AddWarning("Could not index surface catalog, extent queries will scan the whole catalog.")
+    
     #Run Radial Line of Sight: <observers>,<input_surface>,<output_workspace>,<fc_basename>
     try:
         gp.RadialLineOfSight_ma(Observer_Path,Surface_Catalog_Path,Input_Geodatabase,Output_Basename)
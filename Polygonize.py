@@ -0,0 +1,234 @@
+#!/usr/bin/env python
+# -*- coding: latin-1 -*-
+
+#
+# Polygonize.py
+#
+# Military Analyst raster to polygon conversion for visibility grids
+#
+# Replaces RasterToPolygon for grids already held as NumPy arrays. Each row
+# is run-length encoded into boundary edges (a run of cells whose neighbor
+# across one side has another value), the edges are chained into rings and
+# the rings go straight into an insert cursor. Rings run clockwise around
+# a region and counter-clockwise around its holes, and diagonal neighbors
+# are kept apart (4-connected regions), as RasterToPolygon does.
+#
+# The grid is processed in bands of rows, each band is traced and written
+# before the next one is read, so memory and time grow linearly with the
+# grid and a memory-mapped grid never has to be loaded as a whole.
+# Regions crossing a band edge are written as one polygon per band.
+#
+
+import os, sys, string
+import numpy
+
+debug = False
+
+# rows traced at a time
+DefaultBandRows = 1024
+
+# edge directions, clockwise: a right turn is (direction + 1) % 4
+East,South,West,North = 0,1,2,3
+
+# error messages
+msgCreateOutputFailed = "Could not create output polygons %s: \n %s"
+msgWritePolygonsFailed = "Could not write polygons to %s: \n %s"
+msgBadValidShape = "Valid mask shape %s does not match grid shape %s."
+
+def RunEdges(boundary,values):
+    ## run-length encodes boundary cells along the rows of a 2D mask: returns
+    ## (rows,first,last) of the runs of boundary cells sharing one value
+    same = numpy.zeros(boundary.shape,numpy.bool_)
+    same[:,1:] = boundary[:,:-1] & boundary[:,1:] & (values[:,1:] == values[:,:-1])
+    starts = boundary & ~same
+    ends = numpy.zeros(boundary.shape,numpy.bool_)
+    ends[:,:-1] = boundary[:,:-1] & ~same[:,1:]
+    ends[:,-1] = boundary[:,-1]
+    rows,first = numpy.nonzero(starts)
+    last = numpy.nonzero(ends)[1]
+    return rows,first,last
+
+def BoundaryEdges(values,valid):
+    ## returns the boundary edges of the regions of equal value as arrays
+    ## (value,start_i,start_j,end_i,end_j,direction) in grid vertex
+    ## coordinates (i is the row line, j the column line). Each edge has its
+    ## region on the right.
+    rows,cols = values.shape
+    # neighbor differs (or is off the grid / invalid) above, below, left, right
+    up = valid.copy()
+    up[1:,:] &= ~(valid[:-1,:] & (values[:-1,:] == values[1:,:]))
+    down = valid.copy()
+    down[:-1,:] &= ~(valid[1:,:] & (values[1:,:] == values[:-1,:]))
+    left = valid.copy()
+    left[:,1:] &= ~(valid[:,:-1] & (values[:,:-1] == values[:,1:]))
+    right = valid.copy()
+    right[:,:-1] &= ~(valid[:,1:] & (values[:,1:] == values[:,:-1]))
+
+    parts = []
+    # top edges run east along row line r
+    r,c0,c1 = RunEdges(up,values)
+    parts.append((values[r,c0],r,c0,r,c1 + 1,East))
+    # bottom edges run west along row line r + 1
+    r,c0,c1 = RunEdges(down,values)
+    parts.append((values[r,c0],r + 1,c1 + 1,r + 1,c0,West))
+    # left and right edges are runs down the columns
+    c,r0,r1 = RunEdges(left.T,values.T)
+    parts.append((values[r0,c],r1 + 1,c,r0,c,North))
+    c,r0,r1 = RunEdges(right.T,values.T)
+    parts.append((values[r0,c],r0,c + 1,r1 + 1,c + 1,South))
+
+    edges = []
+    for k in range(6):
+        edges.append(numpy.concatenate([numpy.broadcast_arrays(part[k],part[1])[0].astype(numpy.int64) for part in parts]))
+    return edges
+
+def TraceRings(values,valid):
+    ## chains the boundary edges of a grid into rings, returns a list of
+    ## (value,i,j) where i,j are the vertex coordinates of a closed ring
+    value,si,sj,ei,ej,direction = BoundaryEdges(values,valid)
+    if (len(value) == 0):
+        return []
+    cols = values.shape[1] + 1
+    codes,value_index = numpy.unique(value,return_inverse=True)
+    start_key = (((si * cols) + sj) * len(codes)) + value_index
+    end_key = (((ei * cols) + ej) * len(codes)) + value_index
+
+    # the next edge starts where this one ends; at a corner where two
+    # regions touch diagonally there are two, take the right turn
+    order = numpy.argsort(start_key,kind="mergesort")
+    sorted_key = start_key[order]
+    lo = numpy.searchsorted(sorted_key,end_key,"left")
+    hi = numpy.searchsorted(sorted_key,end_key,"right")
+    following = order[numpy.minimum(lo,len(order) - 1)]
+    pinch = (hi - lo) > 1
+    if (pinch.any()):
+        first = order[lo[pinch]]
+        second = order[lo[pinch] + 1]
+        right_turn = (direction[pinch] + 1) % 4
+        following[pinch] = numpy.where(direction[first] == right_turn,first,second)
+
+    following = following.tolist()
+    used = numpy.zeros(len(value),numpy.bool_)
+    rings = []
+    for edge in range(len(value)):
+        if (used[edge]):
+            continue
+        ring = [edge]
+        used[edge] = True
+        next_edge = following[edge]
+        while (next_edge != edge):
+            ring.append(next_edge)
+            used[next_edge] = True
+            next_edge = following[next_edge]
+        ring.append(edge)
+        ring = numpy.array(ring)
+        rings.append((value[edge],si[ring],sj[ring]))
+    return rings
+
+def SimplifyRing(xy,tolerance):
+    ## Douglas-Peucker simplification of a closed ring (first point repeated
+    ## last), returns the ring unchanged if it would collapse
+    if (tolerance <= 0.0 or len(xy) <= 4):
+        return xy
+    keep = numpy.zeros(len(xy),numpy.bool_)
+    keep[0] = True
+    keep[-1] = True
+    # split the ring at the point furthest from the start
+    far = int(numpy.argmax(((xy - xy[0]) ** 2).sum(1)))
+    keep[far] = True
+    stack = [(0,far),(far,len(xy) - 1)]
+    while (len(stack) > 0):
+        first,last = stack.pop()
+        if (last - first < 2):
+            continue
+        a = xy[first]
+        b = xy[last]
+        inner = xy[first + 1:last]
+        ab = b - a
+        length = numpy.sqrt((ab * ab).sum())
+        if (length == 0.0):
+            dist = numpy.sqrt(((inner - a) ** 2).sum(1))
+        else:
+            dist = numpy.abs((ab[0] * (inner[:,1] - a[1])) - (ab[1] * (inner[:,0] - a[0]))) / length
+        k = int(numpy.argmax(dist))
+        if (dist[k] > tolerance):
+            keep[first + 1 + k] = True
+            stack.append((first,first + 1 + k))
+            stack.append((first + 1 + k,last))
+    if (keep.sum() < 4):
+        return xy
+    return xy[keep]
+
+def PolygonizeBands(values,valid=None,xmin=0.0,ymax=0.0,cellwidth=1.0,cellheight=1.0,tolerance=0.0,band_rows=DefaultBandRows,nodata=None):
+    ## generator over the bands of a grid: yields (value,rings) for each
+    ## value found in a band, rings are (n,2) arrays of map x,y. Cells that
+    ## are not valid or equal nodata are left out.
+    if (valid is not None and valid.shape != values.shape):
+        raise Exception, msgBadValidShape % (str(valid.shape),str(values.shape))
+    for row0 in range(0,values.shape[0],band_rows):
+        band = numpy.asarray(values[row0:row0 + band_rows])
+        if (valid is None):
+            band_valid = numpy.ones(band.shape,numpy.bool_)
+        else:
+            band_valid = numpy.asarray(valid[row0:row0 + band_rows],numpy.bool_)
+        if (nodata != None):
+            band_valid = band_valid & (band != nodata)
+        by_value = {}
+        for value,i,j in TraceRings(band,band_valid):
+            xy = numpy.empty((len(i),2),numpy.float64)
+            xy[:,0] = xmin + (j * cellwidth)
+            xy[:,1] = ymax - ((i + row0) * cellheight)
+            by_value.setdefault(value,[]).append(SimplifyRing(xy,tolerance))
+        values_found = by_value.keys()
+        values_found.sort()
+        for value in values_found:
+            yield value,by_value[value]
+
+def CreatePolygonFeatureClass(gp,out_fc,spatial_ref,value_field="GRID_CODE"):
+    ## creates an empty polygon feature class with a value field
+    try:
+        gp.CreateFeatureclass_management(os.path.dirname(out_fc),os.path.basename(out_fc),"POLYGON","#","DISABLED","DISABLED",spatial_ref)
+        gp.AddField_management(out_fc,value_field,"DOUBLE","10","0","10","","NULLABLE","NON_REQUIRED","")
+    except:
+        raise Exception, msgCreateOutputFailed % (str(out_fc),gp.GetMessages())
+    return out_fc
+
+def WritePolygons(gp,out_fc,surface,values,tolerance=0.0,band_rows=DefaultBandRows,value_field="GRID_CODE",nodata=None):
+    ## writes the regions of a grid on the surface to a new polygon feature
+    ## class, one feature per value in each band. NoData cells of the
+    ## surface are left out, or the cells of values equal to nodata if given
+    ## (the surface elevation is then not read).
+    CreatePolygonFeatureClass(gp,out_fc,surface.SpatialReference,value_field)
+    if (nodata == None):
+        valid = ~numpy.isnan(surface.Elevation)
+    else:
+        valid = None
+    feature_count = 0
+    rows = None
+    try:
+        rows = gp.InsertCursor(out_fc)
+        for value,rings in PolygonizeBands(values,valid,surface.XMin,surface.YMax,surface.CellWidth,
+                                           surface.CellHeight,tolerance,band_rows,nodata):
+            polygon = gp.CreateObject("Array")
+            for xy in rings:
+                part = gp.CreateObject("Array")
+                for x,y in xy.tolist():
+                    pnt = gp.CreateObject("Point")
+                    pnt.X = x
+                    pnt.Y = y
+                    part.add(pnt)
+                polygon.add(part)
+            row = rows.NewRow()
+            row.shape = polygon
+            row.SetValue(value_field,float(value))
+            rows.InsertRow(row)
+            feature_count = feature_count + 1
+        del rows
+    except Exception, ErrorMessage:
+        if (rows != None): del rows
+        raise Exception, msgWritePolygonsFailed % (str(out_fc),str(ErrorMessage) + "\n" + gp.GetMessages())
+    if (debug == True):
+        msg = "Wrote %s polygons to %s" % (str(feature_count),str(out_fc))
+        gp.AddMessage(msg)
+        print msg
+    return feature_count
@@ -0,0 +1,210 @@
+#!/usr/bin/env python
+# -*- coding: latin-1 -*-
+
+#
+# Profile.py
+#
+# Military Analyst surface profiles
+#
+# Samples a surface along any number of polylines at a fixed ground spacing
+# in one pass. The stations of all profiles are kept end to end in flat
+# arrays (distance, x, y, elevation, visible) with the offset of each
+# profile, so thousands of profiles cost a handful of NumPy calls rather
+# than a cursor walk per vertex. Z unit conversion is worked out once per
+# run (ZUnitFactor) and applied as a single factor.
+#
+
+import os, sys, math
+import numpy
+import Surface, Visibility
+
+debug = False
+
+# stations held in memory at a time while finding visibility
+ChunkSamples = 1000000
+
+# error messages
+msgBadSpacing = "Profile spacing must be greater than zero."
+msgNotPolylines = "Input %s is not a polyline feature class."
+msgCouldNotConvertUnits = "Could not convert z units %s to %s."
+
+class Profiles:
+    #offsets,distance,x,y,elevation,visible
+    def __init__(self,offsets,distance,x,y,elevation,visible):
+        # stations of profile i are offsets[i]:offsets[i + 1]
+        self.Offsets = offsets
+        # ground distance from the start of the profile
+        self.Distance = distance
+        self.X = x
+        self.Y = y
+        # surface elevation (times the z factor), NaN on NoData
+        self.Elevation = elevation
+        # True where the surface is seen from the start of the profile
+        self.Visible = visible
+
+    def GetCount (self):
+        return len(self.Offsets) - 1
+
+    def GetProfile (self,index):
+        ## returns (distance,x,y,elevation,visible) of one profile
+        first,last = self.Offsets[index],self.Offsets[index + 1]
+        return (self.Distance[first:last],self.X[first:last],self.Y[first:last],
+                self.Elevation[first:last],self.Visible[first:last])
+
+    def TargetVisible (self):
+        ## True for the profiles whose last station is seen from the first
+        last = self.Offsets[1:] - 1
+        seen = numpy.zeros(self.GetCount(),numpy.bool_)
+        filled = self.Offsets[1:] > self.Offsets[:-1]
+        seen[filled] = self.Visible[last[filled]]
+        return seen
+
+
+def ZUnitFactor(gp,spatial_ref,z_units):
+    ## factor from z_units to the ground distance units of a spatial
+    ## reference (meters for geographic), worked out once per run
+    if (spatial_ref.Type == "Geographic"):
+        out_units = "meters"
+    elif (spatial_ref.Type == "Projected"):
+        out_units = spatial_ref.LinearUnitName
+    else:
+        return 1.0
+    import MAScriptUtils
+    factor = MAScriptUtils.ConvertLinearUnits(gp,1.0,z_units,out_units)
+    if (factor == None):
+        raise Exception, msgCouldNotConvertUnits % (str(z_units),str(out_units))
+    return float(factor)
+
+def ReadPolylines(gp,polyline_fc):
+    ## reads the vertices of a polyline feature class in one cursor pass,
+    ## returns (oids,lines) where each line is an (n,2) array of x,y (the
+    ## parts of a multipart line are joined in order)
+    desc = gp.Describe(polyline_fc)
+    if (desc.ShapeType != "Polyline"):
+        raise Exception, msgNotPolylines % (str(polyline_fc))
+    shape_field = desc.ShapeFieldName
+    oid_field = desc.OIDFieldName
+    oids = []
+    lines = []
+    rows = gp.SearchCursor(polyline_fc)
+    row = rows.Next()
+    while row:
+        feat = row.GetValue(shape_field)
+        coords = []
+        for part_number in range(feat.PartCount):
+            part = feat.GetPart(part_number)
+            part.Reset()
+            pnt = part.Next()
+            while pnt:
+                coords.append((pnt.x,pnt.y))
+                pnt = part.Next()
+        oids.append(row.GetValue(oid_field))
+        lines.append(numpy.array(coords,numpy.float64).reshape(-1,2))
+        row = rows.Next()
+    del rows
+    return oids,lines
+
+def SegmentLengths(surface,x,y):
+    ## ground length of the segments between consecutive vertices
+    dx = numpy.diff(x)
+    dy = numpy.diff(y)
+    if (surface.Geographic == True):
+        lat_m,lon_m = Surface.MetersPerDegree((y[1:] + y[:-1]) * 0.5)
+        dx = dx * lon_m
+        dy = dy * lat_m
+    return numpy.sqrt((dx * dx) + (dy * dy))
+
+def ProfileStations(surface,lines,spacing):
+    ## stations every spacing (ground units) along each line, and its last
+    ## vertex: returns (offsets,distance,x,y) flat over all lines
+    if (spacing <= 0.0):
+        raise Exception, msgBadSpacing
+    counts = numpy.array([len(line) for line in lines],numpy.int64)
+    vertex_offsets = numpy.concatenate(([0],numpy.cumsum(counts)))
+    if (vertex_offsets[-1] == 0):
+        empty = numpy.zeros(0,numpy.float64)
+        return numpy.zeros(len(lines) + 1,numpy.int64),empty,empty,empty
+    vx = numpy.concatenate([line[:,0] for line in lines])
+    vy = numpy.concatenate([line[:,1] for line in lines])
+    # cumulative ground distance of each vertex along its own line
+    seg = SegmentLengths(surface,vx,vy)
+    joins = vertex_offsets[1:-1] - 1
+    seg[joins[(joins >= 0) & (joins < len(seg))]] = 0.0
+    along = numpy.concatenate(([0.0],numpy.cumsum(seg)))
+    start = numpy.zeros(len(lines),numpy.float64)
+    length = numpy.zeros(len(lines),numpy.float64)
+    filled = counts > 0
+    start[filled] = along[vertex_offsets[:-1][filled]]
+    length[filled] = along[vertex_offsets[1:][filled] - 1] - start[filled]
+
+    # stations at 0, spacing, 2 spacing ... and the end of each line
+    stations = numpy.where(filled,numpy.floor(length / spacing).astype(numpy.int64) + 1,0)
+    stations = stations + (filled & ((length % spacing) > 1.0e-9 * numpy.maximum(length,1.0)))
+    offsets = numpy.concatenate(([0],numpy.cumsum(stations)))
+    line_index = numpy.repeat(numpy.arange(len(lines)),stations)
+    k = numpy.arange(offsets[-1]) - offsets[line_index]
+    distance = numpy.minimum(k * spacing,length[line_index])
+
+    # segment holding each station, found on the running distance of all lines
+    # (a station at the end of a line stays on its last segment)
+    total = distance + start[line_index]
+    vertex = numpy.searchsorted(along,total,"right") - 1
+    vertex = numpy.clip(vertex,vertex_offsets[line_index],numpy.maximum(vertex_offsets[line_index + 1] - 2,vertex_offsets[line_index]))
+    nxt = numpy.minimum(vertex + 1,vertex_offsets[line_index + 1] - 1)
+    span = along[nxt] - along[vertex]
+    w = numpy.where(span > 0.0,(total - along[vertex]) / numpy.where(span > 0.0,span,1.0),0.0)
+    w = numpy.clip(w,0.0,1.0)
+    x = vx[vertex] + (w * (vx[nxt] - vx[vertex]))
+    y = vy[vertex] + (w * (vy[nxt] - vy[vertex]))
+    return offsets,distance,x,y
+
+def ProfileVisibility(offsets,distance,elevation,observer_offset=0.0,target_offset=0.0,bUseCurvature=False,refraction_factor=Visibility.DefaultRefraction):
+    ## True where a station (raised by target_offset) is seen from the first
+    ## station of its profile (raised by observer_offset), found as a running
+    ## maximum of the sight line slope over chunks of profiles
+    visible = numpy.zeros(len(distance),numpy.bool_)
+    counts = offsets[1:] - offsets[:-1]
+    order = numpy.argsort(counts,kind="mergesort")
+    order = order[counts[order] > 0]
+    ground = elevation
+    if (bUseCurvature == True):
+        ground = elevation - Visibility.CurvatureCorrection(distance,refraction_factor)
+    start = 0
+    while (start < len(order)):
+        end = min(len(order),start + max(1,ChunkSamples / int(counts[order[start]])))
+        while (end - start > 1 and (end - start) * int(counts[order[end - 1]]) > ChunkSamples):
+            end = start + ((end - start) / 2)
+        chunk = order[start:end]
+        start = end
+        width = int(counts[chunk].max())
+        k = numpy.arange(width)[numpy.newaxis,:]
+        inside = k < counts[chunk][:,numpy.newaxis]
+        index = numpy.where(inside,offsets[chunk][:,numpy.newaxis] + k,offsets[chunk][:,numpy.newaxis])
+        dist = distance[index]
+        z = ground[index]
+        eye = z[:,0] + observer_offset
+        valid = inside & ~numpy.isnan(z) & (dist > 0.0)
+        safe = numpy.where(valid,dist,1.0)
+        slope = numpy.where(valid,(z - eye[:,numpy.newaxis]) / safe,Visibility.NoHorizon)
+        target_slope = numpy.where(valid,(z + target_offset - eye[:,numpy.newaxis]) / safe,Visibility.NoHorizon)
+        horizon = numpy.zeros(slope.shape,numpy.float64) + Visibility.NoHorizon
+        horizon[:,1:] = numpy.maximum.accumulate(slope,axis=1)[:,:-1]
+        seen = valid & (target_slope >= horizon)
+        seen[:,0] = ~numpy.isnan(z[:,0])
+        visible[index[inside]] = seen[inside]
+    return visible
+
+def SampleProfiles(surface,lines,spacing=None,method="BILINEAR",z_factor=1.0,observer_offset=0.0,target_offset=0.0,bUseCurvature=False,refraction_factor=Visibility.DefaultRefraction):
+    ## samples the surface along polylines ((n,2) arrays of map x,y) every
+    ## spacing ground units (default the cell size) and returns Profiles.
+    ## Elevations are multiplied by z_factor (see ZUnitFactor) before the
+    ## visibility from the start of each profile is found.
+    if (spacing == None):
+        cellwidth,cellheight = surface.GroundCellSize(surface.Rows / 2)
+        spacing = min(cellwidth,cellheight)
+    offsets,distance,x,y = ProfileStations(surface,lines,float(spacing))
+    elevation = surface.InterpolateArray(x,y,method) * float(z_factor)
+    visible = ProfileVisibility(offsets,distance,elevation,observer_offset,target_offset,bUseCurvature,refraction_factor)
+    if (debug == True):
+        print "Profiles: %s lines, %s stations" % (str(len(lines)),str(len(distance)))
+    return Profiles(offsets,distance,x,y,elevation,visible)
@@ -0,0 +1,142 @@
+#!/usr/bin/env python
+# -*- coding: latin-1 -*-
+
+#
+# ProfilePlot.py
+#
+# Military Analyst headless profile plots
+#
+# Renders surface profiles (see Profile.py) to PNG or SVG files, or to one
+# multi-page PDF, without a window: the figure is drawn on the Agg canvas
+# (or the PDF/SVG backend when saving) and never shown. One figure and its
+# lines are made once and only their data is changed for each profile.
+#
+# THIS MODULE REQUIRES 3RD PARTY PYTHON LIBs:
+# numpy: www.scipy.org
+# matplotlib: http://matplotlib.sourceforge.net/
+#
+
+import os, sys
+import numpy
+
+debug = False
+
+# output formats
+RenderFormats = ["PNG","SVG","PDF"]
+
+# fraction of the data range left around a profile
+PlotMargin = 0.05
+
+# error messages
+msgBadRenderFormat = "Unknown profile plot format %s, use PNG, SVG or PDF."
+msgIsVisible = "Line of Sight Surface Profile Plot. \n The target is visible."
+msgIsNotVisible = "Line of Sight Surface Profile Plot. \n The target is not visible."
+
+class ProfileRenderer:
+    #width,height,dpi
+    def __init__(self,width=8.0,height=4.0,dpi=100):
+        from matplotlib.figure import Figure
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+        self.Figure = Figure(figsize=(width,height),dpi=dpi)
+        self.Canvas = FigureCanvasAgg(self.Figure)
+        self.Axes = self.Figure.add_subplot(111)
+        # visible parts blue, hidden parts red, the line of sight black (as PlotProfile)
+        self.VisibleLine = self.Axes.plot([],[],"b",linewidth=2)[0]
+        self.HiddenLine = self.Axes.plot([],[],"r",linewidth=2)[0]
+        self.SightLine = self.Axes.plot([],[],"k-")[0]
+        self.Title = self.Axes.set_title("")
+        self.Axes.set_ylabel("Elevation")
+        self.Axes.set_xlabel("Distance")
+        self.Axes.grid(True)
+
+    def Draw (self,distance,elevation,visible,observer_offset=0.0,target_offset=0.0,title=None):
+        ## sets the lines to one profile, each visible or hidden run is
+        ## drawn up to the first station of the next run so the line is whole
+        distance = numpy.asarray(distance,numpy.float64)
+        elevation = numpy.asarray(elevation,numpy.float64)
+        visible = numpy.asarray(visible,numpy.bool_)
+        joined = visible.copy()
+        joined[1:] = joined[1:] | visible[:-1]
+        hidden = ~visible
+        hidden[1:] = hidden[1:] | ~visible[:-1]
+        self.VisibleLine.set_data(distance,numpy.where(joined,elevation,numpy.nan))
+        self.HiddenLine.set_data(distance,numpy.where(hidden,elevation,numpy.nan))
+        if (len(distance) > 0):
+            self.SightLine.set_data([distance[0],distance[-1]],
+                                    [elevation[0] + observer_offset,elevation[-1] + target_offset])
+            bTargetVisible = bool(visible[-1])
+        else:
+            self.SightLine.set_data([],[])
+            bTargetVisible = False
+        if (title == None):
+            if (bTargetVisible == True):
+                title = msgIsVisible
+            else:
+                title = msgIsNotVisible
+        self.Title.set_text(title)
+        self.SetLimits(distance,elevation,observer_offset,target_offset)
+
+    def SetLimits (self,distance,elevation,observer_offset=0.0,target_offset=0.0):
+        ## fits the axes to a profile directly from its data, rather than
+        ## through relim and autoscale which walk every artist
+        bounds = numpy.concatenate((elevation,elevation[:1] + observer_offset,elevation[-1:] + target_offset))
+        bounds = bounds[~numpy.isnan(bounds)]
+        if (len(distance) == 0 or len(bounds) == 0):
+            self.Axes.set_xlim(0.0,1.0)
+            self.Axes.set_ylim(0.0,1.0)
+            return
+        xmin,xmax = float(distance[0]),float(distance[-1])
+        ymin,ymax = float(bounds.min()),float(bounds.max())
+        if (xmax <= xmin): xmax = xmin + 1.0
+        ypad = max((ymax - ymin) * PlotMargin,0.5)
+        self.Axes.set_xlim(xmin,xmax)
+        self.Axes.set_ylim(ymin - ypad,ymax + ypad)
+
+    def Save (self,out_file,render_format="PNG"):
+        ## writes the current profile to a PNG or SVG file, or adds it as a
+        ## page to an open matplotlib PdfPages
+        if (render_format == "PDF"):
+            out_file.savefig(self.Figure)
+        elif (render_format == "PNG"):
+            self.SavePNG(out_file)
+        else:
+            self.Figure.savefig(out_file,format=render_format.lower())
+        return out_file
+
+    def SavePNG (self,out_file):
+        ## writes straight from the Agg canvas, with no savefig round trip
+        self.Canvas.print_png(out_file)
+
+
+def RenderProfiles(profiles,out_path,render_format="PNG",titles=None,observer_offset=0.0,target_offset=0.0,width=8.0,height=4.0,dpi=100,basename="profile"):
+    ## renders every profile of a Profile.Profiles: PNG and SVG go to
+    ## out_path/basename_00001.png ..., PDF to one file out_path with a page
+    ## per profile. Returns the list of files written.
+    render_format = str(render_format).upper()
+    if not (render_format in RenderFormats):
+        raise Exception, msgBadRenderFormat % (str(render_format))
+    renderer = ProfileRenderer(width,height,dpi)
+    written = []
+    pdf = None
+    if (render_format == "PDF"):
+        from matplotlib.backends.backend_pdf import PdfPages
+        pdf = PdfPages(out_path)
+    try:
+        for index in range(profiles.GetCount()):
+            distance,x,y,elevation,visible = profiles.GetProfile(index)
+            title = None
+            if (titles != None):
+                title = titles[index]
+            renderer.Draw(distance,elevation,visible,observer_offset,target_offset,title)
+            if (pdf != None):
+                renderer.Save(pdf,"PDF")
+            else:
+                out_file = os.path.join(out_path,"%s_%05d.%s" % (basename,index + 1,render_format.lower()))
+                written.append(renderer.Save(out_file,render_format))
+            if (debug == True):
+                print "Rendered profile %s of %s" % (str(index + 1),str(profiles.GetCount()))
+    finally:
+        if (pdf != None):
+            pdf.close()
+            written.append(out_path)
+    return written
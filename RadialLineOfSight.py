@@ -12,7 +12,7 @@
 ##
 ##DATE: 
 ##
-##Usage: RadialLineOfSight(<observers>,<input_surface>,<output_workspace>,<fc_basename>,{METERS | FEET | KILOMETERS | US_SURVEY_FEET | MILES | NAUTICAL_MILES})
+##Usage: RadialLineOfSight(<observers>,<input_surface>,<output_workspace>,<fc_basename>,{METERS | FEET | KILOMETERS | US_SURVEY_FEET | MILES | NAUTICAL_MILES},{LICENSED | NATIVE},{observer_mask_file},{number_of_processes},{simplify_tolerance},{FORWARD | REVERSE})
 ##*********************************************************************************************************************"""
 
 # error messages
@@ -26,6 +26,7 @@ msgSurfaceNotRaster = "Input surface must be a raster dataset or raster catalog"
 msgOutputExists = "Output dataset %s already exists."
 msgProjectObservers = "Could not project observers to Azimuthal Equidistant for processing: \n %s"
 msgProjectRaster = "Could not project suface to Azimuthal Equidistant for processing: \n %s"
+msgProjectObserversToSurface = "Could not project observers to the surface coordinate system for processing: \n %s"
 msgErrorDuringViewshed = "Error in creating viewshed.\n"
 msgMissingObserverFields = "Input observers are missing the following required fields:\n %s"
 msgNoMosaic = "Could not mosaic %s catalog for processing."
@@ -34,12 +35,26 @@ msgNoCentroid = "Could not calculate centroid of observer points for processing.
 msgCouldNotConvertVis = "Could not convert visibility to polygons: \n %s"
 msgOutputParamsError = "Error in setting output parameters: \n %s"
 msgLicenseCheckInError = "Error in checking in extension: \n %s" 
+msgNUMPYNotAvailable = "The NUMPY library is not available for the NATIVE visibility engine.\n NUMPY: http://www.scipy.org/"
 
 # status messages
 msgProcessComplete = "Processing completed."
 msgProjectingObservers = "Projecting observer points for processing."
 msgProjectingSurface = "Projecting input surface for processing (This may take some time). "
 msgRadialDistanceUnitsDefault = "Defaulting to radial distance units of meters"
+msgUsingNativeEngine = "No Spatial Analyst or 3D Analyst license available, using the NATIVE visibility engine."
+msgNativeViewshed = "Calculating viewshed with the NATIVE visibility engine."
+msgMaskNeedsNative = "Observer masks are only written by the NATIVE visibility engine, no mask file will be written."
+msgWritingObserverMask = "Writing observer mask to %s"
+msgUsingCurvature = "Correcting for earth curvature with a refraction coefficient of %s."
+msgNoMultiprocessing = "Parallel processing needs Python 2.6 or later, observers will be processed serially."
+msgTiledViewshed = "Surface is too large to load, calculating the viewshed tile by tile."
+msgTiledNoMaskOrParallel = "Observer masks and parallel processing are not available for tiled surfaces and will be skipped."
+msgWritingVisibilityPolygons = "Writing visibility polygons."
+msgNativeGeographic = "Input surface is geographic, the NATIVE visibility engine will use it without projecting."
+msgReverseNeedsNative = "Reverse viewsheds are only calculated by the NATIVE visibility engine, which will be used."
+msgReverseViewshed = "Calculating the reverse viewshed: the cells from which the input points (targets) can be seen."
+msgVirtualMosaic = "Reading the catalog tiles through a virtual mosaic, no mosaic raster is written."
 
 
 # import libraries
@@ -58,6 +73,38 @@ input_surface = gp.GetParameterAsText(1)
 output_workspace = gp.GetParameterAsText(2)
 output_basename = gp.GetParameterAsText(3)
 radial_distance_units = gp.GetParameterAsText(4) #Optional
+if (len(sys.argv) > 8):
+    visibility_engine = gp.GetParameterAsText(7) # <LICENSED | NATIVE>
+else:
+    visibility_engine = "#"
+if (len(sys.argv) > 9):
+    observer_mask_file = gp.GetParameterAsText(8) # {observer_mask_file} (.npz)
+else:
+    observer_mask_file = "#"
+if (observer_mask_file == None or observer_mask_file == ""):
+    observer_mask_file = "#"
+if (len(sys.argv) > 10):
+    number_of_processes = gp.GetParameterAsText(9) # {number_of_processes} 0 or empty picks one per CPU
+else:
+    number_of_processes = "#"
+if (number_of_processes == None or number_of_processes == "" or number_of_processes == "#"):
+    number_of_processes = 0
+else:
+    number_of_processes = int(number_of_processes)
+if (len(sys.argv) > 11):
+    simplify_tolerance = gp.GetParameterAsText(10) # {simplify_tolerance} in surface units, NATIVE only
+else:
+    simplify_tolerance = "#"
+if (simplify_tolerance == None or simplify_tolerance == "" or simplify_tolerance == "#"):
+    simplify_tolerance = 0.0
+else:
+    simplify_tolerance = float(simplify_tolerance)
+if (len(sys.argv) > 12):
+    viewshed_direction = gp.GetParameterAsText(11) # {FORWARD | REVERSE} REVERSE is NATIVE only
+else:
+    viewshed_direction = "FORWARD"
+if (viewshed_direction != "REVERSE"):
+    viewshed_direction = "FORWARD"
 
 #
 #THIS ONE IS HANDLED AS PART OF THE OBSERVER POINT.
@@ -79,15 +126,28 @@ try:
     DatabaseType = MAScriptUtils.DatabaseType(gp,output_workspace)
     
     # check spatial or 3D license
+    # (or NATIVE engine, which does not need either)
     bUseSpatial = True
-    if (MAScriptUtils.CheckForSpatialAnalystLicense(gp)):
+    bUseNative = False
+    if (visibility_engine == "NATIVE"):
+        bUseSpatial = False
+        bUseNative = True
+    elif (viewshed_direction == "REVERSE"):
+        bUseSpatial = False
+        bUseNative = True
+        if (visibility_engine == "LICENSED"): gp.AddWarning(msgReverseNeedsNative)
+    elif (MAScriptUtils.CheckForSpatialAnalystLicense(gp)):
         bUseSpatial = True
         gp.CheckOutExtension("spatial")
     elif (MAScriptUtils.CheckFor3DAnalystLicense(gp)):
         bUseSpatial = False
         gp.CheckOutExtension("3d")
-    else:
+    elif (visibility_engine == "LICENSED"):
         raise Exception, msgNoLicense
+    else:
+        bUseSpatial = False
+        bUseNative = True
+        gp.AddWarning(msgUsingNativeEngine)
     
     # Check input params exist and outputs do not exist
     if (gp.Exists(input_observers) != True):
@@ -172,13 +232,27 @@ try:
     curvature = "FLAT_EARTH"
     refrac_coeff = "#"
     
+    # the NATIVE engine corrects curvature itself, so it can use the MA options
+    bUseCurvature,refraction_factor = MAScriptUtils.GetTerrainCurvatureOptions(gp)
+    
     
     # if Raster Catalog mosaic to single surface for RLOS computation
     tempsurf = MAScriptUtils.GenerateTempFileName(gp,workspace[1],"RasterDataset")
 
     surf_mosaic = None
+    virtual_mosaic = None
     surf_desc = gp.Describe(input_surface)
-    if (str(surf_desc.DatasetType) == "RasterCatalog"):
+    if (str(surf_desc.DatasetType) == "RasterCatalog" and bUseNative == True and MAScriptUtils.IsGeographicSR(gp,input_surface) == True):
+        # the NATIVE engine reads the tiles of a geographic catalog in place,
+        # loaded whole or streamed window by window by the tiled engine
+        try:
+            import VirtualMosaic
+        except ImportError:
+            raise Exception, msgNUMPYNotAvailable
+        virtual_mosaic = VirtualMosaic.VirtualMosaic(gp,input_surface,obs_extent,workspace[1])
+        gp.AddMessage(msgVirtualMosaic)
+        print msgVirtualMosaic
+    if (str(surf_desc.DatasetType) == "RasterCatalog" and virtual_mosaic == None):
         # Mosaic all tiles that fall in extent and clip: MAScriptUtils.MosaicAndClip
         surf_mosaic = MAScriptUtils.MosaicAndClip(gp,input_surface,tempsurf,obs_extent)
         if (surf_mosaic == None):
@@ -197,12 +271,27 @@ try:
     # set AZED for the centroid of envelope
     spatial_ref_azed = MAScriptUtils.SetAZED(gp,0.0,0.0,obs_centroid[0],obs_centroid[1])
     
+    # the NATIVE engine measures ground distances on a geographic surface
+    # itself, so the surface is not resampled to AZED
+    bNativeGeographic = (bUseNative == True and MAScriptUtils.IsGeographicSR(gp,input_surface) == True)
     
     # is observer fc in AZED, if not, project it.
     observers_azed = MAScriptUtils.GenerateTempFileName(gp,workspace[1],"FeatureClass")
     sr_obs = gp.Describe(input_observers).SpatialReference
     sr_obs_name = sr_obs.Name
-    if (sr_obs_name != "Azimuthal Equidistant"):
+    if (bNativeGeographic == True):
+        # observers only need to be in the coordinate system of the surface
+        sr_surf = gp.Describe(input_surface).SpatialReference
+        if (sr_obs_name != sr_surf.Name):
+            try:
+                gp.AddMessage(msgProjectingObservers)
+                print msgProjectingObservers
+                gp.project_management(input_observers,observers_azed,sr_surf,"#",sr_obs)
+            except:
+                raise Exception, msgProjectObserversToSurface % (gp.GetMessages())
+        else:
+            observers_azed = input_observers
+    elif (sr_obs_name != "Azimuthal Equidistant"):
         try:
             #if not project to AZED
             gp.AddMessage(msgProjectingObservers)
@@ -217,7 +306,11 @@ try:
     # is surface in AZED, if not, project it.
     surface_azed = MAScriptUtils.GenerateTempFileName(gp,workspace[1],"RasterDataset")
     sr_surf = gp.Describe(input_surface).SpatialReference
-    if (sr_surf.Name != "Azimuthal Equidistant"):
+    if (bNativeGeographic == True):
+        gp.AddMessage(msgNativeGeographic)
+        print msgNativeGeographic
+        surface_azed = input_surface
+    elif (sr_surf.Name != "Azimuthal Equidistant"):
         try:
             #if not project to AZED
             gp.AddMessage(msgProjectingSurface)
@@ -235,12 +328,67 @@ try:
     # do the viewshed
     out_vis_raster = MAScriptUtils.GenerateTempFileName(gp,workspace[1],"RasterDataset")
 
-    if (bUseSpatial == True):
+    if (bUseNative == True):
+        try:
+            import Surface, Visibility, TiledVisibility
+        except ImportError:
+            raise Exception, msgNUMPYNotAvailable
+        try:
+            gp.AddMessage(msgNativeViewshed)
+            print msgNativeViewshed
+            observers = Visibility.ReadObservers(gp,observers_azed)
+            if (viewshed_direction == "REVERSE"):
+                # the same sweep from each target, with the offsets swapped
+                gp.AddMessage(msgReverseViewshed)
+                print msgReverseViewshed
+                observers = Visibility.ReverseObservers(observers)
+            if (bUseCurvature == True):
+                gp.AddMessage(msgUsingCurvature % (str(refraction_factor)))
+            # surfaces too large to load are swept tile by tile from disk
+            if (virtual_mosaic != None):
+                bUseTiled = ((virtual_mosaic.Rows * virtual_mosaic.Cols) > TiledVisibility.TiledMinCells)
+            else:
+                surf_desc = gp.Describe(surface_azed)
+                bUseTiled = ((float(surf_desc.Height) * float(surf_desc.Width)) > TiledVisibility.TiledMinCells)
+            if (bUseTiled == True):
+                gp.AddMessage(msgTiledViewshed)
+                print msgTiledViewshed
+                if (observer_mask_file != "#" or number_of_processes > 1): gp.AddWarning(msgTiledNoMaskOrParallel)
+                temp_float = MAScriptUtils.GenerateTempFileName(gp,workspace[1],"FloatFile")
+                counts_float = TiledVisibility.CountsGridName(temp_float)
+                if (virtual_mosaic != None):
+                    # catalog tiles are read window by window, no float grid of the surface
+                    surface_float = None
+                    surface = TiledVisibility.MosaicTiledSurface(virtual_mosaic)
+                else:
+                    surface_float = temp_float
+                    surface = TiledVisibility.TiledSurfaceFromRaster(gp,surface_azed,surface_float)
+                TiledVisibility.TiledCumulativeViewshed(surface,observers,counts_float,bUseCurvature,refraction_factor)
+                vis_counts = TiledVisibility.OpenCountsGrid(counts_float)
+            else:
+                if (virtual_mosaic != None):
+                    surface = virtual_mosaic.GetSurface()
+                    virtual_mosaic.Close()
+                else:
+                    surface = Surface.SurfaceFromRaster(gp,surface_azed,workspace[1])
+                if (number_of_processes > 1 and Visibility.CanRunParallel() == False):
+                    gp.AddWarning(msgNoMultiprocessing)
+                vis_counts,vis_masks = Visibility.ParallelCumulativeViewshed(surface,observers,number_of_processes,(observer_mask_file != "#"),
+                                                                             bUseCurvature,refraction_factor)
+                if (observer_mask_file != "#"):
+                    gp.AddMessage(msgWritingObserverMask % (observer_mask_file))
+                    Visibility.WriteObserverMask(observer_mask_file,surface,observers,vis_counts,vis_masks)
+                del vis_masks
+        except Exception, ErrorMessage:
+            raise Exception, msgErrorDuringViewshed + str(ErrorMessage)
+    elif (bUseSpatial == True):
+        if (observer_mask_file != "#"): gp.AddWarning(msgMaskNeedsNative)
         try:
             gp.viewshed_sa(surface_azed,observers_azed,out_vis_raster,str(1.0),curvature,refrac_coeff)
         except:
             raise Exception, msgErrorDuringViewshed + gp.GetMessages()
     else:
+        if (observer_mask_file != "#"): gp.AddWarning(msgMaskNeedsNative)
         try:
             gp.viewshed_3d(surface_azed,observers_azed,out_vis_raster,str(1.0),curvature,refrac_coeff)
         except:
@@ -255,16 +403,36 @@ try:
     #gp.Copy(observers_azed,final_observers) #gp.COPY always returns a Segment Violation with output FGDB
     gp.FeatureClassToFeatureClass_conversion(observers_azed,output_workspace,output_basename + "_obs","#","#","#") #db_params[1])
     # remove temp observers
-    gp.Delete(observers_azed)
+    if (observers_azed != input_observers): gp.Delete(observers_azed)
 
     # - output viewshed
     final_viewshed = output_workspace + os.sep + output_basename + "_vis"
     if (DatabaseType == "FileSystem"):
         final_viewshed = final_viewshed + ".shp"
+    if (bUseNative == True):
+        # polygons are traced from the visibility counts directly
+        try:
+            import Polygonize
+            gp.AddMessage(msgWritingVisibilityPolygons)
+            print msgWritingVisibilityPolygons
+            if (bUseTiled == True):
+                Polygonize.WritePolygons(gp,final_viewshed,surface,vis_counts,simplify_tolerance,nodata=TiledVisibility.CountsNoData)
+                del surface, vis_counts
+                if (surface_float != None):
+                    Surface.DeleteFloatGrid(surface_float)
+                else:
+                    virtual_mosaic.Close()
+                Surface.DeleteFloatGrid(counts_float)
+            else:
+                Polygonize.WritePolygons(gp,final_viewshed,surface,vis_counts,simplify_tolerance)
+                del surface, vis_counts
+        except Exception, ErrorMessage:
+            raise Exception, msgCouldNotConvertVis % (str(ErrorMessage))
     try:
-        gp.RasterToPolygon_conversion(out_vis_raster,final_viewshed,"NO_SIMPLIFY","VALUE")
+        if (bUseNative == False):
+            gp.RasterToPolygon_conversion(out_vis_raster,final_viewshed,"NO_SIMPLIFY","VALUE")
         if (gp.Exists(out_vis_raster) == True): gp.Delete(out_vis_raster)
-        if (gp.Exists(surface_azed) == True): gp.Delete(surface_azed)
+        if (surface_azed != input_surface and gp.Exists(surface_azed) == True): gp.Delete(surface_azed)
     except:
         raise Exception, msgCouldNotConvertVis % (gp.GetMessages())
     
@@ -284,7 +452,9 @@ try:
 
     # check license back in
     try:
-        if (bUseSpatial == True):
+        if (bUseNative == True):
+            pass
+        elif (bUseSpatial == True):
             gp.CheckInExtension("spatial")
         else:
             gp.CheckInExtension("3d")
@@ -298,7 +468,9 @@ try:
 
 except Exception, ErrorMessage:
     
-    if (bUseSpatial == True):
+    if ("bUseNative" in globals() and bUseNative == True):
+        pass
+    elif (bUseSpatial == True):
         gp.CheckInExtension("spatial")
     else:
         gp.CheckInExtension("3d")
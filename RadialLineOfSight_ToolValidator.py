@@ -20,6 +20,11 @@ class ToolValidator:
     # 4 - Radial distance units
     # 5 - Output observers
     # 6 - Output Visiblity
+    # 7 - Visibility engine
+    # 8 - Output observer mask file (.npz)
+    # 9 - Number of processes
+    # 10 - Polygon simplify tolerance
+    # 11 - Viewshed direction (FORWARD | REVERSE)
     
     self.params[0].Filter.List = ["POINT"]
     #ERROR
@@ -28,6 +33,14 @@ class ToolValidator:
     self.params[4].Filter.List = ["METERS","FEET","KILOMETERS","US_SURVEY_FEET","MILES","NAUTICAL_MILES"]
     self.params[4].Value = "METERS"
     
+    # 7 - 11 are optional, a toolbox that does not declare them still opens
+    if (len(self.params) > 7):
+        self.params[7].Filter.List = ["LICENSED","NATIVE"]
+    
+    if (len(self.params) > 11):
+        self.params[11].Filter.List = ["FORWARD","REVERSE"]
+        self.params[11].Value = "FORWARD"
+    
     self.params[5].Schema.FeatureTypeRule = "AsSpecified"
     self.params[5].Schema.FeatureType = "Simple"
     self.params[5].Schema.GeometryTypeRule = "AsSpecified"
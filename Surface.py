@@ -0,0 +1,391 @@
+#!/usr/bin/env python
+# -*- coding: latin-1 -*-
+
+#
+# Surface.py
+#
+# Military Analyst in-memory elevation surface
+#
+# Holds a raster surface as a NumPy array (row 0 is the northern edge) with
+# the georeferencing needed to go between map coordinates and cells.
+# Rasters are moved in and out through the ESRI binary float format
+# (RasterToFloat / FloatToRaster) so no extension license is required.
+#
+# A surface in a geographic coordinate system keeps its cells in degrees,
+# ground distances are found with the meters per degree at each latitude.
+#
+
+import os, sys, string
+import numpy
+
+debug = False
+
+# error messages
+msgCouldNotExportSurface = "Could not export surface %s to float grid: \n %s"
+msgCouldNotImportSurface = "Could not import grid to raster %s: \n %s"
+msgBadHeader = "Float grid header %s is missing the %s keyword."
+msgBadGridShape = "Array shape %s does not match surface shape %s."
+msgBadInterpolation = "Unknown interpolation method %s, use NEAREST, BILINEAR or CUBIC."
+msgCouldNotClipSurface = "Could not clip surface %s around the points: \n %s"
+msgExtentOffSurface = "Extent %s does not overlap surface %s."
+
+# interpolation methods of InterpolateArray
+InterpolationMethods = ["NEAREST","BILINEAR","CUBIC"]
+
+# cells read around a point by each interpolation method
+InterpolationMargins = {"NEAREST":0,"BILINEAR":1,"CUBIC":2}
+
+def MetersPerDegree(latitude):
+    ## returns (meters per degree of latitude, meters per degree of longitude)
+    ## on the WGS 1984 ellipsoid, latitude in degrees (scalar or array)
+    phi = numpy.radians(latitude)
+    lat_m = 111132.92 - (559.82 * numpy.cos(2.0 * phi)) + (1.175 * numpy.cos(4.0 * phi)) - (0.0023 * numpy.cos(6.0 * phi))
+    lon_m = (111412.84 * numpy.cos(phi)) - (93.5 * numpy.cos(3.0 * phi)) + (0.118 * numpy.cos(5.0 * phi))
+    return lat_m,lon_m
+
+class Surface:
+    #elevation,xmin,ymax,cellwidth,cellheight
+    def __init__(self,elevation,xmin,ymax,cellwidth,cellheight):
+        # elevation is a 2D array, NoData cells are NaN
+        self.Elevation = elevation
+        self.XMin = float(xmin)
+        self.YMax = float(ymax)
+        self.CellWidth = float(cellwidth)
+        self.CellHeight = float(cellheight)
+        self.Rows = elevation.shape[0]
+        self.Cols = elevation.shape[1]
+        self.SpatialReference = None
+        # True when cells are in degrees of latitude and longitude
+        self.Geographic = False
+
+    def GetExtent (self):
+        ## Left, Bottom, Right, Top
+        return [self.XMin, self.YMax - (self.Rows * self.CellHeight),
+                self.XMin + (self.Cols * self.CellWidth), self.YMax]
+
+    def MapToCell (self,x,y):
+        ## returns the (row,col) of the cell containing x,y
+        col = int(numpy.floor((float(x) - self.XMin) / self.CellWidth))
+        row = int(numpy.floor((self.YMax - float(y)) / self.CellHeight))
+        return row,col
+
+    def CellToMap (self,row,col):
+        ## returns the x,y of the center of a cell
+        x = self.XMin + ((col + 0.5) * self.CellWidth)
+        y = self.YMax - ((row + 0.5) * self.CellHeight)
+        return x,y
+
+    def ContainsCell (self,row,col):
+        return (0 <= row < self.Rows) and (0 <= col < self.Cols)
+
+    def RowLatitude (self,row):
+        ## latitude of a (possibly fractional) row center on a geographic surface
+        return self.YMax - ((row + 0.5) * self.CellHeight)
+
+    def GroundCellSize (self,row):
+        ## returns the (width,height) of the cells in a row in ground units,
+        ## meters on a geographic surface
+        if (self.Geographic == False):
+            return self.CellWidth,self.CellHeight
+        lat_m,lon_m = MetersPerDegree(self.RowLatitude(row))
+        return float(lon_m * self.CellWidth),float(lat_m * self.CellHeight)
+
+    def GroundOffsets (self,row,dr,dc):
+        ## returns the (east,north) ground distances from the center of a cell
+        ## in row to the cells offset by dr rows and dc columns. On a geographic
+        ## surface the scale is taken at the mid latitude of each offset.
+        if (self.Geographic == False):
+            return dc * self.CellWidth,-dr * self.CellHeight
+        lat_m,lon_m = MetersPerDegree(self.RowLatitude(row + (dr * 0.5)))
+        return dc * self.CellWidth * lon_m,-dr * self.CellHeight * lat_m
+
+    def Interpolate (self,x,y):
+        ## bilinear interpolation between cell centers, None if outside or NoData
+        fc = ((float(x) - self.XMin) / self.CellWidth) - 0.5
+        fr = ((self.YMax - float(y)) / self.CellHeight) - 0.5
+        fc = min(max(fc,0.0),self.Cols - 1.0)
+        fr = min(max(fr,0.0),self.Rows - 1.0)
+        c0 = min(int(fc),self.Cols - 2)
+        r0 = min(int(fr),self.Rows - 2)
+        if (c0 < 0 or r0 < 0):
+            # single row or column surface
+            z = self.Elevation[int(fr),int(fc)]
+        else:
+            wc = fc - c0
+            wr = fr - r0
+            block = self.Elevation[r0:r0 + 2,c0:c0 + 2]
+            z = ((block[0,0] * (1.0 - wc) + block[0,1] * wc) * (1.0 - wr)) + \
+                ((block[1,0] * (1.0 - wc) + block[1,1] * wc) * wr)
+        if (numpy.isnan(z)):
+            return None
+        return float(z)
+
+    def InterpolateArray (self,xs,ys,method="BILINEAR"):
+        ## interpolation of arrays of points, NaN where NoData. method is
+        ## NEAREST (the cell holding the point), BILINEAR between the four
+        ## nearest cell centers or CUBIC convolution of the 16 nearest.
+        ## Points off the surface take the cells at its edge.
+        method = str(method).upper()
+        if (method == "BILINEAR"):
+            return self.InterpolateBilinear(xs,ys)
+        elif (method == "NEAREST"):
+            return self.InterpolateNearest(xs,ys)
+        elif (method == "CUBIC"):
+            return self.InterpolateCubic(xs,ys)
+        raise Exception, msgBadInterpolation % (str(method))
+
+    def InterpolateNearest (self,xs,ys):
+        col = numpy.floor((numpy.asarray(xs,numpy.float64) - self.XMin) / self.CellWidth)
+        row = numpy.floor((self.YMax - numpy.asarray(ys,numpy.float64)) / self.CellHeight)
+        col = numpy.clip(col,0,self.Cols - 1).astype(numpy.int32)
+        row = numpy.clip(row,0,self.Rows - 1).astype(numpy.int32)
+        return numpy.asarray(self.Elevation[row,col],numpy.float64)
+
+    def InterpolateBilinear (self,xs,ys):
+        fc = ((numpy.asarray(xs,numpy.float64) - self.XMin) / self.CellWidth) - 0.5
+        fr = ((self.YMax - numpy.asarray(ys,numpy.float64)) / self.CellHeight) - 0.5
+        fc = numpy.clip(fc,0.0,self.Cols - 1.0)
+        fr = numpy.clip(fr,0.0,self.Rows - 1.0)
+        c0 = numpy.clip(fc.astype(numpy.int32),0,max(self.Cols - 2,0))
+        r0 = numpy.clip(fr.astype(numpy.int32),0,max(self.Rows - 2,0))
+        c1 = numpy.minimum(c0 + 1,self.Cols - 1)
+        r1 = numpy.minimum(r0 + 1,self.Rows - 1)
+        wc = fc - c0
+        wr = fr - r0
+        elev = self.Elevation
+        return ((elev[r0,c0] * (1.0 - wc) + elev[r0,c1] * wc) * (1.0 - wr)) + \
+               ((elev[r1,c0] * (1.0 - wc) + elev[r1,c1] * wc) * wr)
+
+    def InterpolateCubic (self,xs,ys):
+        ## cubic convolution (a = -0.5), edge cells are repeated off the surface
+        fc = ((numpy.asarray(xs,numpy.float64) - self.XMin) / self.CellWidth) - 0.5
+        fr = ((self.YMax - numpy.asarray(ys,numpy.float64)) / self.CellHeight) - 0.5
+        fc = numpy.clip(fc,0.0,self.Cols - 1.0)
+        fr = numpy.clip(fr,0.0,self.Rows - 1.0)
+        c = numpy.floor(fc).astype(numpy.int32)
+        r = numpy.floor(fr).astype(numpy.int32)
+        wc = CubicWeights(fc - c)
+        wr = CubicWeights(fr - r)
+        z = numpy.zeros(numpy.shape(fc),numpy.float64)
+        for i in range(4):
+            rr = numpy.clip(r + (i - 1),0,self.Rows - 1)
+            line = numpy.zeros(numpy.shape(fc),numpy.float64)
+            for j in range(4):
+                line = line + (self.Elevation[rr,numpy.clip(c + (j - 1),0,self.Cols - 1)] * wc[j])
+            z = z + (line * wr[i])
+        return z
+
+
+def CubicWeights(t):
+    ## weights of the cells at -1, 0, 1 and 2 from a point t (0 <= t < 1)
+    ## cells along, for cubic convolution with a = -0.5
+    a = -0.5
+    weights = []
+    for d in [1.0 + t,t,1.0 - t,2.0 - t]:
+        near = (((a + 2.0) * d - (a + 3.0)) * d * d) + 1.0
+        far = (((a * d) - (5.0 * a)) * d + (8.0 * a)) * d - (4.0 * a)
+        weights.append(numpy.where(d <= 1.0,near,far))
+    return weights
+
+def ReadFloatHeader(header_file):
+    ## reads an ESRI .hdr file into a dictionary (keywords are lower case)
+    header = {}
+    hdr = open(header_file,"r")
+    for line in hdr.readlines():
+        parts = line.split()
+        if (len(parts) >= 2):
+            header[parts[0].lower()] = parts[1]
+    hdr.close()
+    for keyword in ["ncols","nrows","cellsize","nodata_value"]:
+        if not (header.has_key(keyword)):
+            raise Exception, msgBadHeader % (header_file,keyword)
+    return header
+
+def WriteFloatHeader(header_file,rows,cols,xmin,ymin,cellsize,nodata):
+    hdr = open(header_file,"w")
+    hdr.write("ncols %s\n" % (str(cols)))
+    hdr.write("nrows %s\n" % (str(rows)))
+    hdr.write("xllcorner %s\n" % (repr(float(xmin))))
+    hdr.write("yllcorner %s\n" % (repr(float(ymin))))
+    hdr.write("cellsize %s\n" % (repr(float(cellsize))))
+    hdr.write("NODATA_value %s\n" % (str(nodata)))
+    if (sys.byteorder == "little"):
+        hdr.write("byteorder LSBFIRST\n")
+    else:
+        hdr.write("byteorder MSBFIRST\n")
+    hdr.close()
+
+def ReadFloatGridInfo(float_file):
+    ## returns (rows,cols,xmin,ymax,cellsize,nodata,dtype) of a .flt/.hdr pair
+    header = ReadFloatHeader(os.path.splitext(float_file)[0] + ".hdr")
+    rows = int(header["nrows"])
+    cols = int(header["ncols"])
+    cellsize = float(header["cellsize"])
+    nodata = float(header["nodata_value"])
+    if (header.get("byteorder","LSBFIRST").upper() == "MSBFIRST"):
+        dtype = ">f4"
+    else:
+        dtype = "<f4"
+    # the corner may be given by center or corner keywords
+    if (header.has_key("xllcenter")):
+        xmin = float(header["xllcenter"]) - (cellsize / 2.0)
+        ymin = float(header["yllcenter"]) - (cellsize / 2.0)
+    else:
+        xmin = float(header["xllcorner"])
+        ymin = float(header["yllcorner"])
+    return rows,cols,xmin,ymin + (rows * cellsize),cellsize,nodata,dtype
+
+def ReadFloatGrid(float_file):
+    ## reads a .flt/.hdr pair into a Surface
+    rows,cols,xmin,ymax,cellsize,nodata,dtype = ReadFloatGridInfo(float_file)
+    elevation = numpy.fromfile(float_file,dtype).astype(numpy.float32).reshape(rows,cols)
+    elevation[elevation == nodata] = numpy.nan
+    return Surface(elevation,xmin,ymax,cellsize,cellsize)
+
+def WriteFloatGrid(surface,values,float_file,nodata=-9999):
+    ## writes values (same shape as the surface) to a .flt/.hdr pair
+    ## cells that are NoData on the surface are written as NoData
+    if (values.shape != (surface.Rows,surface.Cols)):
+        raise Exception, msgBadGridShape % (str(values.shape),str((surface.Rows,surface.Cols)))
+    out_values = numpy.asarray(values,numpy.float32).copy()
+    out_values[numpy.isnan(out_values) | numpy.isnan(surface.Elevation)] = nodata
+    out_values.tofile(float_file)
+    extent = surface.GetExtent()
+    WriteFloatHeader(os.path.splitext(float_file)[0] + ".hdr",surface.Rows,surface.Cols,
+                     extent[0],extent[1],surface.CellWidth,nodata)
+
+def WriteAsciiGrid(surface,values,ascii_file,nodata=-9999):
+    ## writes integer values (same shape as the surface) to an ASCII grid
+    if (values.shape != (surface.Rows,surface.Cols)):
+        raise Exception, msgBadGridShape % (str(values.shape),str((surface.Rows,surface.Cols)))
+    out_values = numpy.asarray(values).astype(numpy.int32)
+    out_values[numpy.isnan(surface.Elevation)] = nodata
+    extent = surface.GetExtent()
+    asc = open(ascii_file,"w")
+    asc.write("ncols %s\n" % (str(surface.Cols)))
+    asc.write("nrows %s\n" % (str(surface.Rows)))
+    asc.write("xllcorner %s\n" % (repr(extent[0])))
+    asc.write("yllcorner %s\n" % (repr(extent[1])))
+    asc.write("cellsize %s\n" % (repr(surface.CellWidth)))
+    asc.write("NODATA_value %s\n" % (str(nodata)))
+    numpy.savetxt(asc,out_values,fmt="%d")
+    asc.close()
+
+def DeleteFloatGrid(float_file):
+    base = os.path.splitext(float_file)[0]
+    for ext in [".flt",".hdr",".prj",".txt"]:
+        if (os.path.exists(base + ext)): os.remove(base + ext)
+
+def SurfaceFromRaster(gp,in_raster,workspace):
+    ## exports a raster dataset to a Surface through a temporary float grid
+    import MAScriptUtils
+    temp_float = MAScriptUtils.GenerateTempFileName(gp,workspace,"FloatFile")
+    try:
+        gp.RasterToFloat_conversion(in_raster,temp_float)
+    except:
+        raise Exception, msgCouldNotExportSurface % (str(in_raster),gp.GetMessages())
+    surface = ReadFloatGrid(temp_float)
+    surface.SpatialReference = gp.Describe(in_raster).SpatialReference
+    surface.Geographic = (surface.SpatialReference.Type == "Geographic")
+    DeleteFloatGrid(temp_float)
+    if (debug == True):
+        msg = "Surface %s: %s rows, %s cols" % (str(in_raster),str(surface.Rows),str(surface.Cols))
+        gp.AddMessage(msg)
+        print msg
+    return surface
+
+def SurfaceFromExtent(gp,in_raster,extent,workspace,margin_cells=1):
+    ## reads only an extent [left,bottom,right,top] (and margin_cells cells around
+    ## it) of a raster dataset into a Surface. A DTED catalog or folder is read
+    ## through a virtual mosaic, a raster dataset is clipped before it is exported.
+    extent = [float(extent[0]),float(extent[1]),float(extent[2]),float(extent[3])]
+    if (IsMosaicSurface(gp,in_raster)):
+        import VirtualMosaic
+        mosaic = VirtualMosaic.VirtualMosaic(gp,in_raster,extent,workspace)
+        try:
+            values = mosaic.ReadWindow([-margin_cells,mosaic.Rows + margin_cells,-margin_cells,mosaic.Cols + margin_cells])
+        finally:
+            mosaic.Close()
+        surface = Surface(values,mosaic.XMin - (margin_cells * mosaic.CellWidth),mosaic.YMax + (margin_cells * mosaic.CellHeight),
+                          mosaic.CellWidth,mosaic.CellHeight)
+        surface.SpatialReference = mosaic.SpatialReference
+        surface.Geographic = mosaic.Geographic
+        return surface
+    desc = gp.Describe(in_raster)
+    raster_extent = [desc.Extent.xmin,desc.Extent.ymin,desc.Extent.xmax,desc.Extent.ymax]
+    margin_x = margin_cells * float(desc.MeanCellWidth)
+    margin_y = margin_cells * float(desc.MeanCellHeight)
+    window = [max(raster_extent[0],extent[0] - margin_x),max(raster_extent[1],extent[1] - margin_y),
+              min(raster_extent[2],extent[2] + margin_x),min(raster_extent[3],extent[3] + margin_y)]
+    if (window[0] >= window[2] or window[1] >= window[3]):
+        raise Exception, msgExtentOffSurface % (str(extent),str(in_raster))
+    import MAScriptUtils
+    temp_clip = MAScriptUtils.GenerateTempFileName(gp,workspace,"RasterDataset")
+    try:
+        gp.Clip_management(in_raster,"%s %s %s %s" % (str(window[0]),str(window[1]),str(window[2]),str(window[3])),temp_clip)
+    except:
+        raise Exception, msgCouldNotClipSurface % (str(in_raster),gp.GetMessages())
+    try:
+        surface = SurfaceFromRaster(gp,temp_clip,workspace)
+    finally:
+        gp.Delete(temp_clip)
+    return surface
+
+def IsMosaicSurface(gp,in_raster):
+    ## True for a DTED folder or a raster catalog, which are read through a
+    ## virtual mosaic, False for a raster dataset (an ArcInfo GRID included)
+    import DTED
+    if (DTED.IsDTEDFolder(gp,in_raster)):
+        return True
+    return (str(gp.Describe(in_raster).DatasetType) == "RasterCatalog")
+
+def SurfaceSpots(gp,in_raster,xs,ys,workspace,method="BILINEAR"):
+    ## interpolates a raster dataset at arrays of points in one call, only
+    ## the window around the points is exported. Returns an array of z, NaN
+    ## for points off the raster or on NoData.
+    xs = numpy.asarray(xs,numpy.float64)
+    ys = numpy.asarray(ys,numpy.float64)
+    zs = numpy.zeros(xs.shape,numpy.float64) + numpy.nan
+    if (len(xs.ravel()) == 0):
+        return zs
+    if (IsMosaicSurface(gp,in_raster)):
+        return CatalogSpots(gp,in_raster,xs,ys,workspace,method)
+    desc = gp.Describe(in_raster)
+    extent = [desc.Extent.xmin,desc.Extent.ymin,desc.Extent.xmax,desc.Extent.ymax]
+    inside = (xs >= extent[0]) & (xs <= extent[2]) & (ys >= extent[1]) & (ys <= extent[3])
+    if not (inside.any()):
+        return zs
+    surface = SurfaceFromExtent(gp,in_raster,[xs[inside].min(),ys[inside].min(),xs[inside].max(),ys[inside].max()],
+                                workspace,InterpolationMargins.get(str(method).upper(),2) + 1)
+    zs[inside] = surface.InterpolateArray(xs[inside],ys[inside],method)
+    return zs
+
+def CatalogSpots(gp,catalog,xs,ys,workspace,method="BILINEAR"):
+    ## SurfaceSpots on a DTED catalog or folder: the window around the points is read
+    ## through a virtual mosaic (and the shared tile cache) instead of being mosaicked
+    surface = SurfaceFromExtent(gp,catalog,[xs.min(),ys.min(),xs.max(),ys.max()],workspace,
+                                InterpolationMargins.get(str(method).upper(),2) + 1)
+    return surface.InterpolateArray(xs,ys,method)
+
+def SurfaceToRaster(gp,surface,values,out_raster,workspace,data_type="FLOAT"):
+    ## writes values on the surface grid to a raster dataset
+    ## data_type: FLOAT | INTEGER (INTEGER goes through an ASCII grid)
+    import MAScriptUtils
+    if (data_type == "INTEGER"):
+        temp_grid = MAScriptUtils.GenerateTempFileName(gp,workspace,"ASCIIFile")
+        WriteAsciiGrid(surface,values,temp_grid)
+    else:
+        temp_grid = MAScriptUtils.GenerateTempFileName(gp,workspace,"FloatFile")
+        WriteFloatGrid(surface,values,temp_grid)
+    try:
+        if (data_type == "INTEGER"):
+            gp.ASCIIToRaster_conversion(temp_grid,out_raster,"INTEGER")
+        else:
+            gp.FloatToRaster_conversion(temp_grid,out_raster)
+        if (surface.SpatialReference != None):
+            gp.DefineProjection_management(out_raster,surface.SpatialReference)
+    except:
+        DeleteFloatGrid(temp_grid)
+        raise Exception, msgCouldNotImportSurface % (str(out_raster),gp.GetMessages())
+    DeleteFloatGrid(temp_grid)
+    return out_raster
@@ -0,0 +1,133 @@
+#!/usr/bin/env python
+# -*- coding: latin-1 -*-
+
+#
+# TileCache.py
+#
+# Military Analyst process-wide cache of decoded surface tiles
+#
+# Tools that run one after another in the same process (ObserverTableToRLOS,
+# a batch of LOS runs, repeated spot heights) read the same catalog tiles
+# again and again. Decoded tiles are kept here, keyed by
+# (source, tile id, DTED level), up to a byte budget. The least recently
+# used tiles are dropped first when the budget is exceeded. Recency is a
+# doubly linked list of [previous,next,key] links held by key, so a hit or
+# an eviction costs the same whatever the number of tiles.
+#
+# Cached arrays are shared, so they are marked read-only.
+#
+
+import os, sys
+
+debug = False
+
+# default byte budget of the shared cache
+DefaultCacheBytes = 256 * 1024 * 1024
+
+class TileCache:
+    #budget
+    def __init__(self,budget=DefaultCacheBytes):
+        self.Budget = int(budget)
+        self.Entries = {}
+        self.ClearOrder()
+        self.Bytes = 0
+        self.Hits = 0
+        self.Misses = 0
+        self.Evictions = 0
+
+    def ClearOrder (self):
+        # Root links the least recently used key (Root[1]) and the most
+        # recently used one (Root[0]), Links holds the link of each key
+        self.Root = []
+        self.Root[:] = [self.Root,self.Root,None]
+        self.Links = {}
+
+    def Append (self,key):
+        ## links key as the most recently used
+        last = self.Root[0]
+        link = [last,self.Root,key]
+        last[1] = link
+        self.Root[0] = link
+        self.Links[key] = link
+
+    def Unlink (self,key):
+        previous,following = self.Links.pop(key)[:2]
+        previous[1] = following
+        following[0] = previous
+
+    def Get (self,key):
+        ## the cached array for key, or None
+        if (self.Entries.has_key(key)):
+            self.Hits += 1
+            self.Unlink(key)
+            self.Append(key)
+            return self.Entries[key]
+        self.Misses += 1
+        return None
+
+    def Put (self,key,value):
+        ## caches a NumPy array, returns False when it is larger than the budget
+        nbytes = int(value.nbytes)
+        if (nbytes > self.Budget):
+            return False
+        if (self.Entries.has_key(key)):
+            self.Remove(key)
+        value.flags.writeable = False
+        self.Entries[key] = value
+        self.Append(key)
+        self.Bytes += nbytes
+        self.Evict()
+        return True
+
+    def Fetch (self,key,loader):
+        ## the cached array for key, loaded with loader() and cached on a miss
+        value = self.Get(key)
+        if (value is None):
+            value = loader()
+            self.Put(key,value)
+        return value
+
+    def Remove (self,key):
+        if (self.Entries.has_key(key)):
+            self.Bytes -= int(self.Entries[key].nbytes)
+            del self.Entries[key]
+            self.Unlink(key)
+
+    def Evict (self):
+        ## drops least recently used arrays until the cache is within its budget
+        while (self.Bytes > self.Budget and len(self.Entries) > 0):
+            self.Remove(self.Root[1][2])
+            self.Evictions += 1
+
+    def SetBudget (self,budget):
+        self.Budget = int(budget)
+        self.Evict()
+
+    def Clear (self):
+        self.Entries = {}
+        self.ClearOrder()
+        self.Bytes = 0
+
+    def GetStats (self):
+        ## [hits,misses,evictions,entries,bytes]
+        return [self.Hits,self.Misses,self.Evictions,len(self.Entries),self.Bytes]
+
+    def GetStatsMessage (self):
+        return "Tile cache: %s hits, %s misses, %s evictions, %s tiles (%s MB of %s MB)" % (str(self.Hits),str(self.Misses),
+                    str(self.Evictions),str(len(self.Entries)),str(self.Bytes / 1048576),str(self.Budget / 1048576))
+
+
+def TileKey(source,tile_id,level):
+    ## cache key of a tile: catalog or folder, tile object id or file and DTED level
+    ## (a tile is always cached whole)
+    return (os.path.normcase(str(source)),str(tile_id),str(level))
+
+# the cache shared by every tool in this process
+SharedTileCache = TileCache()
+
+def SharedCache():
+    return SharedTileCache
+
+def SetCacheBudget(budget):
+    ## sets the byte budget of the shared cache
+    SharedTileCache.SetBudget(budget)
@@ -0,0 +1,292 @@
+#!/usr/bin/env python
+# -*- coding: latin-1 -*-
+
+#
+# TiledVisibility.py
+#
+# Military Analyst out-of-core visibility for surfaces too large to load
+#
+# The surface stays on disk as an ESRI float grid that is memory-mapped and
+# read in square tiles, or is read window by window from the tiles of a
+# catalog through a VirtualMosaic with no mosaic raster at all. The ring sweep of Visibility.py only needs the
+# horizon of the previous ring, so the horizon is kept per ring (8k values
+# for ring k) instead of for the whole window. A tile is read when the
+# sweep first reaches it and its visibility is added to the output grid
+# and dropped as soon as the sweep has passed its farthest cell.
+#
+# At ring k about 8k / TileSize tiles are active, so memory is bounded by
+# roughly 8 * k * TileSize cells: a 500 km radius on 30 m cells with
+# 128 cell tiles keeps about 70 MB of tiles, whatever the size of the DEM.
+#
+
+import os, sys, math
+import numpy
+import Surface, Visibility
+
+debug = False
+
+DefaultTileSize = 128
+
+# surfaces with more cells than this are swept tile by tile by RLOS
+TiledMinCells = 64000000
+
+# value of NoData cells in the output counts grid
+CountsNoData = -1
+
+# error messages
+msgNoFloatGrid = "Float grid %s does not exist."
+msgCouldNotExportTiles = "Could not export surface %s to float grid: \n %s"
+
+class TiledSurface(Surface.Surface):
+    #float_file,tile_size
+    def __init__(self,float_file,tile_size=DefaultTileSize):
+        if not (os.path.exists(float_file)):
+            raise Exception, msgNoFloatGrid % (str(float_file))
+        rows,cols,xmin,ymax,cellsize,nodata,dtype = Surface.ReadFloatGridInfo(float_file)
+        # Elevation is the raw grid on disk, NoData cells hold NoData not NaN
+        data = numpy.memmap(float_file,dtype,"r",shape=(rows,cols))
+        Surface.Surface.__init__(self,data,xmin,ymax,cellsize,cellsize)
+        self.FloatFile = float_file
+        self.NoData = nodata
+        self.TileSize = tile_size
+        self.TileRows = ((rows - 1) / tile_size) + 1
+        self.TileCols = ((cols - 1) / tile_size) + 1
+
+    def ReadWindow (self,window):
+        ## reads [row_min,row_max,col_min,col_max] as float32 with NaN for NoData
+        values = numpy.array(self.Elevation[window[0]:window[1],window[2]:window[3]],numpy.float32)
+        values[values == self.NoData] = numpy.nan
+        return values
+
+    def TileWindow (self,tile_row,tile_col):
+        return [tile_row * self.TileSize,min(self.Rows,(tile_row + 1) * self.TileSize),
+                tile_col * self.TileSize,min(self.Cols,(tile_col + 1) * self.TileSize)]
+
+    def ReadTile (self,tile_row,tile_col):
+        return self.ReadWindow(self.TileWindow(tile_row,tile_col))
+
+    def Interpolate (self,x,y):
+        ## bilinear interpolation from the cells around x,y only
+        row,col = self.MapToCell(x,y)
+        window = [max(0,row - 1),min(self.Rows,row + 2),max(0,col - 1),min(self.Cols,col + 2)]
+        block = Surface.Surface(self.ReadWindow(window),self.XMin + (window[2] * self.CellWidth),
+                                self.YMax - (window[0] * self.CellHeight),self.CellWidth,self.CellHeight)
+        return block.Interpolate(x,y)
+
+    def InterpolateArray (self,xs,ys,method="BILINEAR"):
+        ## interpolation of arrays of points (see Surface.InterpolateArray)
+        ## reading only the tiles holding points, with a margin of cells
+        xs = numpy.asarray(xs,numpy.float64)
+        ys = numpy.asarray(ys,numpy.float64)
+        margin = Surface.InterpolationMargins.get(str(method).upper(),2) + 1
+        rows = numpy.clip(numpy.floor((self.YMax - ys.ravel()) / self.CellHeight),0,self.Rows - 1).astype(numpy.int64)
+        cols = numpy.clip(numpy.floor((xs.ravel() - self.XMin) / self.CellWidth),0,self.Cols - 1).astype(numpy.int64)
+        keys = ((rows / self.TileSize) * self.TileCols) + (cols / self.TileSize)
+        order = numpy.argsort(keys,kind="mergesort")
+        sorted_keys = keys[order]
+        starts = numpy.concatenate(([0],numpy.nonzero(numpy.diff(sorted_keys))[0] + 1,[len(keys)]))
+        zs = numpy.zeros(len(keys),numpy.float64)
+        for g in range(len(starts) - 1):
+            points = order[starts[g]:starts[g + 1]]
+            key = int(sorted_keys[starts[g]])
+            tile_window = self.TileWindow(key / self.TileCols,key % self.TileCols)
+            window = [max(0,tile_window[0] - margin),min(self.Rows,tile_window[1] + margin),
+                      max(0,tile_window[2] - margin),min(self.Cols,tile_window[3] + margin)]
+            block = Surface.Surface(self.ReadWindow(window),self.XMin + (window[2] * self.CellWidth),
+                                    self.YMax - (window[0] * self.CellHeight),self.CellWidth,self.CellHeight)
+            zs[points] = block.InterpolateArray(xs.ravel()[points],ys.ravel()[points],method)
+        return zs.reshape(xs.shape)
+
+    def ValidBand (self,row_min,row_max):
+        ## True for the cells of rows row_min:row_max that are not NoData
+        return numpy.asarray(self.Elevation[row_min:row_max]) != self.NoData
+
+
+class MosaicTiledSurface(TiledSurface):
+    #mosaic,tile_size
+    def __init__(self,mosaic,tile_size=DefaultTileSize):
+        # there is no elevation array, every window is read from the mosaic tiles
+        self.Elevation = None
+        self.XMin = mosaic.XMin
+        self.YMax = mosaic.YMax
+        self.CellWidth = mosaic.CellWidth
+        self.CellHeight = mosaic.CellHeight
+        self.Rows = mosaic.Rows
+        self.Cols = mosaic.Cols
+        self.SpatialReference = mosaic.SpatialReference
+        self.Geographic = mosaic.Geographic
+        self.Mosaic = mosaic
+        self.FloatFile = None
+        self.NoData = None
+        self.TileSize = tile_size
+        self.TileRows = ((self.Rows - 1) / tile_size) + 1
+        self.TileCols = ((self.Cols - 1) / tile_size) + 1
+
+    def ReadWindow (self,window):
+        ## reads [row_min,row_max,col_min,col_max] as float32 with NaN for NoData
+        return self.Mosaic.ReadWindow(window,False)
+
+    def ValidBand (self,row_min,row_max):
+        return ~numpy.isnan(self.ReadWindow([row_min,row_max,0,self.Cols]))
+
+    def Close (self):
+        self.Mosaic.Close()
+
+
+def TiledSurfaceFromRaster(gp,in_raster,float_file,tile_size=DefaultTileSize):
+    ## exports a raster dataset to float_file (kept on disk) and maps it
+    try:
+        gp.RasterToFloat_conversion(in_raster,float_file)
+    except:
+        raise Exception, msgCouldNotExportTiles % (str(in_raster),gp.GetMessages())
+    surface = TiledSurface(float_file,tile_size)
+    surface.SpatialReference = gp.Describe(in_raster).SpatialReference
+    surface.Geographic = (surface.SpatialReference.Type == "Geographic")
+    return surface
+
+def RingIndex(dr,dc,k):
+    ## position of the cells at offsets dr,dc on square ring k (k > 0),
+    ## clockwise from the north-west corner, 0 <= index < 8k
+    return numpy.where(dr == -k,dc + k,
+           numpy.where(dc == k,(3 * k) + dr,
+           numpy.where(dr == k,(5 * k) - dc,((7 * k) - dr) % (8 * k))))
+
+def CountsGridName(float_file):
+    ## name of the counts grid written next to the temporary float_file,
+    ## temporary names are only unique to the second so they can not be shared
+    return os.path.splitext(float_file)[0] + "_counts.flt"
+
+def CreateCountsGrid(surface,counts_file):
+    ## creates a zeroed float grid on disk matching the surface, returns it mapped
+    Surface.WriteFloatHeader(os.path.splitext(counts_file)[0] + ".hdr",surface.Rows,surface.Cols,
+                             surface.XMin,surface.YMax - (surface.Rows * surface.CellHeight),
+                             surface.CellWidth,CountsNoData)
+    return numpy.memmap(counts_file,numpy.float32,"w+",shape=(surface.Rows,surface.Cols))
+
+def OpenCountsGrid(counts_file):
+    ## maps a counts grid written by TiledCumulativeViewshed read-only
+    rows,cols,xmin,ymax,cellsize,nodata,dtype = Surface.ReadFloatGridInfo(counts_file)
+    return numpy.memmap(counts_file,dtype,"r",shape=(rows,cols))
+
+class ActiveTile:
+    #window,elevation,last_ring
+    def __init__(self,window,elevation,last_ring):
+        self.Window = window
+        self.Elevation = elevation
+        self.Visible = numpy.zeros(elevation.shape,numpy.bool_)
+        # the sweep is done with the tile after this ring
+        self.LastRing = last_ring
+
+def TiledObserverViewshed(surface,observer,counts,bUseCurvature=False,refraction_factor=Visibility.DefaultRefraction):
+    ## sweeps one observer over a TiledSurface and adds its visibility to
+    ## counts (an array or memmap the size of the surface), tile by tile
+    row,col,kmax,window = Visibility.ObserverWindow(surface,observer)
+    eye = Visibility.ObserverElevation(surface,observer) + Visibility.ObserverValue(observer,"OFFSETA")
+    offsetb = Visibility.ObserverValue(observer,"OFFSETB")
+    radius1 = Visibility.ObserverValue(observer,"RADIUS1")
+    radius2 = Visibility.ObserverValue(observer,"RADIUS2")
+    azimuth1,span = Visibility.ObserverSector(observer)
+    lower,upper = Visibility.ObserverSlopeLimits(observer)
+    tile_size = surface.TileSize
+    tiles = {}
+
+    def GetTile(key):
+        if not (tiles.has_key(key)):
+            tile_window = surface.TileWindow(key[0],key[1])
+            tile_window = [max(tile_window[0],window[0]),min(tile_window[1],window[1]),
+                           max(tile_window[2],window[2]),min(tile_window[3],window[3])]
+            last_ring = max(abs(tile_window[0] - row),abs(tile_window[1] - 1 - row),
+                            abs(tile_window[2] - col),abs(tile_window[3] - 1 - col))
+            tiles[key] = ActiveTile(tile_window,surface.ReadWindow(tile_window),last_ring)
+        return tiles[key]
+
+    def TileGroups(rr,cc):
+        ## yields (tile,cell indexes) for the cells rr,cc grouped by tile
+        keys = ((rr / tile_size) * surface.TileCols) + (cc / tile_size)
+        order = numpy.argsort(keys,kind="mergesort")
+        sorted_keys = keys[order]
+        starts = numpy.concatenate(([0],numpy.nonzero(numpy.diff(sorted_keys))[0] + 1,[len(keys)]))
+        for g in range(len(starts) - 1):
+            cells = order[starts[g]:starts[g + 1]]
+            key = int(sorted_keys[starts[g]])
+            yield GetTile((key / surface.TileCols,key % surface.TileCols)),cells
+
+    def FlushTiles(k):
+        for key in tiles.keys():
+            tile = tiles[key]
+            if (tile.LastRing <= k):
+                w = tile.Window
+                counts[w[0]:w[1],w[2]:w[3]] += tile.Visible
+                del tiles[key]
+
+    if (radius1 <= 0.0):
+        tile = GetTile((row / tile_size,col / tile_size))
+        tile.Visible[row - tile.Window[0],col - tile.Window[2]] = True
+
+    bounds = [window[0] - row,window[1] - 1 - row,window[2] - col,window[3] - 1 - col]
+    previous = None
+    for k in range(1,kmax + 1):
+        dr,dc = Visibility.RingOffsets(k,bounds)
+        east,north = surface.GroundOffsets(row,dr,dc)
+        dist = numpy.sqrt((east * east) + (north * north))
+        inside = dist <= radius2
+        if (span < 360.0):
+            margin = math.degrees(math.atan2(Visibility.SectorMarginCells,k))
+            inside = inside & Visibility.InSector(Visibility.GroundAzimuths(east,north),azimuth1,span,margin)
+        if not (inside.any()):
+            break
+        dr,dc,dist = dr[inside],dc[inside],dist[inside]
+        east,north = east[inside],north[inside]
+
+        if (previous is None):
+            ring_horizon = numpy.zeros(len(dr),numpy.float64) + Visibility.NoHorizon
+        else:
+            lo_r,lo_c,hi_r,hi_c,w = Visibility.RingCrossings(dr,dc,k)
+            ring_horizon = (previous[RingIndex(lo_r,lo_c,k - 1)] * (1.0 - w)) + (previous[RingIndex(hi_r,hi_c,k - 1)] * w)
+
+        rr = dr + row
+        cc = dc + col
+        z = numpy.empty(len(dr),numpy.float64)
+        for tile,cells in TileGroups(rr,cc):
+            z[cells] = tile.Elevation[rr[cells] - tile.Window[0],cc[cells] - tile.Window[2]]
+        valid = ~numpy.isnan(z)
+        if (bUseCurvature == True):
+            z = z - Visibility.CurvatureCorrection(dist,refraction_factor)
+        slope = numpy.where(valid,(z - eye) / dist,Visibility.NoHorizon)
+        target_slope = (z + offsetb - eye) / dist
+
+        ring_visible = valid & (target_slope >= ring_horizon) & (dist >= radius1)
+        ring_visible = ring_visible & (target_slope >= lower) & (target_slope <= upper)
+        if (span < 360.0):
+            ring_visible = ring_visible & Visibility.InSector(Visibility.GroundAzimuths(east,north),azimuth1,span,0.0)
+        for tile,cells in TileGroups(rr,cc):
+            tile.Visible[rr[cells] - tile.Window[0],cc[cells] - tile.Window[2]] = ring_visible[cells]
+        ring_horizon = numpy.maximum(ring_horizon,slope)
+        previous = numpy.zeros(8 * k,numpy.float64) + Visibility.NoHorizon
+        previous[RingIndex(dr,dc,k)] = ring_horizon
+        FlushTiles(k)
+
+        if (upper != numpy.inf and (ring_horizon > upper).all()):
+            break
+
+    FlushTiles(kmax + 1)
+    return window
+
+def TiledCumulativeViewshed(surface,observers,counts_file,bUseCurvature=False,refraction_factor=Visibility.DefaultRefraction):
+    ## sweeps observers over a TiledSurface, writing the number of observers
+    ## that see each cell to the float grid counts_file (NoData is CountsNoData)
+    if (len(observers) == 0):
+        raise Exception, Visibility.msgNoObservers
+    counts = CreateCountsGrid(surface,counts_file)
+    for index in Visibility.TileOrder(surface,observers,surface.TileSize):
+        TiledObserverViewshed(surface,observers[index],counts,bUseCurvature,refraction_factor)
+        if (debug == True):
+            print "Tiled viewshed: observer %s of %s" % (str(index + 1),str(len(observers)))
+    # mark NoData band by band
+    for row0 in range(0,surface.Rows,surface.TileSize):
+        row1 = min(surface.Rows,row0 + surface.TileSize)
+        band = counts[row0:row1]
+        band[~surface.ValidBand(row0,row1)] = CountsNoData
+    counts.flush()
+    del counts
+    return counts_file
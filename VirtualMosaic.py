@@ -0,0 +1,249 @@
+#!/usr/bin/env python
+# -*- coding: latin-1 -*-
+
+#
+# VirtualMosaic.py
+#
+# Military Analyst virtual mosaic of a DTED catalog
+#
+# MosaicAndClip writes every cell of the catalog twice before the native
+# engines read it: once into a temporary mosaic and again into the clipped
+# raster. A virtual mosaic only describes the grid of the mosaic (the cell
+# size and alignment of the first tile over the requested extent) and
+# reads windows of it on demand. Each tile that a window touches is
+# exported once to a float grid and memory-mapped, and only the rows and
+# columns of the tile under the window are read from it.
+#
+# Where tiles overlap, FIRST keeps the value of the first tile in catalog
+# order and BLEND averages the tiles weighted by the distance of the cell
+# to the tile edge, as mosaic_management does.
+#
+# A folder of DTED files can stand in for the catalog: its tiles are read
+# in place by DTED.py with no export at all.
+#
+# Decoded tiles go through the shared TileCache, so later mosaics in the
+# same process that touch a tile neither export nor decode it again.
+#
+
+import os, sys, math
+import numpy
+import Surface, TileCache
+
+debug = False
+
+# overlap rules of ReadWindow
+MosaicTypes = ["BLEND","FIRST"]
+
+# error messages
+msgBadMosaicType = "Unknown mosaic type %s, use BLEND or FIRST."
+msgNoTiles = "No %s rasters of catalog %s fall in the extent %s."
+msgNoDTEDLevel = "Catalog %s does not contain DTED_TYPE information.  (Is it a Military Analyst catalog?)"
+msgCouldNotExportTile = "Could not export raster %s to float grid: \n %s"
+
+class MosaicTile:
+    #objectId,envelope,cellwidth,cellheight
+    def __init__(self,objectId,envelope,cellwidth,cellheight):
+        self.ObjectID = objectId
+        self.Envelope = [float(envelope[0]),float(envelope[1]),float(envelope[2]),float(envelope[3])]
+        self.CellWidth = float(cellwidth)
+        self.CellHeight = float(cellheight)
+        # set when the tile is first read
+        self.Grid = None
+        self.NoData = None
+        self.FloatFile = None
+        self.Rows = 0
+        self.Cols = 0
+
+    def Attach (self,float_file):
+        ## maps an exported float grid, the tile is georeferenced from its footprint
+        ## since a float grid header only holds square cells
+        rows,cols,xmin,ymax,cellsize,nodata,dtype = Surface.ReadFloatGridInfo(float_file)
+        self.Grid = numpy.memmap(float_file,dtype,"r",shape=(rows,cols))
+        self.NoData = nodata
+        self.FloatFile = float_file
+        self.SetShape(rows,cols)
+
+    def SetShape (self,rows,cols):
+        self.Rows = rows
+        self.Cols = cols
+        self.CellWidth = (self.Envelope[2] - self.Envelope[0]) / cols
+        self.CellHeight = (self.Envelope[3] - self.Envelope[1]) / rows
+
+    def IsOpen (self):
+        return (self.Grid is not None)
+
+    def ReadBlock (self,row_min,row_max,col_min,col_max):
+        ## reads rows row_min:row_max and columns col_min:col_max as float64, NaN for NoData
+        block = numpy.array(self.Grid[row_min:row_max,col_min:col_max],numpy.float64)
+        block[block == self.NoData] = numpy.nan
+        return block
+
+    def Release (self):
+        if (self.Grid is not None):
+            del self.Grid
+            self.Grid = None
+        if (self.FloatFile != None):
+            Surface.DeleteFloatGrid(self.FloatFile)
+            self.FloatFile = None
+
+
+class VirtualMosaic:
+    #gp,catalog,extent,workspace,mosaic_type
+    def __init__(self,gp,catalog,extent,workspace,mosaic_type="BLEND"):
+        import MAScriptUtils
+        mosaic_type = str(mosaic_type).upper()
+        if not (mosaic_type in MosaicTypes):
+            raise Exception, msgBadMosaicType % (str(mosaic_type))
+        self.gp = gp
+        self.Catalog = str(catalog)
+        self.Workspace = workspace
+        self.MosaicType = mosaic_type
+        self.Cache = TileCache.SharedCache()
+        extent = [float(extent[0]),float(extent[1]),float(extent[2]),float(extent[3])]
+        self.Tiles = []
+        import DTED
+        if (DTED.IsDTEDFolder(gp,catalog)):
+            # a folder of DTED files, always WGS 1984
+            self.Tiles = DTED.DTEDFolderTiles(catalog,extent)
+            if (len(self.Tiles) > 0):
+                self.DTEDLevel = "DTED Level " + str(self.Tiles[0].Level)
+            else:
+                self.DTEDLevel = "DTED"
+            self.SpatialReference = MAScriptUtils.SetGeographicWGS84(gp)
+        else:
+            self.DTEDLevel = MAScriptUtils.LowestDTEDLevel(gp,catalog)
+            if (self.DTEDLevel == None):
+                raise Exception, msgNoDTEDLevel % (str(catalog))
+            for objectId,envelope,cellwidth,cellheight,pixel_type in MAScriptUtils.CatalogTiles(gp,catalog,self.DTEDLevel,extent):
+                self.Tiles.append(MosaicTile(objectId,envelope,cellwidth,cellheight))
+            self.SpatialReference = gp.Describe(catalog).SpatialReference
+        if (len(self.Tiles) == 0):
+            raise Exception, msgNoTiles % (self.DTEDLevel,str(catalog),str(extent))
+
+        # the mosaic grid has the cells of the first tile, aligned with it
+        first = self.Tiles[0]
+        self.CellWidth = first.CellWidth
+        self.CellHeight = first.CellHeight
+        self.XMin = first.Envelope[0] + (math.floor((extent[0] - first.Envelope[0]) / self.CellWidth) * self.CellWidth)
+        self.YMax = first.Envelope[3] - (math.floor((first.Envelope[3] - extent[3]) / self.CellHeight) * self.CellHeight)
+        self.Cols = max(1,int(math.ceil((extent[2] - self.XMin) / self.CellWidth)))
+        self.Rows = max(1,int(math.ceil((self.YMax - extent[1]) / self.CellHeight)))
+
+        self.Geographic = (self.SpatialReference.Type == "Geographic")
+        if (debug == True):
+            gp.AddMessage("Virtual mosaic of %s tiles: %s rows, %s cols" % (str(len(self.Tiles)),str(self.Rows),str(self.Cols)))
+
+    def GetExtent (self):
+        ## Left, Bottom, Right, Top
+        return [self.XMin, self.YMax - (self.Rows * self.CellHeight),
+                self.XMin + (self.Cols * self.CellWidth), self.YMax]
+
+    def OpenTile (self,tile):
+        ## exports a catalog tile to a float grid the first time it is read
+        if (tile.IsOpen() == False):
+            import MAScriptUtils
+            temp_float = MAScriptUtils.GenerateTempFileName(self.gp,self.Workspace,"FloatFile")
+            # temp names are only unique to the second, so add the tile
+            temp_float = os.path.splitext(temp_float)[0] + "_" + str(tile.ObjectID) + ".flt"
+            copySource = self.Catalog + "\\RASTER.ObjectID=" + str(tile.ObjectID)
+            try:
+                self.gp.RasterToFloat_conversion(copySource,temp_float)
+            except:
+                raise Exception, msgCouldNotExportTile % (copySource,self.gp.GetMessages())
+            tile.Attach(temp_float)
+        return tile
+
+    def TileCells (self,tile):
+        ## the whole tile decoded to float32 (NaN for NoData) from the shared cache,
+        ## decoded and cached on a miss. None when the tile is larger than the cache.
+        key = TileCache.TileKey(self.Catalog,tile.ObjectID,self.DTEDLevel)
+        cells = self.Cache.Get(key)
+        if (cells is not None):
+            if (tile.Rows == 0):
+                tile.SetShape(cells.shape[0],cells.shape[1])
+            return cells
+        self.OpenTile(tile)
+        if ((tile.Rows * tile.Cols * 4) > self.Cache.Budget):
+            return None
+        cells = tile.ReadBlock(0,tile.Rows,0,tile.Cols).astype(numpy.float32)
+        self.Cache.Put(key,cells)
+        return cells
+
+    def ReadWindow (self,window,bCacheTiles=True):
+        ## reads [row_min,row_max,col_min,col_max] of the mosaic as float32 with NaN
+        ## for NoData, cells are taken from the tile cell under their center.
+        ## Without bCacheTiles only the cells under the window are read from each
+        ## mapped tile, for sweeps that stream many small windows.
+        row_min,row_max,col_min,col_max = window
+        if (row_max <= row_min or col_max <= col_min):
+            return numpy.zeros((max(0,row_max - row_min),max(0,col_max - col_min)),numpy.float32)
+        xs = self.XMin + ((numpy.arange(col_min,col_max) + 0.5) * self.CellWidth)
+        ys = self.YMax - ((numpy.arange(row_min,row_max) + 0.5) * self.CellHeight)
+        values = numpy.zeros((row_max - row_min,col_max - col_min),numpy.float64)
+        weights = numpy.zeros(values.shape,numpy.float64)
+        for tile in self.Tiles:
+            L,B,R,T = tile.Envelope
+            if (R <= xs[0] - (0.5 * self.CellWidth) or L >= xs[-1] + (0.5 * self.CellWidth) or
+                T <= ys[-1] - (0.5 * self.CellHeight) or B >= ys[0] + (0.5 * self.CellHeight)):
+                continue
+            if (bCacheTiles == True):
+                cells = self.TileCells(tile)
+            else:
+                cells = None
+                self.OpenTile(tile)
+            tile_cols = numpy.floor((xs - L) / tile.CellWidth).astype(numpy.int64)
+            tile_rows = numpy.floor((T - ys) / tile.CellHeight).astype(numpy.int64)
+            in_cols = numpy.nonzero((tile_cols >= 0) & (tile_cols < tile.Cols))[0]
+            in_rows = numpy.nonzero((tile_rows >= 0) & (tile_rows < tile.Rows))[0]
+            if (len(in_cols) == 0 or len(in_rows) == 0):
+                continue
+            c0,c1 = tile_cols[in_cols[0]],tile_cols[in_cols[-1]] + 1
+            r0,r1 = tile_rows[in_rows[0]],tile_rows[in_rows[-1]] + 1
+            # only the rows and columns of the tile under the window are read
+            if (cells is None):
+                block = tile.ReadBlock(r0,r1,c0,c1)
+            else:
+                block = numpy.array(cells[r0:r1,c0:c1],numpy.float64)
+            block = block[numpy.ix_(tile_rows[in_rows] - r0,tile_cols[in_cols] - c0)]
+            valid = ~numpy.isnan(block)
+            sub = numpy.ix_(in_rows,in_cols)
+            if (self.MosaicType == "FIRST"):
+                take = valid & (weights[sub] == 0.0)
+                values[sub] = numpy.where(take,block,values[sub])
+                weights[sub] = numpy.where(take,1.0,weights[sub])
+            else:
+                # distance of each cell center to the nearest tile edge, in tile cells
+                edge_rows = numpy.minimum(tile_rows[in_rows] + 0.5,tile.Rows - tile_rows[in_rows] - 0.5)
+                edge_cols = numpy.minimum(tile_cols[in_cols] + 0.5,tile.Cols - tile_cols[in_cols] - 0.5)
+                blend = numpy.minimum(edge_rows[:,numpy.newaxis],edge_cols[numpy.newaxis,:])
+                blend = numpy.where(valid,blend,0.0)
+                values[sub] = values[sub] + (numpy.where(valid,block,0.0) * blend)
+                weights[sub] = weights[sub] + blend
+        out_values = numpy.zeros(values.shape,numpy.float32) + numpy.nan
+        has_data = weights > 0.0
+        out_values[has_data] = values[has_data] / weights[has_data]
+        return out_values
+
+    def GetSurface (self):
+        ## reads the whole mosaic into an in-memory Surface
+        surface = Surface.Surface(self.ReadWindow([0,self.Rows,0,self.Cols]),self.XMin,self.YMax,self.CellWidth,self.CellHeight)
+        surface.SpatialReference = self.SpatialReference
+        surface.Geographic = self.Geographic
+        return surface
+
+    def Close (self):
+        ## deletes the exported tiles, unmaps DTED files (decoded tiles stay cached)
+        for tile in self.Tiles:
+            tile.Release()
+        if (debug == True):
+            self.gp.AddMessage(self.Cache.GetStatsMessage())
+
+
+def SurfaceFromCatalog(gp,catalog,extent,workspace,mosaic_type="BLEND"):
+    ## reads the extent of a DTED catalog into a Surface without writing a mosaic raster
+    mosaic = VirtualMosaic(gp,catalog,extent,workspace,mosaic_type)
+    try:
+        surface = mosaic.GetSurface()
+    finally:
+        mosaic.Close()
+    return surface
@@ -0,0 +1,539 @@
+#!/usr/bin/env python
+# -*- coding: latin-1 -*-
+
+#
+# Visibility.py
+#
+# Military Analyst native visibility (viewshed) engine
+#
+# XDraw style sweep: the grid around an observer is processed in square
+# rings of increasing distance. The line of sight from a ring cell back to
+# the observer crosses the previous ring between two cells, and the horizon
+# slope of the cell is interpolated from those two cells. Each ring is one
+# vectorized NumPy step, so a viewshed costs O(cells) with no GP tools.
+#
+# Distances are measured on the ground (Surface.GroundOffsets), so a surface
+# in geographic coordinates is swept as it is, without reprojection.
+#
+# A reverse viewshed (the cells a target can be seen from) is the viewshed
+# swept from the target with the offsets swapped, since a line of sight
+# and its curvature correction read the same from either end.
+#
+
+import os, sys, math, tempfile
+import numpy
+import Surface
+
+# multiprocessing is only available from Python 2.6 on
+try:
+    import multiprocessing
+except ImportError:
+    multiprocessing = None
+
+debug = False
+
+# observer fields read from the observer feature class
+ObserverFields = ["SPOT","OFFSETA","OFFSETB","AZIMUTH1","AZIMUTH2","VERT1","VERT2","RADIUS1","RADIUS2"]
+
+# values used when an observer field is missing or empty (same as Viewshed_sa)
+ObserverDefaults = {"OFFSETA":1.0,
+                    "OFFSETB":0.0,
+                    "AZIMUTH1":0.0,
+                    "AZIMUTH2":360.0,
+                    "VERT1":90.0,
+                    "VERT2":-90.0,
+                    "RADIUS1":0.0,
+                    "RADIUS2":numpy.inf}
+
+# horizon slope of a cell nothing has been seen through yet
+NoHorizon = -1.0e30
+
+# cells swept on either side of an azimuth sector so the sight lines at the
+# sector edges have both interpolation cells available
+SectorMarginCells = 2.0
+
+# earth curvature correction (same model as Viewshed_sa and LineOfSight_3d):
+# surface_z - (1 - refraction) * distance^2 / earth diameter, in meters
+EarthDiameter = 12740000.0
+DefaultRefraction = 0.13
+
+# fewest observers worth starting a process pool for
+ParallelMinObservers = 64
+
+# surface and curvature settings of each pool worker (see InitViewshedWorker)
+workerSurface = None
+workerCurvature = [False,DefaultRefraction]
+
+# error messages
+msgObserverOutsideSurface = "Observer at %s, %s is outside of the surface."
+msgObserverOnNoData = "Observer at %s, %s is on a NoData cell of the surface."
+msgNoObservers = "No observers to process."
+msgMaskShape = "Observer mask has %s observers, %s observers were given."
+
+
+def ReadObservers(gp,observers_fc):
+    ## returns a list of observers (dictionaries keyed by observer field name),
+    ## Z holds the point z of Z enabled feature classes
+    observers = []
+    for observer in IterObservers(gp,observers_fc):
+        observers.append(observer)
+
+    if (debug == True):
+        msg = "Read %s observers from %s" % (str(len(observers)),str(observers_fc))
+        gp.AddMessage(msg)
+        print msg
+    return observers
+
+def IterObservers(gp,observers_fc):
+    ## generator over the observers of a feature class in cursor order (see
+    ## ReadObservers), only the current row is held
+    import MAScriptUtils
+    field_names = MAScriptUtils.GetFieldNames(gp,observers_fc)
+    shape_field = MAScriptUtils.GetGeometryField(observers_fc,gp)
+    bHasZ = (gp.Describe(observers_fc).HasZ == True)
+    read_fields = []
+    for field in ObserverFields:
+        if (field in field_names): read_fields.append(field)
+
+    oid_field = MAScriptUtils.GetOIDField(observers_fc,gp)
+    rows = gp.SearchCursor(observers_fc)
+    row = rows.next()
+    while row:
+        pnt = row.GetValue(shape_field).GetPart()
+        observer = {"OID":int(row.GetValue(oid_field)),"X":float(pnt.x),"Y":float(pnt.y)}
+        if (bHasZ == True and pnt.z != None):
+            observer["Z"] = float(pnt.z)
+        for field in read_fields:
+            value = row.GetValue(field)
+            if (value != None and str(value) != ""):
+                observer[field] = float(value)
+        yield observer
+        row = rows.next()
+    del row, rows
+
+def ObserverValue(observer,field):
+    ## returns the observer value for a field or the default
+    if (observer.has_key(field)):
+        return observer[field]
+    return ObserverDefaults[field]
+
+def ReverseObserver(target):
+    ## the observer whose viewshed is the reverse viewshed of a target: the
+    ## cells from which the target, raised by its OFFSETB, is seen by an
+    ## observer OFFSETA above the cell within the observer's AZIMUTH, VERT
+    ## and RADIUS limits. The target becomes the eye (raised by OFFSETB),
+    ## the cells are raised by OFFSETA, the sector turns round and the
+    ## vertical limits change sign.
+    observer = {}
+    for field in ["OID","X","Y","Z","SPOT"]:
+        if (target.has_key(field)): observer[field] = target[field]
+    observer["OFFSETA"] = ObserverValue(target,"OFFSETB")
+    observer["OFFSETB"] = ObserverValue(target,"OFFSETA")
+    observer["AZIMUTH1"] = (ObserverValue(target,"AZIMUTH1") + 180.0) % 360.0
+    observer["AZIMUTH2"] = (ObserverValue(target,"AZIMUTH2") + 180.0) % 360.0
+    observer["VERT1"] = -ObserverValue(target,"VERT2")
+    observer["VERT2"] = -ObserverValue(target,"VERT1")
+    observer["RADIUS1"] = ObserverValue(target,"RADIUS1")
+    observer["RADIUS2"] = ObserverValue(target,"RADIUS2")
+    return observer
+
+def ReverseObservers(targets):
+    ## reverse observers (see ReverseObserver) of a list of targets, to be
+    ## swept by any of the viewshed functions: the counts are then the number
+    ## of targets seen from each cell and mask bit i is set if target i is
+    return [ReverseObserver(target) for target in targets]
+
+def ObserverElevation(surface,observer):
+    ## surface elevation under the observer (SPOT overrides the surface)
+    if (observer.has_key("SPOT")):
+        return observer["SPOT"]
+    z = surface.Interpolate(observer["X"],observer["Y"])
+    if (z == None):
+        raise Exception, msgObserverOnNoData % (str(observer["X"]),str(observer["Y"]))
+    return z
+
+def RingOffsets(k,bounds=None):
+    ## row and column offsets of the square ring k cells from the center,
+    ## optionally clipped to bounds [dr_min,dr_max,dc_min,dc_max] (inclusive)
+    if (bounds == None):
+        bounds = [-k,k,-k,k]
+    c_lo,c_hi = max(-k,bounds[2]),min(k,bounds[3])
+    r_lo,r_hi = max(-k + 1,bounds[0]),min(k - 1,bounds[1])
+    drs = []
+    dcs = []
+    side = numpy.arange(c_lo,c_hi + 1)
+    inner = numpy.arange(r_lo,r_hi + 1)
+    if (bounds[0] <= -k):
+        drs.append(numpy.repeat(-k,len(side)))
+        dcs.append(side)
+    if (bounds[1] >= k):
+        drs.append(numpy.repeat(k,len(side)))
+        dcs.append(side)
+    if (bounds[2] <= -k):
+        drs.append(inner)
+        dcs.append(numpy.repeat(-k,len(inner)))
+    if (bounds[3] >= k):
+        drs.append(inner)
+        dcs.append(numpy.repeat(k,len(inner)))
+    if (len(drs) == 0):
+        return numpy.zeros(0,numpy.int32),numpy.zeros(0,numpy.int32)
+    return numpy.concatenate(drs),numpy.concatenate(dcs)
+
+def ObserverSector(observer):
+    ## returns (azimuth1,span) in degrees clockwise from north,
+    ## the sector runs clockwise from AZIMUTH1 to AZIMUTH2 (span 360 is a full circle)
+    azimuth1 = ObserverValue(observer,"AZIMUTH1")
+    span = (ObserverValue(observer,"AZIMUTH2") - azimuth1) % 360.0
+    if (span == 0.0): span = 360.0
+    return azimuth1 % 360.0,span
+
+def ObserverSlopeLimits(observer):
+    ## returns the (lower,upper) sight line slopes allowed by VERT2 and VERT1
+    upper = numpy.inf
+    lower = -numpy.inf
+    vert1 = ObserverValue(observer,"VERT1")
+    vert2 = ObserverValue(observer,"VERT2")
+    if (vert1 < 90.0): upper = math.tan(math.radians(vert1))
+    if (vert2 > -90.0): lower = math.tan(math.radians(vert2))
+    return lower,upper
+
+def GroundAzimuths(east,north):
+    ## azimuth (degrees clockwise from north) of ground offsets
+    return numpy.degrees(numpy.arctan2(east,north)) % 360.0
+
+def InSector(azimuths,azimuth1,span,margin):
+    ## True for azimuths inside the sector widened by margin degrees on each side
+    return ((azimuths - azimuth1 + margin) % 360.0) <= (span + (2.0 * margin))
+
+def SectorOffsetExtent(azimuth1,span,radius,cellwidth,cellheight):
+    ## returns [row_min,row_max,col_min,col_max] offsets bounding a sector
+    azimuths = [azimuth1,azimuth1 + span]
+    for cardinal in [0.0,90.0,180.0,270.0,360.0,450.0,540.0,630.0]:
+        if (azimuth1 < cardinal < azimuth1 + span): azimuths.append(cardinal)
+    drs = [0.0]
+    dcs = [0.0]
+    for azimuth in azimuths:
+        drs.append(-radius * math.cos(math.radians(azimuth)) / cellheight)
+        dcs.append(radius * math.sin(math.radians(azimuth)) / cellwidth)
+    margin = SectorMarginCells + 1
+    return [int(math.floor(min(drs) - margin)),int(math.ceil(max(drs) + margin)),
+            int(math.floor(min(dcs) - margin)),int(math.ceil(max(dcs) + margin))]
+
+def ObserverCellSize(surface,row,radius):
+    ## smallest ground (width,height) of the cells within radius of a row,
+    ## on a geographic surface the cells narrow towards the poles
+    cellwidth,cellheight = surface.GroundCellSize(row)
+    if (surface.Geographic == False or radius == numpy.inf):
+        return cellwidth,cellheight
+    k = int(math.ceil(radius / cellheight)) + 1
+    for edge in [max(0,row - k),min(surface.Rows - 1,row + k)]:
+        width,height = surface.GroundCellSize(edge)
+        cellwidth = min(cellwidth,width)
+        cellheight = min(cellheight,height)
+    return cellwidth,cellheight
+
+def ObserverWindow(surface,observer):
+    ## returns the observer cell and the window [row_min,row_max,col_min,col_max]
+    ## (max values are exclusive) that can be reached within RADIUS2 and the
+    ## azimuth sector of the observer
+    row,col = surface.MapToCell(observer["X"],observer["Y"])
+    if not (surface.ContainsCell(row,col)):
+        raise Exception, msgObserverOutsideSurface % (str(observer["X"]),str(observer["Y"]))
+    row_k = max(row,surface.Rows - 1 - row)
+    col_k = max(col,surface.Cols - 1 - col)
+    radius2 = ObserverValue(observer,"RADIUS2")
+    cellwidth,cellheight = ObserverCellSize(surface,row,radius2)
+    if (radius2 != numpy.inf):
+        row_k = min(row_k,int(math.ceil(radius2 / cellheight)))
+        if (cellwidth > 0.0):
+            col_k = min(col_k,int(math.ceil(radius2 / cellwidth)))
+    window = [max(0,row - row_k),min(surface.Rows,row + row_k + 1),
+              max(0,col - col_k),min(surface.Cols,col + col_k + 1)]
+
+    # narrow the window to the bounding box of the sector
+    azimuth1,span = ObserverSector(observer)
+    if (span < 360.0 and radius2 != numpy.inf and cellwidth > 0.0):
+        extent = SectorOffsetExtent(azimuth1,span,radius2,cellwidth,cellheight)
+        window = [max(window[0],row + extent[0]),min(window[1],row + extent[1] + 1),
+                  max(window[2],col + extent[2]),min(window[3],col + extent[3] + 1)]
+    kmax = max(row - window[0],window[1] - 1 - row,col - window[2],window[3] - 1 - col)
+    return row,col,kmax,window
+
+def RingCrossings(dr,dc,k):
+    ## where the sight lines to the ring k cells at offsets dr,dc cross ring
+    ## k-1: one cell back along the major axis, between two cells on the minor
+    ## axis. Returns the offsets of the two cells (lo_r,lo_c,hi_r,hi_c) and
+    ## the weight w of the hi cell.
+    t = (k - 1.0) / k
+    major_col = numpy.abs(dc) >= numpy.abs(dr)
+    pr = numpy.where(major_col,dr * t,dr - numpy.sign(dr))
+    pc = numpy.where(major_col,dc - numpy.sign(dc),dc * t)
+    lo_r = numpy.floor(pr).astype(numpy.int32)
+    lo_c = numpy.floor(pc).astype(numpy.int32)
+    hi_r = numpy.ceil(pr).astype(numpy.int32)
+    hi_c = numpy.ceil(pc).astype(numpy.int32)
+    w = numpy.where(major_col,pr - lo_r,pc - lo_c)
+    return lo_r,lo_c,hi_r,hi_c,w
+
+def CurvatureCorrection(dist,refraction_factor=DefaultRefraction):
+    ## apparent drop of the surface below the observer's horizontal plane
+    ## at dist (meters) from earth curvature less atmospheric refraction
+    return ((1.0 - refraction_factor) * dist * dist) / EarthDiameter
+
+def EarthBulge(d1,d2,refraction_factor=DefaultRefraction):
+    ## height of the earth (less atmospheric refraction) above the straight
+    ## line between two points, d1 and d2 (meters) from either of them
+    return ((1.0 - refraction_factor) * d1 * d2) / EarthDiameter
+
+def ObserverViewshed(surface,observer,bUseCurvature=False,refraction_factor=DefaultRefraction):
+    ## returns (window,visible) where visible is a boolean array covering
+    ## window [row_min,row_max,col_min,col_max] of the surface
+    row,col,kmax,window = ObserverWindow(surface,observer)
+    eye = ObserverElevation(surface,observer) + ObserverValue(observer,"OFFSETA")
+    offsetb = ObserverValue(observer,"OFFSETB")
+    radius1 = ObserverValue(observer,"RADIUS1")
+    radius2 = ObserverValue(observer,"RADIUS2")
+    azimuth1,span = ObserverSector(observer)
+    lower,upper = ObserverSlopeLimits(observer)
+
+    elev = surface.Elevation[window[0]:window[1],window[2]:window[3]]
+    height,width = elev.shape
+    orow = row - window[0]
+    ocol = col - window[2]
+    horizon = numpy.zeros(elev.shape,numpy.float64) + NoHorizon
+    visible = numpy.zeros(elev.shape,numpy.bool_)
+    if (radius1 <= 0.0): visible[orow,ocol] = True
+
+    bounds = [-orow,height - 1 - orow,-ocol,width - 1 - ocol]
+    for k in range(1,kmax + 1):
+        dr,dc = RingOffsets(k,bounds)
+        rr = dr + orow
+        cc = dc + ocol
+        east,north = surface.GroundOffsets(row,dr,dc)
+        dist = numpy.sqrt((east * east) + (north * north))
+        # only sweep cells inside RADIUS2 and the azimuth sector
+        inside = dist <= radius2
+        if (span < 360.0):
+            margin = math.degrees(math.atan2(SectorMarginCells,k))
+            inside = inside & InSector(GroundAzimuths(east,north),azimuth1,span,margin)
+        if not (inside.any()):
+            break
+        dr,dc,rr,cc,dist = dr[inside],dc[inside],rr[inside],cc[inside],dist[inside]
+        east,north = east[inside],north[inside]
+
+        lo_r,lo_c,hi_r,hi_c,w = RingCrossings(dr,dc,k)
+        ring_horizon = (horizon[lo_r + orow,lo_c + ocol] * (1.0 - w)) + (horizon[hi_r + orow,hi_c + ocol] * w)
+
+        z = elev[rr,cc]
+        valid = ~numpy.isnan(z)
+        if (bUseCurvature == True):
+            z = z - CurvatureCorrection(dist,refraction_factor)
+        slope = numpy.where(valid,(z - eye) / dist,NoHorizon)
+        target_slope = (z + offsetb - eye) / dist
+
+        ring_visible = valid & (target_slope >= ring_horizon) & (dist >= radius1)
+        ring_visible = ring_visible & (target_slope >= lower) & (target_slope <= upper)
+        if (span < 360.0):
+            # the margin cells are swept but are not part of the sector
+            ring_visible = ring_visible & InSector(GroundAzimuths(east,north),azimuth1,span,0.0)
+        visible[rr,cc] = ring_visible
+        ring_horizon = numpy.maximum(ring_horizon,slope)
+        horizon[rr,cc] = ring_horizon
+
+        # once every sight line is blocked above VERT1 nothing further out can be seen
+        if (upper != numpy.inf and (ring_horizon > upper).all()):
+            break
+
+    return window,visible
+
+def TileOrder(surface,observers,tile_size=256):
+    ## returns observer indexes sorted tile by tile so that observers sharing
+    ## a tile of the surface are swept one after the other
+    keys = []
+    for i in range(len(observers)):
+        row,col = surface.MapToCell(observers[i]["X"],observers[i]["Y"])
+        keys.append((row / tile_size,col / tile_size,i))
+    keys.sort()
+    return [key[2] for key in keys]
+
+def MaskBytes(observer_count):
+    return (observer_count + 7) / 8
+
+def AccumulateViewshed(counts,masks,index,window,visible):
+    ## adds one observer's visibility to the counts and sets its bit in masks
+    counts[window[0]:window[1],window[2]:window[3]] += visible
+    if (masks is not None):
+        bit = numpy.uint8(1 << (index % 8))
+        masks[window[0]:window[1],window[2]:window[3],index / 8] |= visible.astype(numpy.uint8) * bit
+
+def CumulativeViewshed(surface,observers,bOutputMask=False,bUseCurvature=False,refraction_factor=DefaultRefraction):
+    ## returns (counts,masks): counts is the number of observers that see each
+    ## cell, masks (None unless bOutputMask) is a uint8 array [rows,cols,bytes]
+    ## where bit (i % 8) of byte (i / 8) is set if observer i sees the cell.
+    ## All observers are swept in one pass over the loaded surface.
+    if (len(observers) == 0):
+        raise Exception, msgNoObservers
+    counts = numpy.zeros((surface.Rows,surface.Cols),numpy.int32)
+    masks = None
+    if (bOutputMask == True):
+        masks = numpy.zeros((surface.Rows,surface.Cols,MaskBytes(len(observers))),numpy.uint8)
+    for index in TileOrder(surface,observers):
+        window,visible = ObserverViewshed(surface,observers[index],bUseCurvature,refraction_factor)
+        AccumulateViewshed(counts,masks,index,window,visible)
+    return counts,masks
+
+def CanRunParallel():
+    return (multiprocessing != None)
+
+def PoolProcessCount(observer_count,processes=None):
+    ## number of worker processes to use, 1 means run serially
+    if (multiprocessing == None):
+        return 1
+    if (processes == None or processes <= 0):
+        if (observer_count < ParallelMinObservers):
+            return 1
+        processes = multiprocessing.cpu_count()
+    return max(1,min(processes,observer_count))
+
+def SetPoolExecutable():
+    ## scripts run inside ArcMap/ArcCatalog have the application as
+    ## sys.executable, the pool has to start python instead
+    if (os.name != "nt"):
+        return
+    exe_name = os.path.basename(sys.executable).lower()
+    if (exe_name == "python.exe" or exe_name == "pythonw.exe"):
+        return
+    python_exe = os.path.join(sys.exec_prefix,"pythonw.exe")
+    if (os.path.exists(python_exe)):
+        multiprocessing.set_executable(python_exe)
+
+def InitViewshedWorker(elevation_file,shape,georef,curvature):
+    ## pool initializer: map the shared elevation file read-only
+    global workerSurface, workerCurvature
+    elevation = numpy.memmap(elevation_file,numpy.float32,"r",shape=shape)
+    workerSurface = Surface.Surface(elevation,georef[0],georef[1],georef[2],georef[3])
+    workerSurface.Geographic = georef[4]
+    workerCurvature = curvature
+
+def ViewshedWorker(task):
+    ## task is a list of (index,observer), returns (index,window,packed visible)
+    results = []
+    for index,observer in task:
+        window,visible = ObserverViewshed(workerSurface,observer,workerCurvature[0],workerCurvature[1])
+        results.append((index,window,numpy.packbits(visible.ravel())))
+    return results
+
+def ParallelCumulativeViewshed(surface,observers,processes=None,bOutputMask=False,bUseCurvature=False,refraction_factor=DefaultRefraction):
+    ## CumulativeViewshed spread over a pool of processes. The surface is
+    ## written once to a memory-mapped file that every worker maps read-only,
+    ## workers return packed visibility windows that are merged here.
+    processes = PoolProcessCount(len(observers),processes)
+    if (processes <= 1):
+        return CumulativeViewshed(surface,observers,bOutputMask,bUseCurvature,refraction_factor)
+    if (len(observers) == 0):
+        raise Exception, msgNoObservers
+
+    handle,elevation_file = tempfile.mkstemp(".flt","maelev")
+    os.close(handle)
+    pool = None
+    try:
+        numpy.asarray(surface.Elevation,numpy.float32).tofile(elevation_file)
+        georef = [surface.XMin,surface.YMax,surface.CellWidth,surface.CellHeight,surface.Geographic]
+
+        # tasks are runs of observers in tile order, several per process
+        order = TileOrder(surface,observers)
+        chunk = max(1,len(order) / (processes * 8))
+        tasks = []
+        for start in range(0,len(order),chunk):
+            tasks.append([(index,observers[index]) for index in order[start:start + chunk]])
+
+        counts = numpy.zeros((surface.Rows,surface.Cols),numpy.int32)
+        masks = None
+        if (bOutputMask == True):
+            masks = numpy.zeros((surface.Rows,surface.Cols,MaskBytes(len(observers))),numpy.uint8)
+
+        SetPoolExecutable()
+        curvature = [bUseCurvature,refraction_factor]
+        pool = multiprocessing.Pool(processes,InitViewshedWorker,(elevation_file,surface.Elevation.shape,georef,curvature))
+        for results in pool.imap_unordered(ViewshedWorker,tasks):
+            for index,window,packed in results:
+                shape = (window[1] - window[0],window[3] - window[2])
+                visible = numpy.unpackbits(packed)[:shape[0] * shape[1]].reshape(shape).astype(numpy.bool_)
+                AccumulateViewshed(counts,masks,index,window,visible)
+        pool.close()
+        pool.join()
+        pool = None
+    finally:
+        if (pool != None):
+            pool.terminate()
+        if (os.path.exists(elevation_file)):
+            os.remove(elevation_file)
+
+    if (debug == True):
+        print "Parallel viewshed: %s observers on %s processes" % (str(len(observers)),str(processes))
+    return counts,masks
+
+def Viewshed(surface,observers):
+    ## returns the number of observers that can see each cell of the surface
+    return CumulativeViewshed(surface,observers,False)[0]
+
+def ObserversSeeing(masks,row,col):
+    ## returns the indexes of the observers that see a cell of an observer mask
+    bits = masks[row,col]
+    seen = []
+    for i in range(len(bits) * 8):
+        if (bits[i / 8] & (1 << (i % 8))): seen.append(i)
+    return seen
+
+def WriteObserverMask(mask_file,surface,observers,counts,masks):
+    ## saves counts and observer masks with the observer OIDs and the surface
+    ## georeferencing to a NumPy .npz file
+    if (masks.shape[2] != MaskBytes(len(observers))):
+        raise Exception, msgMaskShape % (str(masks.shape[2] * 8),str(len(observers)))
+    oids = numpy.array([observer.get("OID",-1) for observer in observers],numpy.int32)
+    georef = numpy.array([surface.XMin,surface.YMax,surface.CellWidth,surface.CellHeight],numpy.float64)
+    numpy.savez(mask_file,counts=counts,masks=masks,oids=oids,georef=georef)
+    return mask_file
+
+def ReferenceViewshed(surface,observer,samples_per_cell=4,bUseCurvature=False,refraction_factor=DefaultRefraction):
+    ## brute-force reference for ObserverViewshed: samples every sight line
+    ## with bilinear interpolation, within the same RADIUS, AZIMUTH and VERT
+    ## limits. Very slow, use on small grids only.
+    row,col,kmax,window = ObserverWindow(surface,observer)
+    eye = ObserverElevation(surface,observer) + ObserverValue(observer,"OFFSETA")
+    offsetb = ObserverValue(observer,"OFFSETB")
+    radius1 = ObserverValue(observer,"RADIUS1")
+    radius2 = ObserverValue(observer,"RADIUS2")
+    azimuth1,span = ObserverSector(observer)
+    lower,upper = ObserverSlopeLimits(observer)
+    ox,oy = surface.CellToMap(row,col)
+
+    visible = numpy.zeros((window[1] - window[0],window[3] - window[2]),numpy.bool_)
+    for r in range(window[0],window[1]):
+        for c in range(window[2],window[3]):
+            z = surface.Elevation[r,c]
+            if (numpy.isnan(z)): continue
+            tx,ty = surface.CellToMap(r,c)
+            east,north = surface.GroundOffsets(row,r - row,c - col)
+            dist = math.sqrt((east * east) + (north * north))
+            if (dist < radius1 or dist > radius2): continue
+            if (dist == 0.0):
+                visible[r - window[0],c - window[2]] = True
+                continue
+            if (span < 360.0 and not InSector(GroundAzimuths(east,north),azimuth1,span,0.0)): continue
+            if (bUseCurvature == True):
+                z = z - CurvatureCorrection(dist,refraction_factor)
+            target_slope = (z + offsetb - eye) / dist
+            if (target_slope < lower or target_slope > upper): continue
+            steps = int(max(abs(r - row),abs(c - col)) * samples_per_cell)
+            is_visible = True
+            for i in range(1,steps):
+                f = float(i) / steps
+                zs = surface.Interpolate(ox + (tx - ox) * f,oy + (ty - oy) * f)
+                if (zs != None and bUseCurvature == True):
+                    zs = zs - CurvatureCorrection(dist * f,refraction_factor)
+                if (zs != None and (zs - eye) / (dist * f) > target_slope):
+                    is_visible = False
+                    break
+            visible[r - window[0],c - window[2]] = is_visible
+    return window,visible
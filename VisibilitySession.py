@@ -0,0 +1,174 @@
+#!/usr/bin/env python
+# -*- coding: latin-1 -*-
+
+#
+# VisibilitySession.py
+#
+# Military Analyst incremental viewshed session
+#
+# Keeps a surface loaded together with the viewshed window of every
+# observer, so adding, removing or moving one observer only sweeps that
+# observer and updates the cumulative counts inside its window. The tiles
+# touched by each change are recorded so callers can rewrite just those
+# parts of an output.
+#
+
+import os, sys
+import numpy
+import Visibility
+
+debug = False
+
+# error messages
+msgNoSuchObserver = "Observer %s is not part of the visibility session."
+msgObserverExists = "Observer %s is already part of the visibility session."
+
+class VisibilitySession:
+    #surface,bUseCurvature,refraction_factor,tile_size
+    def __init__(self,surface,bUseCurvature=False,refraction_factor=Visibility.DefaultRefraction,tile_size=256):
+        self.Surface = surface
+        self.UseCurvature = bUseCurvature
+        self.RefractionFactor = refraction_factor
+        self.TileSize = tile_size
+        # number of observers that see each cell
+        self.Counts = numpy.zeros((surface.Rows,surface.Cols),numpy.int32)
+        # observer id -> observer dictionary
+        self.Observers = {}
+        # observer id -> (window,packed visible)
+        self.Windows = {}
+        # (tile row,tile column) of the tiles changed since ClearChangedTiles
+        self.ChangedTiles = {}
+        self.NextID = 0
+
+    def GetCounts (self):
+        return self.Counts
+
+    def GetObserver (self,observer_id):
+        if not (self.Observers.has_key(observer_id)):
+            raise Exception, msgNoSuchObserver % (str(observer_id))
+        return self.Observers[observer_id]
+
+    def GetObserverIDs (self):
+        ids = self.Observers.keys()
+        ids.sort()
+        return ids
+
+    def GetObserverViewshed (self,observer_id):
+        ## returns (window,visible) of one observer
+        self.GetObserver(observer_id)
+        window,packed = self.Windows[observer_id]
+        shape = (window[1] - window[0],window[3] - window[2])
+        visible = numpy.unpackbits(packed)[:shape[0] * shape[1]].reshape(shape).astype(numpy.bool_)
+        return window,visible
+
+    def AddObserver (self,observer,observer_id=None):
+        ## sweeps a new observer and adds it to the counts, returns its id
+        ## (the OID of the observer when it has one)
+        if (observer_id == None):
+            observer_id = observer.get("OID",None)
+        if (observer_id == None):
+            while (self.Observers.has_key(self.NextID)):
+                self.NextID = self.NextID + 1
+            observer_id = self.NextID
+        if (self.Observers.has_key(observer_id)):
+            raise Exception, msgObserverExists % (str(observer_id))
+        window,visible = Visibility.ObserverViewshed(self.Surface,observer,self.UseCurvature,self.RefractionFactor)
+        self.PlaceObserver(observer_id,observer,window,visible)
+        return observer_id
+
+    def PlaceObserver (self,observer_id,observer,window,visible):
+        ## adds a swept observer to the counts
+        self.Counts[window[0]:window[1],window[2]:window[3]] += visible
+        self.Observers[observer_id] = observer
+        self.Windows[observer_id] = (window,numpy.packbits(visible.ravel()))
+        self.MarkChanged(window)
+
+    def AddObservers (self,observers):
+        ## adds a list of observers in tile order, returns their ids in list order
+        ids = [None] * len(observers)
+        for index in Visibility.TileOrder(self.Surface,observers,self.TileSize):
+            ids[index] = self.AddObserver(observers[index])
+        return ids
+
+    def RemoveObserver (self,observer_id):
+        ## takes an observer out of the counts, returns the observer
+        window,visible = self.GetObserverViewshed(observer_id)
+        self.Counts[window[0]:window[1],window[2]:window[3]] -= visible
+        observer = self.Observers[observer_id]
+        del self.Observers[observer_id]
+        del self.Windows[observer_id]
+        self.MarkChanged(window)
+        return observer
+
+    def UpdateObserver (self,observer_id,observer):
+        ## replaces an observer (new position or visibility fields), only the
+        ## old and new windows of that observer are touched. The new observer
+        ## is swept first, so the session is unchanged if that fails (off the
+        ## surface or on NoData).
+        self.GetObserver(observer_id)
+        window,visible = Visibility.ObserverViewshed(self.Surface,observer,self.UseCurvature,self.RefractionFactor)
+        self.RemoveObserver(observer_id)
+        self.PlaceObserver(observer_id,observer,window,visible)
+        return observer_id
+
+    def MoveObserver (self,observer_id,x,y):
+        ## moves an observer to x,y keeping its other fields, the elevation
+        ## (SPOT and Z) is interpolated again at the new position
+        observer = self.GetObserver(observer_id).copy()
+        if (observer["X"] != x or observer["Y"] != y):
+            for field in ["SPOT","Z"]:
+                if (observer.has_key(field)): del observer[field]
+        observer["X"] = x
+        observer["Y"] = y
+        return self.UpdateObserver(observer_id,observer)
+
+    def ObserversSeeing (self,row,col):
+        ## returns the ids of the observers that see a cell
+        seen = []
+        for observer_id in self.GetObserverIDs():
+            window,packed = self.Windows[observer_id]
+            if (window[0] <= row < window[1] and window[2] <= col < window[3]):
+                bit = ((row - window[0]) * (window[3] - window[2])) + (col - window[2])
+                if (packed[bit / 8] & (128 >> (bit % 8))):
+                    seen.append(observer_id)
+        return seen
+
+    def MarkChanged (self,window):
+        for tile_row in range(window[0] / self.TileSize,((window[1] - 1) / self.TileSize) + 1):
+            for tile_col in range(window[2] / self.TileSize,((window[3] - 1) / self.TileSize) + 1):
+                self.ChangedTiles[(tile_row,tile_col)] = True
+
+    def GetChangedTiles (self):
+        ## returns the windows [row_min,row_max,col_min,col_max] of the tiles
+        ## changed since the last ClearChangedTiles
+        tiles = self.ChangedTiles.keys()
+        tiles.sort()
+        windows = []
+        for tile_row,tile_col in tiles:
+            windows.append([tile_row * self.TileSize,min(self.Surface.Rows,(tile_row + 1) * self.TileSize),
+                            tile_col * self.TileSize,min(self.Surface.Cols,(tile_col + 1) * self.TileSize)])
+        return windows
+
+    def ClearChangedTiles (self):
+        self.ChangedTiles = {}
+
+    def GetMasks (self):
+        ## returns (ids,masks) in the layout of Visibility.CumulativeViewshed:
+        ## bit (i % 8) of byte (i / 8) is set if observer ids[i] sees the cell
+        ids = self.GetObserverIDs()
+        masks = numpy.zeros((self.Surface.Rows,self.Surface.Cols,Visibility.MaskBytes(len(ids))),numpy.uint8)
+        counts = numpy.zeros((self.Surface.Rows,self.Surface.Cols),numpy.int32)
+        for index in range(len(ids)):
+            window,visible = self.GetObserverViewshed(ids[index])
+            Visibility.AccumulateViewshed(counts,masks,index,window,visible)
+        return ids,masks
+
+    def WriteObserverMask (self,mask_file):
+        ## saves the session counts and observer masks, see Visibility.WriteObserverMask
+        ids,masks = self.GetMasks()
+        observers = []
+        for observer_id in ids:
+            observer = self.Observers[observer_id].copy()
+            observer["OID"] = observer_id
+            observers.append(observer)
+        return Visibility.WriteObserverMask(mask_file,self.Surface,observers,self.Counts,masks)
@@ -0,0 +1,59 @@
+#!/usr/bin/env python
+# -*- coding: latin-1 -*-
+
+#
+# test_TiledVisibility.py
+#
+# The out-of-core cumulative viewshed (TiledVisibility) against the
+# in-memory one (Visibility.Viewshed), with the surface float grid and the
+# counts grid on disk side by side as RadialLineOfSight keeps them.
+#
+# Usage: python test_TiledVisibility.py
+#
+
+import os, shutil, tempfile, time, unittest
+import numpy
+import Surface, Visibility, TiledVisibility
+from test_Visibility import SyntheticSurface, CenterObserver
+
+# small tiles so the synthetic terrain is swept over several of them
+TestTileSize = 16
+
+
+class TiledCumulativeViewshedTest(unittest.TestCase):
+
+    def setUp (self):
+        self.Folder = tempfile.mkdtemp()
+        # the name MAScriptUtils.GenerateTempFileName gives a FloatFile
+        self.SurfaceFloat = os.path.join(self.Folder,"tmp" + time.strftime("%d%H%M%S") + ".flt")
+
+    def tearDown (self):
+        shutil.rmtree(self.Folder)
+
+    def testCountsGridName (self):
+        counts_float = TiledVisibility.CountsGridName(self.SurfaceFloat)
+        self.assertNotEqual(os.path.normcase(counts_float),os.path.normcase(self.SurfaceFloat))
+        self.assertEqual(os.path.splitext(counts_float)[1],".flt")
+
+    def testSurfaceAndCountsSideBySide (self):
+        surface = SyntheticSurface(5)
+        Surface.WriteFloatGrid(surface,surface.Elevation,self.SurfaceFloat)
+        surface_bytes = open(self.SurfaceFloat,"rb").read()
+        observers = [CenterObserver(surface,{}),CenterObserver(surface,{"RADIUS2":600.0})]
+        observers[1]["X"] = observers[1]["X"] - 400.0
+
+        tiled = TiledVisibility.TiledSurface(self.SurfaceFloat,TestTileSize)
+        counts_float = TiledVisibility.CountsGridName(self.SurfaceFloat)
+        TiledVisibility.TiledCumulativeViewshed(tiled,observers,counts_float)
+        self.failUnless(os.path.exists(self.SurfaceFloat) and os.path.exists(counts_float))
+
+        # writing the counts grid leaves the surface grid untouched
+        self.assertEqual(open(self.SurfaceFloat,"rb").read(),surface_bytes)
+        counts = TiledVisibility.OpenCountsGrid(counts_float)
+        expected = Visibility.Viewshed(surface,observers)
+        self.failUnless((numpy.asarray(counts) == expected).all())
+        del counts,tiled
+
+
+if __name__ == "__main__":
+    unittest.main()
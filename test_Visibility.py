@@ -0,0 +1,124 @@
+#!/usr/bin/env python
+# -*- coding: latin-1 -*-
+
+#
+# test_Visibility.py
+#
+# Parity of the native viewshed sweep (Visibility.ObserverViewshed) with the
+# brute-force reference (Visibility.ReferenceViewshed) on synthetic terrain.
+#
+# The sweep interpolates each horizon from the previous ring and the
+# reference samples every sight line, so they may only differ on cells that
+# graze a ridge: within RidgeTolerance meters of the sampled horizon.
+# AgreementThreshold is the share of cells they must agree on.
+#
+# Usage: python test_Visibility.py
+#
+
+import math, unittest
+import numpy
+import Surface, Visibility
+
+AgreementThreshold = 0.98
+RidgeTolerance = 0.5
+
+# synthetic terrain: rows and columns, cell size in meters
+TerrainCells = 61
+TerrainCellSize = 30.0
+
+def SyntheticSurface(seed,cells=TerrainCells,cellsize=TerrainCellSize,bGeographic=False):
+    ## rolling hills: a sum of gaussian bumps at seeded random places
+    random = numpy.random.RandomState(seed)
+    y,x = numpy.mgrid[0:cells,0:cells].astype(numpy.float64)
+    elevation = numpy.zeros((cells,cells),numpy.float64)
+    for i in range(12):
+        cx,cy = random.uniform(0,cells),random.uniform(0,cells)
+        height,width = random.uniform(5.0,40.0),random.uniform(3.0,12.0)
+        elevation += height * numpy.exp(-((x - cx) ** 2 + (y - cy) ** 2) / (2.0 * width * width))
+    surface = Surface.Surface(elevation,0.0,cells * cellsize,cellsize,cellsize)
+    surface.Geographic = bGeographic
+    return surface
+
+def CenterObserver(surface,fields):
+    ## observer 5 meters above the center cell with extra observer fields
+    x,y = surface.CellToMap(surface.Rows / 2,surface.Cols / 2)
+    observer = {"X":x,"Y":y,"OFFSETA":5.0}
+    observer.update(fields)
+    return observer
+
+def HorizonMargin(surface,observer,r,c,bUseCurvature=False,samples_per_cell=4):
+    ## height in meters of cell r,c above (+) or below (-) the horizon
+    ## sampled along its sight line, as ReferenceViewshed samples it
+    row,col = surface.MapToCell(observer["X"],observer["Y"])
+    eye = Visibility.ObserverElevation(surface,observer) + Visibility.ObserverValue(observer,"OFFSETA")
+    ox,oy = surface.CellToMap(row,col)
+    tx,ty = surface.CellToMap(r,c)
+    east,north = surface.GroundOffsets(row,r - row,c - col)
+    dist = math.sqrt((east * east) + (north * north))
+    z = surface.Elevation[r,c] + Visibility.ObserverValue(observer,"OFFSETB")
+    if (bUseCurvature == True):
+        z = z - Visibility.CurvatureCorrection(dist)
+    horizon = Visibility.NoHorizon
+    steps = int(max(abs(r - row),abs(c - col)) * samples_per_cell)
+    for i in range(1,steps):
+        f = float(i) / steps
+        zs = surface.Interpolate(ox + (tx - ox) * f,oy + (ty - oy) * f)
+        if (zs == None): continue
+        if (bUseCurvature == True):
+            zs = zs - Visibility.CurvatureCorrection(dist * f)
+        horizon = max(horizon,(zs - eye) / (dist * f))
+    return (z - eye) - (horizon * dist)
+
+
+class ViewshedParityTest(unittest.TestCase):
+
+    def CheckAgreement (self,fields,bUseCurvature=False,seeds=[1,2,3]):
+        for seed in seeds:
+            surface = SyntheticSurface(seed)
+            observer = CenterObserver(surface,fields)
+            window,visible = Visibility.ObserverViewshed(surface,observer,bUseCurvature)
+            ref_window,ref_visible = Visibility.ReferenceViewshed(surface,observer,4,bUseCurvature)
+            self.assertEqual(window,ref_window)
+            agreement = (visible == ref_visible).mean()
+            self.failUnless(agreement >= AgreementThreshold,
+                            "seed %s, fields %s: %.4f of the cells agree" % (str(seed),str(fields),agreement))
+            rows,cols = numpy.nonzero(visible != ref_visible)
+            for r,c in zip(rows + window[0],cols + window[2]):
+                margin = HorizonMargin(surface,observer,r,c,bUseCurvature)
+                self.failUnless(abs(margin) <= RidgeTolerance,
+                                "seed %s, fields %s: cell %d,%d differs %.2f m off the horizon" % (str(seed),str(fields),r,c,margin))
+
+    def testFullCircle (self):
+        self.CheckAgreement({})
+
+    def testRadius (self):
+        self.CheckAgreement({"RADIUS1":150.0,"RADIUS2":700.0})
+
+    def testSector (self):
+        self.CheckAgreement({"AZIMUTH1":30.0,"AZIMUTH2":150.0})
+
+    def testSectorAcrossNorth (self):
+        self.CheckAgreement({"AZIMUTH1":300.0,"AZIMUTH2":60.0})
+
+    def testVerticalLimits (self):
+        self.CheckAgreement({"VERT1":2.0,"VERT2":-4.0})
+
+    def testSectorAndVerticalLimits (self):
+        self.CheckAgreement({"AZIMUTH1":200.0,"AZIMUTH2":320.0,"VERT1":1.0,"VERT2":-3.0,"RADIUS2":700.0})
+
+    def testCurvature (self):
+        self.CheckAgreement({},True)
+
+    def testLimitsOnlyRemoveCells (self):
+        ## a sector or vertical window never shows a cell the full circle hides
+        surface = SyntheticSurface(4)
+        window,full = Visibility.ObserverViewshed(surface,CenterObserver(surface,{}))
+        for fields in [{"AZIMUTH1":45.0,"AZIMUTH2":135.0},{"VERT1":1.0,"VERT2":-2.0}]:
+            clipped_window,clipped = Visibility.ObserverViewshed(surface,CenterObserver(surface,fields))
+            self.assertEqual(window,clipped_window)
+            self.failIf((clipped & ~full).any())
+            self.failUnless(clipped.sum() < full.sum())
+
+
+if __name__ == "__main__":
+    unittest.main()